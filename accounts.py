@@ -0,0 +1,152 @@
+# accounts.py
+
+import threading
+import asyncio
+from botocore.credentials import RefreshableCredentials
+
+# Role of the member accounts created by AWS Organizations, assumed by default in the accounts of an OU
+DEFAULT_ROLE_NAME = 'OrganizationAccountAccessRole'
+
+def account_of_role(role_arn):
+    """
+    Get the account of a role.
+
+    Args:
+        role_arn (str): The ARN of the role (ex: 'arn:aws:iam::123456789012:role/Inventory').
+
+    Returns:
+        str: The account ID.
+
+    Raises:
+        ValueError: If the ARN is not the ARN of an IAM role.
+    """
+
+    parts = role_arn.split(':', 5)
+    if len(parts) != 6 or parts[0] != 'arn' or parts[2] != 'iam' or not parts[5].startswith('role/') or not parts[4].isdigit():
+        raise ValueError(f"Not the ARN of an IAM role: {role_arn}")
+    return parts[4]
+
+def role_arn_of_account(account_id, role_name=DEFAULT_ROLE_NAME, partition='aws'):
+    """
+    Get the ARN of a role of an account.
+
+    Args:
+        account_id (str): The account ID.
+        role_name (str): The name of the role (or its path and name).
+        partition (str): The partition of the account.
+
+    Returns:
+        str: The ARN of the role.
+    """
+
+    return f"arn:{partition}:iam::{account_id}:role/{role_name}"
+
+def list_organization_accounts(organizations_client, parent_id):
+    """
+    List the active accounts of an organizational unit (or of the root), including the ones of its child OUs.
+
+    Args:
+        organizations_client (botocore.client.BaseClient): A client of AWS Organizations (in the management account or a delegated administrator).
+        parent_id (str): The ID of the OU (ex: 'ou-ab12-cd34ef56') or of the root (ex: 'r-ab12').
+
+    Returns:
+        list: The accounts (Id, Name, Email...), in the order of the OU tree.
+    """
+
+    accounts = []
+    parents = [parent_id]
+    while parents:
+        parent = parents.pop(0)
+        for page in organizations_client.get_paginator('list_accounts_for_parent').paginate(ParentId=parent):
+            accounts += [account for account in page['Accounts'] if account.get('Status', 'ACTIVE') == 'ACTIVE']
+        for page in organizations_client.get_paginator('list_organizational_units_for_parent').paginate(ParentId=parent):
+            parents += [unit['Id'] for unit in page['OrganizationalUnits']]
+    return accounts
+
+# ------------------------------------------------------------------------------
+
+class AssumedRole:
+
+    """
+    Credentials of a role assumed in another account, with the STS client of the caller.
+
+    The credentials are cached: they are only asked again to STS shortly before they expire, by botocore (boto3 clients)
+    or by aiobotocore (asyncio engine). The clients of a run keep the same credentials object, so a long inventory
+    never fails on expired credentials.
+    """
+
+    def __init__(self, sts_client, role_arn, session_name='aws-inventory', duration=3600, external_id=None):
+        """
+        Initialize an assumed role. The role is assumed with the first use of its credentials.
+
+        Args:
+            sts_client (botocore.client.BaseClient): The STS client of the caller (the source credentials).
+            role_arn (str): The ARN of the role to assume.
+            session_name (str): The name of the role session, in the CloudTrail logs of the account.
+            duration (int): The duration of the credentials, in seconds (at most the maximum session duration of the role).
+            external_id (str): The external ID required by the trust policy of the role, if any.
+        """
+
+        self.sts_client = sts_client
+        self.role_arn = role_arn
+        self.account_id = account_of_role(role_arn)
+        self.session_name = session_name
+        self.duration = duration
+        self.external_id = external_id
+        self.refreshes = 0
+        self._credentials = None
+        self._aio_credentials = None
+        self._lock = threading.Lock()
+        self._create_lock = threading.Lock() # held while the role is assumed for the first time
+
+    def fetch(self):
+        """
+        Assume the role.
+
+        Returns:
+            dict: The credentials, in the metadata format of the botocore refreshable credentials.
+        """
+
+        params = {'RoleArn': self.role_arn, 'RoleSessionName': self.session_name, 'DurationSeconds': self.duration}
+        if self.external_id:
+            params['ExternalId'] = self.external_id
+        credentials = self.sts_client.assume_role(**params)['Credentials']
+        with self._lock:
+            self.refreshes += 1
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat(),
+        }
+
+    def credentials(self):
+        """
+        Get the credentials of the role, for the boto3 sessions.
+
+        Returns:
+            RefreshableCredentials: The credentials, refreshed before they expire.
+        """
+
+        with self._create_lock:
+            if self._credentials is None:
+                self._credentials = RefreshableCredentials.create_from_metadata(self.fetch(), self.fetch, 'assume-role')
+            return self._credentials
+
+    def aio_credentials(self):
+        """
+        Get the credentials of the role, for the aiobotocore sessions (the role is assumed again in a thread).
+
+        Returns:
+            AioRefreshableCredentials: The credentials, refreshed before they expire.
+        """
+
+        from aiobotocore.credentials import AioRefreshableCredentials
+
+        async def refresh():
+            return await asyncio.to_thread(self.fetch)
+
+        with self._create_lock:
+            if self._aio_credentials is None:
+                self._aio_credentials = AioRefreshableCredentials.create_from_metadata(self.fetch(), refresh, 'assume-role')
+            return self._aio_credentials
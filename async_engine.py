@@ -0,0 +1,205 @@
+# async_engine.py
+
+import asyncio
+import contextlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from plan import as_node_spec
+from client_pool import SharedCredentialProvider
+
+# aiobotocore is optional: without it, the calls of the boto3 clients are offloaded to a thread pool
+try:
+    from aiobotocore.session import get_session as get_aio_session
+    from aiobotocore.config import AioConfig
+    from aiobotocore.credentials import AioCredentialResolver
+except ImportError:
+    get_aio_session = None
+    AioConfig = None
+    AioCredentialResolver = None
+
+class AioSharedCredentialProvider(SharedCredentialProvider):
+
+    """
+    Same as SharedCredentialProvider, for the aiobotocore sessions (their credential providers are coroutines).
+    """
+
+    async def load(self):
+        return self.credentials
+
+class AsyncEngine:
+
+    """
+    Runs the inventory tasks on an asyncio event loop, as an alternative to the ThreadPoolExecutor.
+
+    With aiobotocore installed, the API calls are non-blocking and thousands of them can be in flight. Otherwise,
+    the calls of the pooled boto3 clients are offloaded to a thread pool, and the event loop only schedules them.
+    In both cases, the number of API calls in flight is bounded by 'max_in_flight', and the detail calls have
+    their own bound so they can't crowd out the inventory calls.
+    """
+
+    def __init__(self, client_pool, max_in_flight=512, max_detail_in_flight=None, use_aiobotocore=True, assumed_role=None):
+        """
+        Initialize a new asyncio engine.
+
+        Args:
+            client_pool (ClientPool): The pool of boto3 clients, used when aiobotocore is not available. Its hooks and retries are applied to the aiobotocore clients.
+            max_in_flight (int): The maximum number of API calls in flight.
+            max_detail_in_flight (int): The maximum number of detail calls in flight. Defaults to max_in_flight.
+            use_aiobotocore (bool): Use aiobotocore if it is installed.
+            assumed_role (AssumedRole): The role assumed in the account, if any: the aiobotocore clients use its refreshable credentials.
+        """
+
+        self.client_pool = client_pool
+        self.max_in_flight = max_in_flight
+        self.max_detail_in_flight = max_detail_in_flight or max_in_flight
+        self.use_aiobotocore = use_aiobotocore and get_aio_session is not None
+        self.assumed_role = assumed_role
+        self._clients = {}
+        self._executor = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._detail_semaphore = asyncio.Semaphore(self.max_detail_in_flight)
+        self._client_lock = asyncio.Lock()
+        self._exit_stack = contextlib.AsyncExitStack()
+        if self.use_aiobotocore:
+            self._session = get_aio_session()
+            if self.assumed_role is not None:
+                provider = AioSharedCredentialProvider(self.assumed_role.aio_credentials())
+                self._session.register_component('credential_provider', AioCredentialResolver([provider]))
+            self._config = AioConfig(max_pool_connections=self.max_in_flight, retries=self.client_pool.config.retries)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='async-io')
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self._exit_stack.aclose()
+        self._clients.clear()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def run(self, tasks):
+        """
+        Run inventory tasks until they are all done.
+
+        Args:
+            tasks (list): The tasks, each one having a 'run_async(engine)' coroutine method.
+        """
+
+        asyncio.run(self._run(tasks))
+
+    async def _run(self, tasks):
+        async with self:
+            await asyncio.gather(*(task.run_async(self) for task in tasks))
+
+    async def get_client(self, service, region_name=None):
+        """
+        Get the client of a service in a region, creating it only on the first request.
+
+        Args:
+            service (str): The boto3 service name (ex: 'ec2').
+            region_name (str): The AWS region name, or None for the default region.
+
+        Returns:
+            object: An aiobotocore client, or a pooled boto3 client.
+        """
+
+        if not self.use_aiobotocore:
+            return self.client_pool.get_client(service, region_name)
+
+        key = (service, region_name)
+        client = self._clients.get(key)
+        if client is None:
+            async with self._client_lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = await self._exit_stack.enter_async_context(self._session.create_client(service, region_name=region_name, config=self._config))
+                    for client_hook in self.client_pool.client_hooks:
+                        client_hook(client)
+                    self._clients[key] = client
+        return client
+
+    async def call(self, client, function, detail=False, **params):
+        """
+        Call an API function.
+
+        Args:
+            client (object): The client returned by get_client.
+            function (str): The function to call (ex: 'describe_instances').
+            detail (bool): True for a detail call.
+            **params: The parameters of the function.
+
+        Returns:
+            dict: The response.
+        """
+
+        if detail:
+            async with self._detail_semaphore:
+                return await self._call(client, function, params)
+        return await self._call(client, function, params)
+
+    async def _call(self, client, function, params):
+        async with self._semaphore:
+            if self.use_aiobotocore:
+                return await getattr(client, function)(**params)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(getattr(client, function), **params))
+
+    async def iter_pages(self, client, function, node):
+        """
+        Iterate over the pages returned by an inventory function. Same behaviour as pagination.iter_pages.
+
+        Args:
+            client (object): The client returned by get_client.
+            function (str): The inventory function to call (ex: 'describe_instances').
+            node (NodeSpec or dict): The inventory node, with the optional 'page_size' and 'pagination' keys.
+
+        Yields:
+            dict: The response of each call, as soon as it is received.
+        """
+
+        node = as_node_spec(node)
+        page_size = node.page_size
+
+        if client.can_paginate(function):
+
+            pagination_config = {'PageSize': page_size} if page_size else {}
+            page_iterator = client.get_paginator(function).paginate(PaginationConfig=pagination_config)
+
+            if self.use_aiobotocore:
+                page_iterator = page_iterator.__aiter__()
+                while True:
+                    async with self._semaphore:
+                        try:
+                            page = await page_iterator.__anext__()
+                        except StopAsyncIteration:
+                            return
+                    yield page
+            else:
+                page_iterator = iter(page_iterator)
+                while True:
+                    async with self._semaphore:
+                        page = await asyncio.get_running_loop().run_in_executor(self._executor, next, page_iterator, None)
+                    if page is None:
+                        return
+                    yield page
+
+        elif node.output_token:
+
+            params = {}
+            if page_size and node.limit_key:
+                params[node.limit_key] = page_size
+
+            seen_tokens = set()
+            while True:
+                page = await self.call(client, function, **params)
+                token = page.get(node.output_token)
+                yield page
+                if not token or token in seen_tokens:
+                    break
+                seen_tokens.add(token)
+                params[node.input_token] = token
+
+        else:
+
+            yield await self.call(client, function)
@@ -0,0 +1,102 @@
+# availability.py
+
+from botocore.exceptions import UnknownRegionError
+
+# Opt-in status of the regions that are not enabled in the account (ec2:DescribeRegions)
+DISABLED_OPT_IN_STATUS = 'not-opted-in'
+
+class ServiceAvailability:
+
+    """
+    Offline availability of the services in the regions, from the endpoint data bundled with botocore.
+
+    It is used to drop the (service, region) pairs that can't exist before any task is scheduled, instead of
+    waiting for an EndpointConnectionError. When the endpoint data doesn't list any region for a service
+    (global endpoint, or data missing), the service is considered as available everywhere.
+    """
+
+    def __init__(self, session):
+        """
+        Initialize the availability data.
+
+        Args:
+            session (boto3.Session): The session giving access to the botocore data.
+        """
+
+        self.session = session
+        self.services = set(session.get_available_services())
+        self.partitions = session.get_available_partitions()
+        self._regions = {}
+        self._partitions = {}
+
+    def service_regions(self, service):
+        """
+        Get the regions of a service in every partition.
+
+        Args:
+            service (str): The boto3 service name (ex: 'braket').
+
+        Returns:
+            dict: The set of regions of each partition, or None if the endpoint data lists no region at all.
+        """
+
+        if service not in self._regions:
+            regions = {partition: set(self.session.get_available_regions(service, partition)) for partition in self.partitions}
+            self._regions[service] = regions if any(regions.values()) else None
+        return self._regions[service]
+
+    def get_partition(self, region_name):
+        """
+        Get the partition of a region (ex: 'aws', 'aws-cn').
+
+        Args:
+            region_name (str): The AWS region name.
+
+        Returns:
+            str: The partition name, or None if the region is unknown to botocore.
+        """
+
+        if region_name not in self._partitions:
+            try:
+                self._partitions[region_name] = self.session.get_partition_for_region(region_name)
+            except UnknownRegionError:
+                self._partitions[region_name] = None
+        return self._partitions[region_name]
+
+    def is_available(self, service, region_name=None):
+        """
+        Check if a service may exist in a region.
+
+        Args:
+            service (str): The boto3 service name (ex: 'braket').
+            region_name (str): The AWS region name, or None for a global resource.
+
+        Returns:
+            bool: False if the service is unknown to botocore, or if it is not available in the region.
+        """
+
+        if service not in self.services:
+            return False
+        if region_name is None:
+            return True
+
+        regions = self.service_regions(service)
+        partition = self.get_partition(region_name)
+        if regions is None or partition is None:
+            return True
+        return region_name in regions[partition]
+
+# ------------------------------------------------------------------------------
+
+def enabled_regions(regions):
+    """
+    Keep the regions enabled in the account.
+
+    Args:
+        regions (list): The regions returned by ec2:DescribeRegions.
+
+    Returns:
+        list: The regions which are not waiting for an opt-in.
+    """
+
+    return [region for region in regions if region.get('OptInStatus') != DISABLED_OPT_IN_STATUS]
@@ -0,0 +1,128 @@
+# checkpoint.py
+
+import os
+import json
+from utils import AsyncLineWriter
+
+class Journal:
+
+    """
+    Append-only journal of the completed inventory tasks of a run, used to resume an interrupted run. It is deleted
+    once the output of the run is written.
+
+    Each completed task adds one JSON line with its stored items. The lines are written by a background thread,
+    so checkpointing doesn't slow the tasks down. When the journal is loaded, the last line is ignored if it was
+    only partially written (crash, Ctrl-C).
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the journal, loading the tasks already completed if the file exists.
+
+        Args:
+            path (str): The path of the journal file (JSON lines).
+        """
+
+        self.path = path
+        self.completed = self.load(path)
+        self._writer = None
+
+    @staticmethod
+    def load(path):
+        """
+        Load the completed tasks of a journal.
+
+        Args:
+            path (str): The path of the journal file.
+
+        Returns:
+            dict: The record of each completed task, by journal key.
+        """
+
+        completed = {}
+        if not os.path.exists(path):
+            return completed
+
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and 'task' in record and 'category' in record:
+                    completed[f"{record['category']}/{record['task']}"] = record
+        return completed
+
+    @staticmethod
+    def key(task):
+        """
+        Get the journal key of a task. The category is part of it, as the same node may be listed in several categories.
+
+        Args:
+            task (InventoryTask): The task.
+
+        Returns:
+            str: The key of the task in the journal.
+        """
+
+        return f"{task.category}/{task.key}"
+
+    def get(self, task):
+        """
+        Get the record of a task, if it was completed.
+
+        Args:
+            task (InventoryTask): The task.
+
+        Returns:
+            dict: The record of the task, or None.
+        """
+
+        return self.completed.get(self.key(task))
+
+    def open(self):
+        """Start appending to the journal (after the last complete line, if the previous run was interrupted while writing)."""
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb+') as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    file.write(b'\n')
+        self._writer = AsyncLineWriter(self.path)
+        return self
+
+    def record(self, task, object_type, items):
+        """
+        Record a completed task.
+
+        Args:
+            task (InventoryTask): The completed task.
+            object_type (str): The key of the items in the results (ex: 'Buckets').
+            items (list or dict): The items stored by the task, or None if it found nothing.
+        """
+
+        self._writer.write({
+            'task': task.key,
+            'category': task.category,
+            'resource': task.resource,
+            'node_name': task.node_name,
+            'region': task.region_name,
+            'object_type': object_type,
+            'items': items,
+        })
+
+    def close(self):
+        """Write the pending records and close the journal."""
+
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def remove(self):
+        """Delete the journal, once the output of the run is written (the run doesn't need to be resumed anymore)."""
+
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.completed = {}
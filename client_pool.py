@@ -0,0 +1,164 @@
+# client_pool.py
+
+import threading
+import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, CredentialResolver
+
+_shared_loader = None
+_shared_loader_lock = threading.Lock()
+
+def get_shared_loader():
+    """
+    Get the data loader shared by all the pools of the process, so the service models are read once per process
+    (ex: once for all the accounts inventoried by a process).
+
+    Returns:
+        botocore.loaders.Loader: The shared data loader.
+    """
+
+    global _shared_loader
+    with _shared_loader_lock:
+        if _shared_loader is None:
+            _shared_loader = botocore.session.get_session().get_component('data_loader')
+        return _shared_loader
+
+class SharedCredentialProvider(CredentialProvider):
+
+    """
+    Credential provider giving the same credentials object to every session (ex: the refreshable credentials of an
+    assumed role), so the sessions share its refreshes.
+    """
+
+    METHOD = 'shared-credentials'
+    CANONICAL_NAME = 'custom-shared-credentials'
+
+    def __init__(self, credentials):
+        """
+        Initialize the provider.
+
+        Args:
+            credentials (botocore.credentials.Credentials): The credentials given to the sessions.
+        """
+
+        super().__init__()
+        self.credentials = credentials
+
+    def load(self):
+        return self.credentials
+
+class ClientPool:
+
+    """
+    Thread-safe pool of boto3 clients, keyed by (service, region).
+
+    Each worker thread gets its own botocore session (sessions are not thread-safe), but all the sessions
+    share the same data loader, so the service models are only read from disk once. Clients are thread-safe:
+    a client is built once for a (service, region) pair and then reused by every task that needs it.
+
+    The sessions use the default credentials, or the given credentials (ex: the ones of an assumed role).
+    """
+
+    def __init__(self, max_pool_connections=10, session_factory=None, client_hooks=None, max_attempts=None, credentials=None):
+        """
+        Initialize a new client pool.
+
+        Args:
+            max_pool_connections (int): The maximum number of HTTPS connections kept by each client.
+            session_factory (callable): A function returning a new boto3 session. Defaults to a session sharing the pool's data loader.
+            client_hooks (list): Functions called with each new client (ex: to register event handlers).
+            max_attempts (int): The maximum number of attempts of each call (standard retry mode). Defaults to the botocore settings.
+            credentials (botocore.credentials.Credentials): The credentials of the sessions, None for the default credentials.
+        """
+
+        retries = {'mode': 'standard', 'max_attempts': max_attempts} if max_attempts else None
+        self.config = Config(max_pool_connections=max_pool_connections, retries=retries)
+        self.session_factory = session_factory or self._new_session
+        self.client_hooks = list(client_hooks or [])
+        self.credentials = credentials
+        self.hits = 0
+        self.misses = 0
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._loader = get_shared_loader()
+
+    def _new_session(self):
+        """
+        Create a new boto3 session sharing the pool's data loader (and credentials, if any).
+
+        Returns:
+            boto3.Session: The new session.
+        """
+
+        botocore_session = botocore.session.get_session()
+        botocore_session.register_component('data_loader', self._loader)
+        if self.credentials is not None:
+            # The credentials object is shared by all the sessions, so the refreshes are too
+            botocore_session.register_component('credential_provider', CredentialResolver([SharedCredentialProvider(self.credentials)]))
+        return boto3.Session(botocore_session=botocore_session)
+
+    def get_session(self):
+        """
+        Get the boto3 session of the calling worker thread, creating it if needed.
+
+        Returns:
+            boto3.Session: The session of the current thread.
+        """
+
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self.session_factory()
+            self._local.session = session
+        return session
+
+    def get_client(self, service, region_name=None):
+        """
+        Get a client for a service and a region, creating it only on the first request.
+
+        Args:
+            service (str): The boto3 service name (ex: 'ec2').
+            region_name (str): The AWS region name, or None for the default region.
+
+        Returns:
+            botocore.client.BaseClient: The shared client.
+        """
+
+        key = (service, region_name)
+        client = self._clients.get(key)
+
+        with self._lock:
+            if client is not None:
+                self.hits += 1
+                return client
+            client = self._clients.get(key)
+            if client is None:
+                client = self.get_session().client(service, region_name=region_name, config=self.config)
+                for client_hook in self.client_hooks:
+                    client_hook(client)
+                self._clients[key] = client
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return client
+
+    def stats(self):
+        """
+        Get the pool statistics.
+
+        Returns:
+            dict: The number of clients, cache hits and cache misses.
+        """
+
+        with self._lock:
+            return {'clients': len(self._clients), 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        """Drop all the pooled clients and reset the counters."""
+
+        with self._lock:
+            self._clients.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,233 @@
+# concurrency.py
+
+import time
+import threading
+import contextvars
+from statistics import median
+from rate_limiter import THROTTLING_ERROR_CODES
+
+class AdjustableSemaphore:
+
+    """Semaphore whose limit can be changed while it is used."""
+
+    def __init__(self, limit):
+        """
+        Initialize a new semaphore.
+
+        Args:
+            limit (int): The maximum number of holders.
+        """
+
+        self.limit = limit
+        self.holders = 0
+        self._condition = threading.Condition()
+
+    def set_limit(self, limit):
+        """
+        Change the limit. When it is lowered, the current holders keep running and no one else gets in until enough of them are gone.
+
+        Args:
+            limit (int): The new maximum number of holders.
+        """
+
+        with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            while self.holders >= self.limit:
+                self._condition.wait()
+            self.holders += 1
+
+    def release(self):
+        with self._condition:
+            self.holders -= 1
+            self._condition.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+# ------------------------------------------------------------------------------
+
+class AdaptiveConcurrency:
+
+    """
+    Number of workers adjusted at runtime from the observed latency and throttle rate of the API calls.
+
+    Every 'interval' seconds, the calls of the last interval are compared to the usual latency of their operation:
+    if too many calls were throttled, or if the latency went up by more than 'latency_factor' (median over the calls
+    of the ratio to their operation), the number of workers is cut by 'decrease'. Otherwise, it is raised by
+    'increase' workers, up to 'max_workers'. The usual latency of an operation is its best one, rising slowly
+    ('baseline_decay') towards the latency observed when it is higher, so a slower period doesn't keep the workers
+    down for the rest of the run. The number of workers over time is kept in 'history' for the run metrics.
+    """
+
+    def __init__(self, workers, min_workers=1, max_workers=256, interval=1.0, throttle_threshold=0.02, latency_factor=2.0, increase=2, decrease=0.75,
+                 baseline_decay=0.1):
+        """
+        Initialize a new adaptive concurrency controller.
+
+        Args:
+            workers (int): The initial number of workers.
+            min_workers (int): The minimum number of workers.
+            max_workers (int): The maximum number of workers.
+            interval (float): The number of seconds between two adjustments.
+            throttle_threshold (float): The ratio of throttled calls above which the number of workers is cut.
+            latency_factor (float): The latency increase, compared to the usual one, above which the number of workers is cut.
+            increase (int): The number of workers added after a good interval.
+            decrease (float): The factor applied to the number of workers after a bad interval.
+            baseline_decay (float): The share of the gap by which the usual latency of an operation rises towards a higher latency, at each interval.
+        """
+
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.workers = min(self.max_workers, max(self.min_workers, workers))
+        self.interval = interval
+        self.throttle_threshold = throttle_threshold
+        self.latency_factor = latency_factor
+        self.increase = increase
+        self.decrease = decrease
+        self.baseline_decay = baseline_decay
+        self.semaphore = AdjustableSemaphore(self.workers)
+        self.baselines = {}
+        self.history = []
+        self._latencies = {}
+        self._throttles = 0
+        self._attempt_start = contextvars.ContextVar('adaptive_attempt_start', default=None)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_time = None
+
+    def register(self, client):
+        """
+        Hook the controller on the events of a client, to measure the latency and the throttling of its calls.
+
+        Each attempt is timed from the sending of its request, after the wait of the rate limiter (registered last on
+        'before-send'), to its response: the waits for the rate limits and the retry backoffs are not latency. The
+        start time is kept in a context variable, local to the thread (or the asyncio task) making the call.
+
+        Args:
+            client (object): The client.
+        """
+
+        def before_send(**kwargs):
+            self._attempt_start.set(time.monotonic())
+
+        def on_response(parsed_response=None, event_name='', **kwargs):
+            start_time = self._attempt_start.get()
+            if start_time is None:
+                return
+            self._attempt_start.set(None)
+            error_code = (parsed_response or {}).get('Error', {}).get('Code')
+            # The event name is 'response-received.<service>.<operation>'
+            self.record(time.monotonic() - start_time, error_code in THROTTLING_ERROR_CODES, event_name.partition('.')[2] or None)
+
+        client.meta.events.register_last('before-send', before_send)
+        client.meta.events.register('response-received', on_response)
+
+    def record(self, latency, throttled=False, operation=None):
+        """
+        Record the result of one API call.
+
+        Args:
+            latency (float): The duration of the call, in seconds.
+            throttled (bool): True if the call was throttled.
+            operation (str): The service and operation of the call (ex: 'ec2.DescribeInstances').
+        """
+
+        with self._lock:
+            self._latencies.setdefault(operation, []).append(latency)
+            if throttled:
+                self._throttles += 1
+
+    def adjust(self):
+        """
+        Adjust the number of workers from the calls recorded since the last adjustment.
+
+        Returns:
+            int: The new number of workers.
+        """
+
+        with self._lock:
+            latencies, throttles = self._latencies, self._throttles
+            self._latencies, self._throttles = {}, 0
+
+        calls = sum(len(values) for values in latencies.values())
+        latency = median(value for values in latencies.values() for value in values) if calls else None
+
+        # Latency of each operation compared to its usual one (the operations seen for the first time only set it)
+        ratios = []
+        for operation, values in latencies.items():
+            operation_latency = median(values)
+            baseline = self.baselines.get(operation)
+            if baseline is not None:
+                ratios.extend([operation_latency / max(baseline, 1e-6)] * len(values))
+            if baseline is None or operation_latency < baseline:
+                self.baselines[operation] = operation_latency
+            else:
+                self.baselines[operation] = baseline + self.baseline_decay * (operation_latency - baseline)
+        latency_ratio = median(ratios) if ratios else None
+
+        if calls:
+            overloaded = throttles / calls > self.throttle_threshold
+            if latency_ratio is not None and latency_ratio > self.latency_factor:
+                overloaded = True
+
+            if overloaded:
+                self.workers = max(self.min_workers, int(self.workers * self.decrease))
+            else:
+                self.workers = min(self.max_workers, self.workers + self.increase)
+            self.semaphore.set_limit(self.workers)
+
+        self.history.append({
+            'time': round(time.monotonic() - self._start_time, 3) if self._start_time else 0.0,
+            'workers': self.workers,
+            'calls': calls,
+            'throttles': throttles,
+            'latency_p50': round(latency, 4) if latency is not None else None,
+            'latency_ratio': round(latency_ratio, 2) if latency_ratio is not None else None,
+        })
+        return self.workers
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.adjust()
+
+    def start(self):
+        """Start adjusting the number of workers in a background thread."""
+
+        self._start_time = time.monotonic()
+        self.history.append({'time': 0.0, 'workers': self.workers, 'calls': 0, 'throttles': 0, 'latency_p50': None, 'latency_ratio': None})
+        self._thread = threading.Thread(target=self._loop, name='adaptive-concurrency', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop adjusting the number of workers, after a last adjustment."""
+
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+            self.adjust()
+
+    def run(self, function, *args):
+        """
+        Run a function in one of the worker slots, waiting for a free one.
+
+        Args:
+            function (callable): The function to run.
+            *args: The arguments of the function.
+
+        Returns:
+            object: The result of the function.
+        """
+
+        with self.semaphore:
+            return function(*args)
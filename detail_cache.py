@@ -0,0 +1,268 @@
+# detail_cache.py
+
+import os
+import json
+import time
+import pickle
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Version of the persisted caches: a cache of another version is ignored
+CACHE_VERSION = 1
+
+_MISSING = object()
+
+class DetailCache:
+
+    """
+    Memoization of the detail calls, keyed by (service, region, detail function, parameters).
+
+    Many items share the same detail (ex: the same security group for hundreds of instances): the first call is made,
+    the concurrent calls with the same key wait for its response instead of calling too, and the next ones get the
+    cached response until it expires (TTL). The least recently used responses are evicted to stay under a memory
+    budget. Only the successful responses are cached.
+
+    The responses are stored pickled: the size of a response is the one of its pickle, and each caller gets its own
+    copy (unpickled), which it may modify (ex: merge it into an item). A response that can't be pickled is not cached.
+
+    The cache can be persisted between runs (pickle file), the expired responses being dropped when it is loaded.
+    """
+
+    def __init__(self, ttl=900, max_bytes=64 * 1024 * 1024, path=None):
+        """
+        Initialize the cache, loading the persisted responses if any.
+
+        Args:
+            ttl (float): The time to live of a response, in seconds.
+            max_bytes (int): The memory budget of the cached responses (the size of their pickles), in bytes.
+            path (str): The path of the file persisting the cache between runs, None to keep it in memory only.
+        """
+
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path = path
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.loaded = 0
+
+        self._entries = OrderedDict() # key -> (expiry time, size, pickled response), the least recently used first
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def key(service, region_name, function, params):
+        """
+        Get the key of a detail call.
+
+        Args:
+            service (str): The service of the client.
+            region_name (str): The region of the client.
+            function (str): The detail function.
+            params (dict): The parameters of the call.
+
+        Returns:
+            str: The key of the call.
+        """
+
+        return json.dumps([service, region_name, function, params], sort_keys=True, default=str)
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[0] <= now:
+            del self._entries[key]
+            self.size -= entry[1]
+            self.expirations += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    @staticmethod
+    def _pickle(response):
+        try:
+            return pickle.dumps(response, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return None # a response that can't be pickled (ex: a stream) is not cached
+
+    @staticmethod
+    def _copy(data, response):
+        return pickle.loads(data) if data is not None else response
+
+    def _store(self, key, data, now):
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous[1]
+        self._entries[key] = (now + self.ttl, size, data)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def call(self, key, function):
+        """
+        Get the response of a detail call from the cache, or make the call (once for all the concurrent callers).
+
+        Args:
+            key (str): The key of the call.
+            function (callable): The call to make on a miss, without arguments.
+
+        Returns:
+            dict: The response (a copy of the cached one, for a hit or a deduplicated call).
+
+        Raises:
+            Exception: The exception of the call, raised to all the callers waiting for it.
+        """
+
+        with self._lock:
+            data = self._lookup(key, time.time())
+            if data is not _MISSING:
+                return pickle.loads(data)
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+
+        if not owner:
+            return self._copy(*future.result())
+
+        try:
+            response = function()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        data = self._pickle(response)
+        with self._lock:
+            if data is not None:
+                self._store(key, data, time.time())
+            self._inflight.pop(key, None)
+        future.set_result((data, response))
+        return response
+
+    async def async_call(self, key, coroutine_function):
+        """
+        Same as call, for the asyncio engine.
+
+        Args:
+            key (str): The key of the call.
+            coroutine_function (callable): Returns the coroutine of the call to make on a miss.
+
+        Returns:
+            dict: The response.
+        """
+
+        with self._lock:
+            data = self._lookup(key, time.time())
+            if data is not _MISSING:
+                return pickle.loads(data)
+            future = self._async_inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._async_inflight[key] = asyncio.get_running_loop().create_future()
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+
+        if not owner:
+            return self._copy(*await asyncio.shield(future))
+
+        try:
+            response = await coroutine_function()
+        except BaseException as e:
+            with self._lock:
+                self._async_inflight.pop(key, None)
+            future.set_exception(e)
+            future.exception() # retrieved, even if nobody waits for it
+            raise
+
+        data = self._pickle(response)
+        with self._lock:
+            if data is not None:
+                self._store(key, data, time.time())
+            self._async_inflight.pop(key, None)
+        future.set_result((data, response))
+        return response
+
+    def stats(self):
+        """
+        Get the statistics of the cache.
+
+        Returns:
+            dict: The hits, in-flight deduplications, misses, hit rate, evictions, expirations, and the entries and size of the cache.
+        """
+
+        with self._lock:
+            calls = self.hits + self.deduplicated + self.misses
+            return {
+                'hits': self.hits,
+                'deduplicated': self.deduplicated,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.deduplicated) / calls, 4) if calls else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'loaded': self.loaded,
+                'entries': len(self._entries),
+                'bytes': self.size,
+            }
+
+    def load(self):
+        """Load the persisted responses that are not expired."""
+
+        try:
+            with open(self.path, 'rb') as file:
+                cache = pickle.load(file)
+        except Exception:
+            return
+        if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION:
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, expiry, data in cache['entries']:
+                if expiry > now:
+                    # The TTL of the current run applies, if it is shorter than the one of the run that cached the response
+                    self._store(key, data, now)
+                    key_expiry, size, _ = self._entries.get(key, (None, None, None))
+                    if key_expiry is not None:
+                        self._entries[key] = (min(key_expiry, expiry), size, data)
+                        self.loaded += 1
+
+    def save(self):
+        """Persist the responses that are not expired (in a temporary file, then renamed)."""
+
+        if not self.path:
+            return
+
+        now = time.time()
+        entries = []
+        with self._lock:
+            for key, (expiry, _, data) in self._entries.items():
+                if expiry > now:
+                    entries.append((key, expiry, data))
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            pickle.dump({'version': CACHE_VERSION, 'entries': entries}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
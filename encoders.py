@@ -0,0 +1,188 @@
+# encoders.py
+
+import json
+import gzip
+from utils import json_serial
+
+# orjson and msgspec are optional: they serialize the datetimes natively (in C), the json module calls json_serial for each one
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# zstandard is optional: without it, only the gzip compression is available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Encoders in order of preference (the first available one is used by default)
+ENCODERS = ('orjson', 'msgspec', 'json')
+
+# Compressions of the outputs, with the extension added to the file names
+COMPRESSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+def available_encoders():
+    """
+    Get the encoders that can be used.
+
+    Returns:
+        list: The names of the available encoders, in order of preference.
+    """
+
+    return [name for name, module in zip(ENCODERS, (orjson, msgspec, json)) if module is not None]
+
+def available_compressions():
+    """
+    Get the compressions that can be used.
+
+    Returns:
+        list: The names of the available compressions.
+    """
+
+    return ['gzip'] + (['zstd'] if zstandard is not None else [])
+
+# ------------------------------------------------------------------------------
+
+class JsonEncoder:
+
+    """
+    Encoder of the JSON outputs, with orjson, msgspec or the json module.
+
+    The documents are indented (4 spaces, 2 with orjson which only supports that), or compact. The lines (NDJSON,
+    items of the SQLite and Parquet outputs) are always compact. The datetimes are written in ISO 8601, like
+    json_serial does (msgspec writes 'Z' instead of '+00:00' for UTC). A value that the fast encoder refuses
+    (ex: an integer of more than 64 bits) is encoded with the json module.
+    """
+
+    def __init__(self, name='auto', compact=False):
+        """
+        Initialize the encoder.
+
+        Args:
+            name (str): 'orjson', 'msgspec', 'json', or 'auto' for the first available one.
+            compact (bool): Write the documents without indentation nor spaces.
+
+        Raises:
+            ValueError: If the encoder is not installed.
+        """
+
+        if name == 'auto':
+            name = available_encoders()[0]
+        if name not in available_encoders():
+            raise ValueError(f"The {name} encoder is not installed (pip install {name})")
+
+        self.name = name
+        self.compact = compact
+        self.indent = 0 if compact else (2 if name == 'orjson' else 4)
+        if name == 'msgspec':
+            self._msgspec_encoder = msgspec.json.Encoder(enc_hook=json_serial)
+
+    def _stdlib(self, obj, indent):
+        if indent:
+            return json.dumps(obj, indent=indent, default=json_serial).encode()
+        return json.dumps(obj, separators=(',', ':'), default=json_serial).encode()
+
+    def encode(self, obj, indent=None):
+        """
+        Encode a document.
+
+        Args:
+            obj (any): The object to encode.
+            indent (int): The indentation, None for the one of the encoder.
+
+        Returns:
+            bytes: The JSON document.
+        """
+
+        indent = self.indent if indent is None else indent
+        try:
+            if self.name == 'orjson':
+                option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+                return orjson.dumps(obj, default=json_serial, option=option)
+            if self.name == 'msgspec':
+                data = self._msgspec_encoder.encode(obj)
+                return msgspec.json.format(data, indent=indent) if indent else data
+        except (TypeError, ValueError, OverflowError):
+            pass
+        return self._stdlib(obj, indent)
+
+    def encode_line(self, obj):
+        """
+        Encode an object on one line.
+
+        Args:
+            obj (any): The object to encode.
+
+        Returns:
+            str: The compact JSON of the object.
+        """
+
+        return self.encode(obj, 0).decode()
+
+# ------------------------------------------------------------------------------
+
+def open_output(path, compression=None, level=None):
+    """
+    Open an output file for writing, compressed as it is written.
+
+    Args:
+        path (str): The path of the file (the extension of the compression is not added).
+        compression (str): 'gzip', 'zstd', or None.
+        level (int): The compression level, None for the default one (6 for gzip, 3 for zstd).
+
+    Returns:
+        file: The binary file object.
+    """
+
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6 if level is None else level)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("The zstd compression needs zstandard (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=3 if level is None else level).stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
+
+def write_json(path, obj, encoder, compression=None):
+    """
+    Write a JSON document, compressed or not.
+
+    A dict is written one top-level value at a time (ex: one inventory category), so the whole document is never in
+    memory as one string, and the compressor works while the next value is encoded. The document is the same as
+    if it was encoded at once.
+
+    Args:
+        path (str): The path of the file, without the extension of the compression.
+        obj (any): The document.
+        encoder (JsonEncoder): The encoder.
+        compression (str): 'gzip', 'zstd', or None.
+
+    Returns:
+        str: The path of the written file (with the extension of the compression).
+    """
+
+    path += COMPRESSIONS.get(compression, '')
+    with open_output(path, compression) as file:
+        if not isinstance(obj, dict) or not obj:
+            file.write(encoder.encode(obj))
+            return path
+
+        indent = b' ' * encoder.indent
+        file.write(b'{\n' if indent else b'{')
+        for index, (key, value) in enumerate(obj.items()):
+            if index:
+                file.write(b',\n' if indent else b',')
+            key = encoder.encode(str(key), 0)
+            value = encoder.encode(value)
+            if indent:
+                # The JSON strings have no raw newline: every newline of the value starts a line to indent
+                file.write(indent + key + b': ' + value.replace(b'\n', b'\n' + indent))
+            else:
+                file.write(key + b':' + value)
+        file.write(b'\n}' if indent else b'}')
+    return path
@@ -0,0 +1,336 @@
+"""
+Differences between two inventory outputs (ex: yesterday's and today's), resource by resource.
+
+The items are matched by identity: the item_search_id of the first detail of their inventory node (declared in the
+resource files), else their ARN, ID or name (like the incremental mode), else their content. An item with the same
+identity and another content is changed.
+
+Both outputs are read at the same time, one (category, resource, object type, region) group after the other: the
+JSON outputs are sorted on these keys, so the groups are merged like two sorted lists. Only the identities and
+fingerprints of the items of the current group are in memory, never the items themselves. An NDJSON output is not
+sorted: its identities and fingerprints are gathered first, then sorted.
+
+The report lists the added, removed and changed identities of each group (with the added and changed items with
+--with-items), and the totals.
+
+Usage:
+    python inventory_diff.py output/inventory_123456789012_20240101_000000.json output/inventory_123456789012_20240102_000000.json
+    python inventory_diff.py yesterday.json today.json --with-items --output diff.json
+"""
+
+import sys
+import json
+import hashlib
+import argparse
+import botocore.session
+from botocore import xform_name
+from plan import load_plan
+from pagination import PAGINATION_KEYS
+from snapshot import item_identity, fingerprint
+from inventory_reader import INVENTORY_DEPTH, iter_items, read_item, open_output
+from utils import json_serial
+
+# orjson is optional: it makes the canonical JSON of the fingerprints several times faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ------------------------------------------------------------------------------
+
+def search_ids(plan):
+    """
+    Get the item_search_id of the object types of a plan.
+
+    The object type of a node is the first key of the response of its function (like in the results), found in the
+    service model of botocore. Without the model (ex: an unknown service), the object type is taken as the node name.
+
+    Args:
+        plan (InventoryPlan): The plan.
+
+    Returns:
+        dict: The item_search_id of the first detail of each node, by (resource, object type).
+    """
+
+    session = botocore.session.get_session()
+    ids = {}
+    for resource in plan.resources:
+        nodes = [node for node in resource.nodes.values() if node.details]
+        if not nodes:
+            continue
+        try:
+            service_model = session.get_service_model(resource.boto_resource_name)
+            operations = {xform_name(name): name for name in service_model.operation_names}
+        except Exception:
+            service_model, operations = None, {}
+        for node in nodes:
+            object_type = node.name
+            if node.function in operations:
+                output_shape = service_model.operation_model(operations[node.function]).output_shape
+                members = [key for key in (output_shape.members if output_shape else []) if key not in PAGINATION_KEYS and key != node.output_token]
+                object_type = members[0] if members else object_type
+            ids.setdefault((resource.name, object_type), node.details[0].item_search_id)
+    return ids
+
+def group_key(keys):
+    """
+    Get the key of the group of an item.
+
+    Args:
+        keys (tuple): The keys of the item in the output (category, resource, object type, region), fewer for the
+            values higher in the document (ex: the 'regions' list).
+
+    Returns:
+        tuple: The four keys, '' for the missing ones.
+    """
+
+    return tuple(str(key) for key in keys) + ('',) * (INVENTORY_DEPTH - len(keys))
+
+def item_fingerprint(item):
+    """
+    Get the fingerprint of an item read from an output.
+
+    The fingerprints are only compared within a comparison, so they don't have to be the ones of the snapshots
+    (snapshot.fingerprint): the canonical JSON is written by orjson when it is installed.
+
+    Args:
+        item (any): The item.
+
+    Returns:
+        str: The SHA-1 of the canonical JSON of the item.
+    """
+
+    if orjson is not None:
+        try:
+            return hashlib.sha1(orjson.dumps(item, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        except TypeError: # ex: an integer of more than 64 bits
+            pass
+    return fingerprint(item)
+
+def type_search_id(item, object_type):
+    """
+    Find the key identifying an item named after its object type (ex: 'VpcId' for 'Vpcs'), for the object types
+    without item_search_id: the first ARN, ID or name of an item may be shared by all the items (ex: 'OwnerId').
+
+    Args:
+        item (dict): The item.
+        object_type (str): The object type (ex: 'Vpcs').
+
+    Returns:
+        str: The key, or None if the item has none.
+    """
+
+    for base in (object_type[:-1], object_type) if object_type.endswith('s') else (object_type,):
+        for suffix in ('Arn', 'Id', 'Name'):
+            if isinstance(item.get(base + suffix), str):
+                return base + suffix
+    return None
+
+def item_entry(keys, item, offset, length, ids):
+    """
+    Get the entry of an item in the comparison.
+
+    Args:
+        keys (tuple): The keys of the item in the output.
+        item (any): The item.
+        offset (int): Its offset in the output.
+        length (int): Its length.
+        ids (dict): The item_search_id by (resource, object type).
+
+    Returns:
+        tuple: The identity of the item (None if it has none), its fingerprint, offset and length.
+    """
+
+    search_id = ids.get(tuple(keys[1:3]))
+    if search_id is None and len(keys) > 2 and isinstance(item, dict):
+        search_id = type_search_id(item, keys[2])
+    return item_identity(item, search_id), item_fingerprint(item), offset, length
+
+def sorted_entries(entries):
+    """
+    Give their final identity to the entries of a group, and sort them.
+
+    An item without identity is identified by its fingerprint, unless it is alone in its group (ex: a summary, the
+    whole response of a function): it is then changed rather than removed and added. The duplicates get '#2', '#3'...
+
+    Args:
+        entries (list): The entries of the group (see item_entry), in the order of the output.
+
+    Returns:
+        list: The (identity, fingerprint, offset, length) of the items, sorted by identity.
+    """
+
+    unique = []
+    seen = {}
+    for identity, item_fingerprint, offset, length in entries:
+        if identity is None:
+            identity = '' if len(entries) == 1 else item_fingerprint
+        count = seen[identity] = seen.get(identity, 0) + 1
+        unique.append((identity if count == 1 else f"{identity}#{count}", item_fingerprint, offset, length))
+    unique.sort()
+    return unique
+
+def iter_groups(buffer, ndjson, ids, name='output'):
+    """
+    Read the groups of an output, in sorted order.
+
+    Args:
+        buffer (bytes-like): The output, None if it is empty.
+        ndjson (bool): True for NDJSON records.
+        ids (dict): The item_search_id by (resource, object type).
+        name (str): The name of the output, for the errors.
+
+    Returns:
+        generator: The group key and the sorted entries (see sorted_entries) of each group, in the order of the keys.
+
+    Raises:
+        ValueError: If a JSON output is not sorted (ex: written by an older version).
+    """
+
+    if buffer is None:
+        return
+
+    if ndjson:
+        # The records of a group are not together: only their entries are gathered (the items are read again by offset)
+        groups = {}
+        for keys, item, offset, length in iter_items(buffer, ndjson):
+            groups.setdefault(group_key(keys), []).append(item_entry(keys, item, offset, length, ids))
+        for key in sorted(groups):
+            yield key, sorted_entries(groups.pop(key))
+        return
+
+    current, entries = None, []
+    for keys, item, offset, length in iter_items(buffer, ndjson):
+        key = group_key(keys)
+        if key != current:
+            if current is not None:
+                if key < current:
+                    raise ValueError(f"{name} is not sorted on category, resource, object type and region ({' / '.join(key)})")
+                yield current, sorted_entries(entries)
+            current, entries = key, []
+        entries.append(item_entry(keys, item, offset, length, ids))
+    if current is not None:
+        yield current, sorted_entries(entries)
+
+# ------------------------------------------------------------------------------
+
+def merge_entries(old_entries, new_entries):
+    """
+    Compare the sorted entries of a group in two outputs.
+
+    Args:
+        old_entries (list): The sorted entries of the group in the old output.
+        new_entries (list): The sorted entries of the group in the new output.
+
+    Returns:
+        tuple: The added, removed and changed entries (the new entry for the changed ones), and the number of
+        unchanged entries.
+    """
+
+    added, removed, changed = [], [], []
+    unchanged = 0
+    i = j = 0
+    while i < len(old_entries) or j < len(new_entries):
+        if j == len(new_entries) or (i < len(old_entries) and old_entries[i][0] < new_entries[j][0]):
+            removed.append(old_entries[i])
+            i += 1
+        elif i == len(old_entries) or new_entries[j][0] < old_entries[i][0]:
+            added.append(new_entries[j])
+            j += 1
+        else:
+            if old_entries[i][1] == new_entries[j][1]:
+                unchanged += 1
+            else:
+                changed.append(new_entries[j])
+            i += 1
+            j += 1
+    return added, removed, changed, unchanged
+
+def diff_outputs(old_path, new_path, ids, with_items=False):
+    """
+    Compare two inventory outputs.
+
+    Args:
+        old_path (str): The old output (JSON or NDJSON, not compressed).
+        new_path (str): The new output.
+        ids (dict): The item_search_id by (resource, object type) (see search_ids).
+        with_items (bool): Add the added and changed items to the report.
+
+    Returns:
+        dict: The report: the totals, and the changes of each group (category, resource, object type, region,
+        added, removed and changed identities, and the items if asked).
+    """
+
+    old_buffer, old_ndjson = open_output(old_path)
+    new_buffer, new_ndjson = open_output(new_path)
+    totals = {'added': 0, 'removed': 0, 'changed': 0, 'unchanged': 0}
+    changes = []
+
+    try:
+        old_groups = iter_groups(old_buffer, old_ndjson, ids, old_path)
+        new_groups = iter_groups(new_buffer, new_ndjson, ids, new_path)
+        old_group, new_group = next(old_groups, None), next(new_groups, None)
+        while old_group or new_group:
+            if new_group is None or (old_group is not None and old_group[0] < new_group[0]):
+                key, old_entries, new_entries = old_group[0], old_group[1], []
+                old_group = next(old_groups, None)
+            elif old_group is None or new_group[0] < old_group[0]:
+                key, old_entries, new_entries = new_group[0], [], new_group[1]
+                new_group = next(new_groups, None)
+            else:
+                key, old_entries, new_entries = old_group[0], old_group[1], new_group[1]
+                old_group, new_group = next(old_groups, None), next(new_groups, None)
+
+            added, removed, changed, unchanged = merge_entries(old_entries, new_entries)
+            totals['added'] += len(added)
+            totals['removed'] += len(removed)
+            totals['changed'] += len(changed)
+            totals['unchanged'] += unchanged
+            if not (added or removed or changed):
+                continue
+
+            category, resource, object_type, region = key
+            change = {'category': category, 'resource': resource, 'object_type': object_type, 'region': region,
+                      'added': [entry[0] for entry in added], 'removed': [entry[0] for entry in removed], 'changed': [entry[0] for entry in changed]}
+            if with_items:
+                change['added_items'] = [read_item(new_buffer, offset, length, new_ndjson) for _, _, offset, length in added]
+                change['changed_items'] = [read_item(new_buffer, offset, length, new_ndjson) for _, _, offset, length in changed]
+            changes.append(change)
+    finally:
+        for buffer in (old_buffer, new_buffer):
+            if buffer is not None:
+                buffer.close()
+
+    return {'old': old_path, 'new': new_path, 'totals': totals, 'changes': changes}
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Compare two inventory outputs (JSON or NDJSON), item by item')
+    parser.add_argument('old', help='The old output')
+    parser.add_argument('new', help='The new output')
+    parser.add_argument('--resource-dir', type=str, default='resources', help='The directory of the resource files (for the item_search_id of the nodes)')
+    parser.add_argument('--with-items', action='store_true', help='Add the added and changed items to the report')
+    parser.add_argument('--output', type=str, metavar='FILE', help='Write the report in a JSON file')
+    args = parser.parse_args()
+
+    plan, _ = load_plan(args.resource_dir)
+    if plan is None:
+        parser.error(f"No resource file in {args.resource_dir}")
+
+    try:
+        report = diff_outputs(args.old, args.new, search_ids(plan), args.with_items)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+
+    for change in report['changes']:
+        print(f"{change['category']} / {change['resource']} / {change['object_type']} / {change['region'] or '-'}: "
+              f"+{len(change['added'])} -{len(change['removed'])} ~{len(change['changed'])}")
+    totals = report['totals']
+    print(f"Total: {totals['added']} added, {totals['removed']} removed, {totals['changed']} changed, {totals['unchanged']} unchanged")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=4, default=json_serial)
+        print(f"Report: {args.output}")
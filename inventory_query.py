@@ -0,0 +1,384 @@
+"""
+Queries of an inventory output, without loading it.
+
+The first query of an output (JSON or NDJSON, not compressed) reads it once and builds a sidecar index next to it
+(<output>.index.sqlite): the category, resource, object type, region and byte offset of each item, and its keys:
+the ARNs, IDs and names of the item (and of the structures listed in it, ex: the instances of a reservation) and its
+tags. The next queries look up the index, then read only the matching items, from the memory-mapped output. The
+index is built again when the output changes.
+
+The matching items are printed as NDJSON records (category, resource, object_type, region, item).
+
+Usage:
+    python inventory_query.py output/inventory_123456789012_20240101.json --arn arn:aws:s3:::my-bucket
+    python inventory_query.py output/inventory_123456789012_20240101.json --tag Environment=prod --resource ec2
+    python inventory_query.py output/inventory_123456789012_20240101.json --resource ec2 --where Instances.InstanceType=m5.large --regions
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from inventory_reader import iter_items, read_item, open_output
+
+# Version of the index: an index of another version is built again
+INDEX_VERSION = 1
+
+# Keys of the tags in the AWS responses (lists of Key/Value pairs, or dicts)
+TAG_KEYS = ('Tags', 'TagList', 'TagSet', 'tags')
+
+# Number of items inserted at once in the index
+INSERT_BATCH = 10000
+
+# ------------------------------------------------------------------------------
+
+def key_kind(key, value):
+    """
+    Get the kind of key of a value of an item.
+
+    Args:
+        key (str): The key in the item (ex: 'InstanceId').
+        value (str): The value.
+
+    Returns:
+        str: 'arn', 'id', 'name', or None if the value is not indexed.
+    """
+
+    if value.startswith('arn:') or key.endswith(('Arn', 'ARN')) or key == 'arn':
+        return 'arn'
+    if key.endswith(('Id', 'ID', 'Identifier')) or key == 'id':
+        return 'id'
+    if key.endswith('Name') or key == 'name':
+        return 'name'
+    return None
+
+def _tag_pairs(tags):
+    if isinstance(tags, dict):
+        return [(key, value) for key, value in tags.items() if isinstance(value, str)]
+    pairs = []
+    for tag in tags if isinstance(tags, list) else []:
+        if isinstance(tag, dict):
+            key, value = tag.get('Key', tag.get('key')), tag.get('Value', tag.get('value'))
+            if isinstance(key, str):
+                pairs.append((key, value if isinstance(value, str) else ''))
+    return pairs
+
+def _structure_keys(structure, keys):
+    for key, value in structure.items():
+        if not isinstance(key, str):
+            continue
+        if isinstance(value, str):
+            kind = key_kind(key, value)
+            if kind:
+                keys.append((kind, key, value))
+        elif key in TAG_KEYS:
+            keys.extend(('tag', name, tag_value) for name, tag_value in _tag_pairs(value))
+
+def item_keys(item):
+    """
+    Get the keys of an item indexed for the lookups.
+
+    Args:
+        item (any): The item.
+
+    Returns:
+        list: The (kind, name, value) of the keys: kind is 'arn', 'id', 'name' or 'tag', name is the key in the item
+        (the tag key for a tag). A string item (ex: an ARN of a list) is its own key.
+    """
+
+    keys = []
+    if isinstance(item, str):
+        keys.append(('arn' if item.startswith('arn:') else 'id', '', item))
+    elif isinstance(item, dict):
+        _structure_keys(item, keys)
+        for value in item.values():
+            if isinstance(value, list):
+                for element in value:
+                    if isinstance(element, dict):
+                        _structure_keys(element, keys)
+    return keys
+
+# ------------------------------------------------------------------------------
+
+def index_path(output_path):
+    """
+    Get the path of the index of an output.
+
+    Args:
+        output_path (str): The path of the output.
+
+    Returns:
+        str: The path of its index.
+    """
+
+    return output_path + '.index.sqlite'
+
+def output_signature(output_path):
+    """
+    Get the signature of an output, stored in its index to know if the index is still the one of the output.
+
+    Args:
+        output_path (str): The path of the output.
+
+    Returns:
+        str: The version of the index, the size and the modification time of the output.
+    """
+
+    stat = os.stat(output_path)
+    return f"{INDEX_VERSION}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def build_index(output_path):
+    """
+    Build the index of an output, reading the output once.
+
+    The index is written in a temporary file, then renamed: a query never sees an incomplete index.
+
+    Args:
+        output_path (str): The path of the output.
+
+    Returns:
+        int: The number of indexed items.
+    """
+
+    path = index_path(output_path)
+    temporary_path = path + '.tmp'
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    signature = output_signature(output_path)
+    buffer, ndjson = open_output(output_path)
+
+    connection = sqlite3.connect(temporary_path)
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    connection.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, category TEXT, resource TEXT, object_type TEXT, region TEXT, offset INTEGER, length INTEGER)")
+    connection.execute("CREATE TABLE keys (kind TEXT, name TEXT, value TEXT, item INTEGER)")
+
+    count = 0
+    items, keys = [], []
+    for path_keys, item, offset, length in iter_items(buffer, ndjson) if buffer is not None else []:
+        count += 1
+        path_keys = tuple(path_keys) + (None,) * (4 - len(path_keys))
+        items.append((count, *path_keys, offset, length))
+        keys.extend((kind, name, value, count) for kind, name, value in item_keys(item))
+        if len(items) >= INSERT_BATCH:
+            connection.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)", items)
+            connection.executemany("INSERT INTO keys VALUES (?, ?, ?, ?)", keys)
+            items, keys = [], []
+    connection.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)", items)
+    connection.executemany("INSERT INTO keys VALUES (?, ?, ?, ?)", keys)
+
+    # The indexes are created once the rows are inserted (faster than maintaining them row by row)
+    connection.execute("CREATE INDEX keys_value ON keys (kind, value, name)")
+    connection.execute("CREATE INDEX keys_name ON keys (kind, name)")
+    connection.execute("CREATE INDEX items_resource ON items (resource, region)")
+    connection.executemany("INSERT INTO meta VALUES (?, ?)", [('signature', signature), ('format', 'ndjson' if ndjson else 'json'), ('items', str(count))])
+    connection.commit()
+    connection.close()
+    if buffer is not None:
+        buffer.close()
+
+    os.replace(temporary_path, path)
+    return count
+
+def open_index(output_path, rebuild=False):
+    """
+    Open the index of an output, building it if it is missing or outdated.
+
+    Args:
+        output_path (str): The path of the output.
+        rebuild (bool): Build the index again even if it is up to date.
+
+    Returns:
+        sqlite3.Connection: The connection to the index.
+    """
+
+    path = index_path(output_path)
+    if not rebuild and os.path.exists(path):
+        connection = sqlite3.connect(path)
+        try:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        except sqlite3.DatabaseError:
+            row = None
+        if row and row[0] == output_signature(output_path):
+            return connection
+        connection.close()
+    build_index(output_path)
+    return sqlite3.connect(path)
+
+# ------------------------------------------------------------------------------
+
+def find_items(connection, arns=(), ids=(), names=(), tags=(), category=None, resource=None, object_type=None, region=None):
+    """
+    Find the items matching all the criteria in an index.
+
+    Args:
+        connection (sqlite3.Connection): The index.
+        arns (list): ARNs (the item has one of them).
+        ids (list): IDs (the item has one of them).
+        names (list): Names (the item has one of them).
+        tags (list): (key, value) tags, value None for any value (the item has all of them).
+        category (str): The category of the items.
+        resource (str): The type of AWS resource.
+        object_type (str): The object type.
+        region (str): The region.
+
+    Returns:
+        list: The (category, resource, object_type, region, offset, length) of the matching items, in the order of
+        the output.
+    """
+
+    conditions, params = [], []
+    for kind, values in (('arn', arns), ('id', ids), ('name', names)):
+        if values:
+            conditions.append(f"id IN (SELECT item FROM keys WHERE kind = ? AND value IN ({', '.join('?' * len(values))}))")
+            params.extend([kind, *values])
+    for key, value in tags:
+        if value is None:
+            conditions.append("id IN (SELECT item FROM keys WHERE kind = 'tag' AND name = ?)")
+            params.append(key)
+        else:
+            conditions.append("id IN (SELECT item FROM keys WHERE kind = 'tag' AND value = ? AND name = ?)")
+            params.extend([value, key])
+    for column, value in (('category', category), ('resource', resource), ('object_type', object_type), ('region', region)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+
+    query = "SELECT category, resource, object_type, region, offset, length FROM items"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return connection.execute(query + " ORDER BY id", params).fetchall()
+
+def path_values(value, path):
+    """
+    Get the values at a dotted path of an item, through the lists (ex: 'Instances.State.Name' in a reservation).
+
+    Args:
+        value (any): The item.
+        path (list): The keys of the path.
+
+    Returns:
+        list: The values found.
+    """
+
+    if isinstance(value, list):
+        return [found for element in value for found in path_values(element, path)]
+    if not path:
+        return [value]
+    if isinstance(value, dict) and path[0] in value:
+        return path_values(value[path[0]], path[1:])
+    return []
+
+def match_where(item, conditions):
+    """
+    Check the conditions on the values of an item.
+
+    Args:
+        item (any): The item.
+        conditions (list): The (path, value) conditions: one of the values at the dotted path is the value (compared
+            as strings, 'true' / 'false' for the booleans).
+
+    Returns:
+        bool: True if the item matches all the conditions.
+    """
+
+    for path, expected in conditions:
+        values = path_values(item, path.split('.'))
+        if not any(json.dumps(value) == expected if isinstance(value, bool) else str(value) == expected for value in values):
+            return False
+    return True
+
+def query(output_path, rebuild=False, where=(), **criteria):
+    """
+    Query an output.
+
+    Args:
+        output_path (str): The path of the output.
+        rebuild (bool): Build the index again.
+        where (list): The (path, value) conditions checked on the items read (see match_where).
+        **criteria: The criteria of the index lookup (see find_items).
+
+    Returns:
+        generator: The records (category, resource, object_type, region, item) of the matching items.
+    """
+
+    connection = open_index(output_path, rebuild)
+    try:
+        rows = find_items(connection, **criteria)
+    finally:
+        connection.close()
+    if not rows:
+        return
+
+    buffer, ndjson = open_output(output_path)
+    try:
+        for category, resource, object_type, region, offset, length in rows:
+            item = read_item(buffer, offset, length, ndjson)
+            if match_where(item, where):
+                yield {'category': category, 'resource': resource, 'object_type': object_type, 'region': region, 'item': item}
+    finally:
+        buffer.close()
+
+def split_condition(text, separator='='):
+    """
+    Split a KEY=VALUE argument.
+
+    Args:
+        text (str): The argument.
+        separator (str): The separator.
+
+    Returns:
+        tuple: The key, and the value (None without separator).
+    """
+
+    key, found, value = text.partition(separator)
+    return key, value if found else None
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Query an inventory output (JSON or NDJSON) through its sidecar index')
+    parser.add_argument('output', help='The inventory output')
+    parser.add_argument('--arn', action='append', default=[], help='An ARN of the items (repeatable: any of them)')
+    parser.add_argument('--id', action='append', default=[], help='An ID of the items (repeatable: any of them)')
+    parser.add_argument('--name', action='append', default=[], help='A name of the items (repeatable: any of them)')
+    parser.add_argument('--tag', action='append', default=[], metavar='KEY[=VALUE]', help='A tag of the items (repeatable: all of them)')
+    parser.add_argument('--category', help='The category of the items (ex: Compute)')
+    parser.add_argument('--resource', help='The type of AWS resource (ex: ec2)')
+    parser.add_argument('--object-type', help='The object type (ex: Reservations)')
+    parser.add_argument('--region', help='The region of the items')
+    parser.add_argument('--where', action='append', default=[], metavar='PATH=VALUE',
+                        help='A value of the items at a dotted path, through the lists (ex: Instances.State.Name=running; repeatable: all of them)')
+    parser.add_argument('--count', action='store_true', help='Print only the number of matching items')
+    parser.add_argument('--regions', action='store_true', help='Print only the number of matching items per region')
+    parser.add_argument('--rebuild', action='store_true', help='Build the index again')
+    args = parser.parse_args()
+
+    where = [split_condition(condition) for condition in args.where]
+    if any(value is None for _, value in where):
+        parser.error("--where needs PATH=VALUE")
+
+    try:
+        records = query(args.output, rebuild=args.rebuild, where=where, arns=args.arn, ids=args.id, names=args.name,
+                        tags=[split_condition(tag) for tag in args.tag], category=args.category, resource=args.resource,
+                        object_type=args.object_type, region=args.region)
+        if args.count or args.regions:
+            regions = {}
+            for record in records:
+                regions[record['region']] = regions.get(record['region'], 0) + 1
+            if args.regions:
+                for region, count in sorted(regions.items(), key=lambda entry: str(entry[0])):
+                    print(f"{region}: {count}")
+            else:
+                print(sum(regions.values()))
+        else:
+            for record in records:
+                sys.stdout.write(json.dumps(record) + '\n')
+    except BrokenPipeError:
+        # The reader of the output stopped (ex: head): no error
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
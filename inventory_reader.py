@@ -0,0 +1,222 @@
+# inventory_reader.py
+
+import re
+import json
+import mmap
+from encoders import COMPRESSIONS
+
+# Levels of the inventory outputs above the items: category, resource, object type, region
+INVENTORY_DEPTH = 4
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+class JsonCursor:
+
+    """
+    Reader of the values of a JSON document one after the other, from a buffer (ex: a memory-mapped file), with the
+    byte offset and length of each value.
+
+    The buffer is decoded by windows (4 MB by default, more for a larger value), and each value is parsed by the C
+    decoder of the json module: the document is never in memory as a whole, and a value can be read again later by
+    seeking to its offset.
+    """
+
+    def __init__(self, buffer, window=4 * 1024 * 1024):
+        """
+        Initialize the cursor at the start of the buffer.
+
+        Args:
+            buffer (bytes-like): The UTF-8 JSON document.
+            window (int): The number of bytes decoded at once.
+        """
+
+        self.buffer = buffer
+        self.size = len(buffer)
+        self.window = window
+        self.position = 0 # byte offset of text[index]
+        self.text = ''
+        self.index = 0
+        self.ascii = True
+        self.at_end = self.size == 0
+
+    def _load(self, size=None):
+        start = self.position
+        end = min(self.size, start + (size or self.window))
+        # A window ends on a character boundary (never within the bytes of a UTF-8 character)
+        while start < end < self.size and (self.buffer[end] & 0xC0) == 0x80:
+            end -= 1
+        self.text = bytes(self.buffer[start:end]).decode('utf-8')
+        self.index = 0
+        self.ascii = self.text.isascii()
+        self.at_end = end == self.size
+
+    def _advance(self, index):
+        self.position += (index - self.index) if self.ascii else len(self.text[self.index:index].encode('utf-8'))
+        self.index = index
+
+    def peek(self):
+        """
+        Get the next character, after the whitespace.
+
+        Returns:
+            str: The character, or '' at the end of the document.
+        """
+
+        if self.index < len(self.text) and self.text[self.index] not in ' \t\n\r':
+            return self.text[self.index]
+        while True:
+            self._advance(_WHITESPACE.match(self.text, self.index).end())
+            if self.index < len(self.text):
+                return self.text[self.index]
+            if self.at_end:
+                return ''
+            self._load()
+
+    def expect(self, character):
+        """
+        Read a structural character (ex: '{', ':', ',').
+
+        Args:
+            character (str): The expected character.
+
+        Raises:
+            ValueError: If the next character is another one.
+        """
+
+        found = self.peek()
+        if found != character:
+            raise ValueError(f"Expected '{character}' at byte {self.position}, found '{found}'")
+        self._advance(self.index + 1)
+
+    def read_value(self):
+        """
+        Read the next value.
+
+        Returns:
+            tuple: The value, its byte offset and its length in bytes.
+
+        Raises:
+            ValueError: If the document is not valid JSON.
+        """
+
+        self.peek()
+        size = self.window
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.index)
+                if end < len(self.text) or self.at_end:
+                    break
+            except json.JSONDecodeError:
+                if self.at_end:
+                    raise ValueError(f"Invalid JSON value at byte {self.position}")
+            # The value goes beyond the window (or may, for a number): decode a larger window from its start
+            size = max(size, len(self.text) - self.index) * 2
+            self._load(size)
+
+        offset = self.position
+        self._advance(end)
+        return value, offset, self.position - offset
+
+# ------------------------------------------------------------------------------
+
+def _walk(cursor, keys, depth):
+    character = cursor.peek()
+    if character == '{' and len(keys) < depth:
+        cursor.expect('{')
+        if cursor.peek() == '}':
+            cursor.expect('}')
+            return
+        while True:
+            key, _, _ = cursor.read_value()
+            cursor.expect(':')
+            yield from _walk(cursor, keys + (key,), depth)
+            if cursor.peek() != ',':
+                break
+            cursor.expect(',')
+        cursor.expect('}')
+    elif character == '[':
+        cursor.expect('[')
+        if cursor.peek() == ']':
+            cursor.expect(']')
+            return
+        while True:
+            item, offset, length = cursor.read_value()
+            yield keys, item, offset, length
+            if cursor.peek() != ',':
+                break
+            cursor.expect(',')
+        cursor.expect(']')
+    else:
+        item, offset, length = cursor.read_value()
+        yield keys, item, offset, length
+
+def iter_items(buffer, ndjson=False, depth=INVENTORY_DEPTH):
+    """
+    Read the items of an inventory output, one after the other.
+
+    Args:
+        buffer (bytes-like): The output (ex: a memory-mapped file): a JSON document (category, resource, object type,
+            region, items) or NDJSON records.
+        ndjson (bool): True for NDJSON records.
+        depth (int): The number of levels above the items in a JSON document.
+
+    Returns:
+        generator: The (keys, item, offset, length) of each item, in the order of the output. The keys are the
+        (category, resource, object type, region) of the item (fewer for the values higher in the document, ex: the
+        'regions' list). A dict (ex: a summary) is one item. The offset and length are the ones of the item in a
+        JSON document, of the record in an NDJSON output.
+    """
+
+    if ndjson:
+        offset = 0
+        while offset < len(buffer):
+            end = buffer.find(b'\n', offset)
+            end = len(buffer) if end < 0 else end + 1
+            line = bytes(buffer[offset:end])
+            if line.strip():
+                record = json.loads(line)
+                yield (record['category'], record['resource'], record['object_type'], record['region']), record['item'], offset, end - offset
+            offset = end
+        return
+
+    cursor = JsonCursor(buffer)
+    if cursor.peek():
+        yield from _walk(cursor, (), depth)
+
+def read_item(buffer, offset, length, ndjson=False):
+    """
+    Read one item of an output, from its offset.
+
+    Args:
+        buffer (bytes-like): The output.
+        offset (int): The byte offset of the item (of its record for NDJSON).
+        length (int): Its length in bytes.
+        ndjson (bool): True for NDJSON records.
+
+    Returns:
+        any: The item.
+    """
+
+    value = json.loads(bytes(buffer[offset:offset + length]))
+    return value['item'] if ndjson else value
+
+def open_output(path):
+    """
+    Memory-map an inventory output for reading.
+
+    Args:
+        path (str): The path of the output (JSON or NDJSON, not compressed).
+
+    Returns:
+        tuple: The memory map (None for an empty file) and True for NDJSON.
+
+    Raises:
+        ValueError: If the output is compressed (it can't be memory-mapped).
+    """
+
+    if path.endswith(tuple(COMPRESSIONS.values())):
+        raise ValueError(f"{path} is compressed: decompress it first (the outputs are read by offset)")
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if file.seek(0, 2) else None
+    return buffer, path.endswith('.ndjson')
@@ -0,0 +1,81 @@
+# metrics.py
+
+import threading
+
+class ShardedCounters:
+
+    """
+    Counters of the inventory run, sharded per thread.
+
+    Each thread increments its own shard (a dict created on its first increment), so the hot path takes no lock and
+    no increment is lost. The shards are only merged when the counters are read. All the counters are created with
+    the shard, so a reader never sees a shard being resized.
+    """
+
+    def __init__(self, names):
+        """
+        Initialize the counters.
+
+        Args:
+            names (list): The names of the counters.
+        """
+
+        self.names = tuple(names)
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = dict.fromkeys(self.names, 0)
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def increment(self, name, amount=1):
+        """
+        Increment a counter.
+
+        Args:
+            name (str): The name of the counter.
+            amount (int): The amount to add.
+        """
+
+        self._shard()[name] += amount
+
+    def get(self, name):
+        """
+        Get the value of a counter, merged over all the threads.
+
+        Args:
+            name (str): The name of the counter.
+
+        Returns:
+            int: The value of the counter.
+        """
+
+        with self._shards_lock:
+            shards = list(self._shards)
+        return sum(shard[name] for shard in shards)
+
+    def snapshot(self):
+        """
+        Get the values of all the counters, merged over all the threads.
+
+        Returns:
+            dict: The value of each counter.
+        """
+
+        with self._shards_lock:
+            shards = list(self._shards)
+        return {name: sum(shard[name] for shard in shards) for name in self.names}
+
+    def reset(self):
+        """Reset all the counters to 0."""
+
+        with self._shards_lock:
+            for shard in self._shards:
+                for name in self.names:
+                    shard[name] = 0
@@ -9,9 +9,9 @@
 #
 # Modules:
 #    threading: Provides threading capabilities.
+#    asyncio: Event loop of the asyncio engine.
 #    boto3: AWS SDK for Python.
 #    json: JSON handling.
-#    yaml: YAML handling.
 #    os: OS-related functions.
 #    sys: System-specific parameters and functions.
 #    datetime: Date and time handling.
@@ -22,21 +22,73 @@
 #    tqdm: Progress bar library.
 #    glob: Unix-style pathname pattern expansion.
 #    utils: Custom utility functions.
+#    client_pool: Thread-safe pool of boto3 clients.
+#    pagination: Paginated calls of the inventory functions.
+#    async_engine: asyncio engine, alternative to the ThreadPoolExecutor.
+#    rate_limiter: Per-service, per-region rate limits of the API calls.
+#    availability: Offline availability of the services in the regions.
+#    concurrency: Number of workers adjusted at runtime.
+#    timing_history: Durations of the tasks in the previous runs, for the scheduling.
+#    checkpoint: Journal of the completed tasks, to resume an interrupted run.
+#    telemetry: Structured record of each API call.
+#    metrics: Counters of the run, sharded per thread.
+#    plan: Compiled inventory plan of the resource files, cached on disk.
+#    snapshot: Store of the last snapshot, for the incremental mode.
+#    detail_cache: Memoization of the detail calls (TTL, LRU eviction, in-flight deduplication).
+#    accounts: Assumed roles and AWS Organizations accounts, for the multi-account mode.
+#    sinks: Output sinks of the records (NDJSON, SQLite, Parquet), written by a background thread.
+#    encoders: JSON encoders of the outputs (orjson, msgspec or json), compact or compressed.
 #    botocore.exceptions: Exceptions for AWS SDK.
 #
 # Classes:
-#    InventoryThread: Thread class for performing inventory tasks.
+#    InventoryTask: One (resource, node, region) unit of inventory work.
 #
 # Functions:
+#    create_client_pool: Create the pool of boto3 clients, rate limited and retried.
+#    get_client_region: Get the region of the client to use for a resource in a region.
+#    get_client: Get a pooled boto3 client for a resource and a region.
 #    get_all_regions: Retrieve all AWS regions.
 #    test_region_connectivity: Test connectivity to a specific AWS region.
-#    detail_handling: Handle the details of inventory items by calling specified detail functions on the client.
-#    inventory_handling: Handle the inventory retrieval and processing for a specified AWS resource and region.
+#    get_detail_param_value: Find the value to give to a detail function for an inventory item.
+#    get_detail_calls: List the detail calls to make for the items of an inventory.
+#    strip_metadata: Remove the 'ResponseMetadata' of a response.
+#    call_detail / async_call_detail: Call a detail function for one inventory item.
+#    get_detail_batches: Group the detail calls of the batched details.
+#    split_batch_response: Split the response of a batched detail call back to the items.
+#    merge_detail: Add a detail response to an inventory item.
+#    detail_handling / async_detail_handling: Handle the details of inventory items by calling specified detail functions concurrently.
+#    store_results: Store a page of inventory items in the results.
+#    merge_pages: Merge the stored pages of a task (the items journaled for the task).
+#    pop_stored_items: Remove the items stored for an object type in a region from the results.
+#    write_records: Write inventory items to the output sink, one record per item.
+#    resume_tasks: Replay the tasks completed in the journal of an interrupted run.
+#    prepare_page: Prepare a page of an inventory call.
+#    handle_inventory_error: Log and count an exception raised by an inventory call.
+#    count_inventory: Count a successful inventory of a node.
+#    inventory_handling / async_inventory_handling: Handle the inventory retrieval and processing for a specified AWS resource, node and region.
 #    list_used_resources: List used resources based on the provided YAML files.
+#    get_worker_options: Get the options of the run, for the processes of the account pool.
+#    init_account_worker: Initialize a process of the account pool.
+#    run_account: Inventory one account, with the credentials of an assumed role.
+#    run_accounts: Inventory several accounts in a pool of processes.
+#    build_parser / parse_args: Build the parser of the command-line arguments, and parse and check them.
 #
 # Usage:
 #    Run the script with appropriate command-line arguments to perform the inventory.
 #    Example: python new_inventory_api.py --resource-dir resources --with-meta --with-extra --with-empty
+#    Example: python new_inventory_api.py --engine asyncio --max-in-flight 1000
+#    Example: python new_inventory_api.py --rate-limit 10 --max-attempts 15
+#    Example: python new_inventory_api.py --dry-run
+#    Example: python new_inventory_api.py --workers 16 --min-workers 4 --max-workers 128
+#    Example: python new_inventory_api.py --resume 20250101_120000
+#    Example: python new_inventory_api.py --format ndjson
+#    Example: python new_inventory_api.py --format sqlite
+#    Example: python new_inventory_api.py --encoder orjson --compact --compress zstd
+#    Example: python new_inventory_api.py --no-plan-cache
+#    Example: python new_inventory_api.py --incremental
+#    Example: python new_inventory_api.py --detail-cache-ttl 3600 --persist-detail-cache
+#    Example: python new_inventory_api.py --role-arn arn:aws:iam::111111111111:role/Inventory arn:aws:iam::222222222222:role/Inventory
+#    Example: python new_inventory_api.py --organization-unit ou-ab12-cd34ef56 --role-name OrganizationAccountAccessRole --account-processes 8
 
 
 # ------------------------------------------------------------------------------
@@ -46,19 +98,37 @@
 # ------------------------------------------------------------------------------
 
 import threading
-import boto3
+import asyncio
 import json
-import yaml
 import os
 import sys
-from datetime import datetime
+from datetime import datetime, timezone
 import time
 import argparse
+import hashlib
 import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import io
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 import glob
-from utils import write_log, transform_function_name, json_serial, is_empty, get_all_regions, test_region_connectivity  # Importer les fonctions utilitaires
+from utils import write_log, close_log, transform_function_name, is_empty, sort_results, get_all_regions, test_region_connectivity  # Importer les fonctions utilitaires
+from client_pool import ClientPool
+from pagination import iter_pages, strip_pagination_keys
+from async_engine import AsyncEngine
+from rate_limiter import RateLimiter
+from availability import ServiceAvailability, enabled_regions
+from concurrency import AdaptiveConcurrency
+from timing_history import TimingHistory
+from checkpoint import Journal
+from telemetry import CallTelemetry
+from metrics import ShardedCounters
+from plan import InventoryPlan, compile_plan, load_plan, as_node_spec
+from snapshot import SnapshotStore
+from detail_cache import DetailCache
+from sinks import open_sink, SINK_FORMATS
+from encoders import JsonEncoder, write_json, available_encoders, available_compressions, ENCODERS, COMPRESSIONS
+from accounts import AssumedRole, account_of_role, role_arn_of_account, list_organization_accounts, DEFAULT_ROLE_NAME
 from botocore.exceptions import EndpointConnectionError, ClientError  # Ajout des exceptions
 
 # ------------------------------------------------------------------------------
@@ -72,6 +142,15 @@ log_dir = "log"
 if not os.path.exists(log_dir):
     os.makedirs(log_dir)
 
+# Directory of the timing history of the tasks (one file per account)
+history_dir = "history"
+
+# Directory of the compiled inventory plans (one file per resource directory)
+cache_dir = "cache"
+
+# Directory of the snapshots of the incremental mode (one store per account)
+snapshot_dir = "snapshots"
+
 # Ensure output directory exists
 output_dir = "output"
 if not os.path.exists(output_dir):
@@ -80,395 +159,1158 @@ if not os.path.exists(output_dir):
 # Create a timestamped log file
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 log_file_path = os.path.join(log_dir, f"log_{timestamp}.log")
+metrics_file_path = os.path.join(log_dir, f"metrics_{timestamp}.json")
+calls_file_path = os.path.join(log_dir, f"calls_{timestamp}.jsonl")
+
+# Identifier of the run, in the names of the inventory and journal files (the one of the resumed run with --resume)
+run_id = timestamp
+journal_file_path = os.path.join(output_dir, f"journal_{run_id}.jsonl")
 
 # Global variables
-boto3_clients = {}  # Dictionary to store boto3 clients for different resources and regions
 results = {}  # Dictionary to store the inventory results
+results_lock = threading.Lock()  # Lock protecting the results while the pages are merged
 account_id = None  # AWS account ID
+journal = None  # Journal of the completed tasks
+output_sink = None  # Writer of the records (--format ndjson, sqlite or parquet)
+snapshot_store = None  # Store of the last snapshot (--incremental)
+detail_cache = None  # Cache of the detail calls
+assumed_role = None  # Role assumed in the inventoried account (multi-account mode), None for the default credentials
+worker_plan = None  # Inventory plan of a process of the account pool
+source_client_pool = None  # Clients with the default credentials, assuming the roles in a process of the account pool
+
+# Command-line options (overridden in the main function)
+resource_dir = 'resources'
+with_meta = False
+with_extra = False
+with_empty = False
+engine = 'threads'
+max_in_flight = 512
+output_format = 'json'
+json_encoder = 'auto'
+compact_output = False
+compression = None
+max_attempts = 10
+prune = True
+dry_run = False
+use_plan_cache = True
+incremental = False
+use_detail_cache = True
+detail_cache_ttl = 900
+detail_cache_mb = 64
+persist_detail_cache = False
+role_session_name = 'aws-inventory'
+role_duration = 3600
+external_id = None
+show_progress = True
+
+progress_bar = None  # Progress bar object
+
+# Counters of the run, incremented by all the workers (sharded per thread, merged when read):
+#    total_tasks: the total number of tasks
+#    completed_tasks: the number of completed tasks
+#    successful_resources / failed_resources / skipped_resources: the outcome of the resource responses
+#    empty_resources / filled_resources: the successful resource responses without or with data
+#    pruned_tasks: the tasks not scheduled, the service being unavailable in the region
+#    resumed_tasks: the tasks completed in the journal of the resumed run
+#    skipped_details: the detail calls not made, the items being unchanged since the last snapshot (--incremental)
+counter_names = ['total_tasks', 'completed_tasks', 'successful_resources', 'failed_resources', 'skipped_resources',
+                 'empty_resources', 'filled_resources', 'pruned_tasks', 'resumed_tasks', 'skipped_details']
+counters = ShardedCounters(counter_names)
+
+# The number of threads starts at num_threads, then it is adjusted at runtime between min_workers and max_workers,
+# from the latency and the throttle rate of the API calls (the workload is I/O bound, not CPU bound)
+num_threads = 32
+min_workers = 4
+max_workers = 256
+adaptive_workers = AdaptiveConcurrency(num_threads, min_workers, max_workers)
+
+# Detail calls run in their own bounded pool, so they can't crowd out the inventory calls
+num_detail_threads = num_threads
+detail_executor = ThreadPoolExecutor(max_workers=num_detail_threads, thread_name_prefix='detail')
+
+# Rate limits of the API calls, per (boto_resource_name, region), lowered when AWS throttles the calls
+rate_limiter = RateLimiter()
+
+# One JSON record per API call (service, region, operation, duration, retries, size...) in the calls file
+call_telemetry = CallTelemetry(calls_file_path)
+
+# ------------------------------------------------------------------------------
+
+def create_client_pool(max_pool_connections, credentials=None):
+    """
+    Create the pool of boto3 clients. Each new client is rate limited, and its throttled calls are retried.
+
+    Args:
+        max_pool_connections (int): The maximum number of HTTPS connections kept by each client.
+        credentials (botocore.credentials.Credentials): The credentials of the clients (ex: of an assumed role), None for the default credentials.
+
+    Returns:
+        ClientPool: The new pool.
+    """
+
+    return ClientPool(max_pool_connections=max_pool_connections, client_hooks=[rate_limiter.register, adaptive_workers.register, call_telemetry.register],
+                      max_attempts=max_attempts, credentials=credentials)
+
+# ------------------------------------------------------------------------------
+
+# Shared boto3 clients, built once per (boto_resource_name, region) and reused by all the tasks
+client_pool = create_client_pool(max_workers + num_detail_threads)
+
+# ------------------------------------------------------------------------------
+
+# Task Class
+
+# ------------------------------------------------------------------------------
+
+class InventoryTask:
+
+    """Schedulable unit of work: one inventory node of one resource in one region."""
+
+    def __init__(self, category, region_name, resource, boto_resource_name, node_name, node, progress_callback):
+        """
+        Initialize a new instance of the class.
+        Args:
+            category (str): The category of the resource.
+            region_name (str): The name of the AWS region.
+            resource (str): The specific resource type.
+            boto_resource_name (str): The name of the boto resource.
+            node_name (str): The name of the inventory node (ex: 'Buckets').
+            node (NodeSpec or dict): Details about the node (function to call, details...).
+            progress_callback (callable): A callback function to report progress.
+        """
+
+        self.category = category
+        self.region_name = region_name
+        self.resource = resource
+        self.boto_resource_name = boto_resource_name
+        self.node_name = node_name
+        self.node = node
+        self.progress_callback = progress_callback
+        self.duration = None
+        self.stored_pages = [] # the pages stored by the task, for the journal
+
+    @property
+    def key(self):
+        """str: The (resource, node, region) identifier of the task."""
+        return f"{self.resource}/{self.node_name} in {self.region_name}"
+
+    def run(self):
+        """Run the inventory task, keep its duration and journal it once completed."""
+        start_time = time.time()
+        object_type = inventory_handling(self.category, self.region_name, self.resource, self.boto_resource_name, self.node_name, self.node, self.progress_callback,
+                                         self.stored_pages if journal else None)
+        self.duration = time.time() - start_time
+        self.checkpoint(object_type)
+
+    async def run_async(self, engine):
+        """Run the inventory task with the asyncio engine, keep its duration and journal it once completed."""
+        start_time = time.time()
+        object_type = await async_inventory_handling(engine, self.category, self.region_name, self.resource, self.boto_resource_name, self.node_name, self.node,
+                                                     self.progress_callback, self.stored_pages if journal else None)
+        self.duration = time.time() - start_time
+        self.checkpoint(object_type)
+
+    def checkpoint(self, object_type):
+        """
+        Journal the items of the task, if it completed (failed tasks are run again when the run is resumed).
+        With the incremental mode, the items replace the ones of the task in the snapshot.
+        With an output sink (NDJSON, SQLite, Parquet), the items are written out and removed from the results, so the memory stays flat.
+        """
+        if not object_type:
+            return
+        if snapshot_store:
+            snapshot_store.commit(self.category, self.resource, self.node_name, self.region_name, object_type)
+        if output_sink:
+            items = pop_stored_items(self.category, self.resource, object_type, self.region_name)
+            write_records(self.category, self.resource, object_type, self.region_name, items)
+        if journal:
+            # Only the items of the task: another node may store items of the same object type in the same region
+            journal.record(self, object_type, merge_pages(self.stored_pages))
+            self.stored_pages = []
+
+# ------------------------------------------------------------------------------
+
+# Inventory Management Functions
+
+# ------------------------------------------------------------------------------
+
+def get_client_region(resource, region_name):
+
+    """
+    Get the region of the client to use for a resource in a region.
+
+    Args:
+        resource (str): The type of AWS resource to inventory.
+        region_name (str): The AWS region name, or 'global'.
+
+    Returns:
+        str: The region of the client, or None for the default region.
+    """
+
+    # --- Some exceptions for EC2 that needs a region even when global (ex : DescribeRegions)
+
+    if region_name != 'global':
+        return region_name
+    elif resource == 'ec2':
+        return 'us-east-1'
+    else:
+        return None
+
+# ------------------------------------------------------------------------------
+
+def get_client(resource, boto_resource_name, region_name):
+
+    """
+    Get the pooled boto3 client to use for a resource in a region.
+
+    Args:
+        resource (str): The type of AWS resource to inventory.
+        boto_resource_name (str): The name used in boto3.
+        region_name (str): The AWS region name, or 'global'.
+
+    Returns:
+        botocore.client.BaseClient: The shared client.
+    """
+
+    return client_pool.get_client(boto_resource_name.lower(), get_client_region(resource, region_name))
+
+# ------------------------------------------------------------------------------
+
+def get_detail_param_value(item, item_search_id, detail_param):
+
+    """
+    Finds the value to give to a detail function for an inventory item.
+
+    Args:
+        item (any): The inventory item (a dict, a string, a list or a tuple).
+        item_search_id (str): The key in the item to use as an identifier.
+        detail_param (str): The parameter of the detail function.
+
+    Returns:
+        any: The value of the detail parameter.
+    """
+
+    if isinstance(item, tuple):
+        if item[1]:
+            return item[1]
+        elif isinstance(item[0], dict):
+            return item[0].get(item_search_id, None)
+        else:
+            return None
+    elif isinstance(item, dict):
+        return item[item_search_id]
+    elif isinstance(item, list):
+        detail_param_tmp = item[0]
+        if isinstance(detail_param_tmp, str):
+            return detail_param_tmp
+        else:
+            return detail_param_tmp[detail_param]
+    else:
+        return item
+
+# ------------------------------------------------------------------------------
+
+def get_detail_calls(inventory, node, resource, key, unchanged=None):
+
+    """
+    Lists the detail calls to make for the items of an inventory.
+
+    Args:
+        inventory (dict): The inventory containing items to be processed.
+        node (NodeSpec or dict): The inventory node specifying details to be retrieved.
+        resource (str): The type of resource being processed (e.g., 's3').
+        key (str): The key of the items in the inventory (e.g., 'Buckets').
+        unchanged (dict): The items unchanged since the last snapshot, by index: they get no detail call.
+
+    Returns:
+        list: (index, item, detail, detail_function, detail_param, detail_param_value, complementary_params) tuples, in the order of the items and of the details.
+    """
+
+    global account_id
+
+    inventory_item = inventory[key]
+    the_node_details = as_node_spec(node).details
+    detail_calls = []
+
+    # Loop over the inventory items to retrieve the detail
+
+    for index, item in enumerate(inventory_item):
+
+        if unchanged and index in unchanged:
+            continue
+
+        for detail in the_node_details:
+
+            detail_param_value = get_detail_param_value(item, detail.item_search_id, detail.detail_param)
+            complementary_params = detail.complementary_params
+
+            # exception for s3 location: we need an additionnal arg (account id)
+
+            if resource == 's3' and detail.detail_function == 'get_bucket_location':
+                complementary_params = {**(complementary_params or {}), 'ExpectedBucketOwner': account_id}
+
+            detail_calls.append((index, item, detail.name, detail.detail_function, detail.detail_param, detail_param_value, complementary_params))
+
+    return detail_calls
+
+# ------------------------------------------------------------------------------
+
+def strip_metadata(response):
+
+    """
+    Removes the 'ResponseMetadata' of a response, unless asked (arg 'with_meta').
+
+    Args:
+        response (dict): The response of a function.
+
+    Returns:
+        dict: The response.
+    """
+
+    if not with_meta and isinstance(response, dict):
+        response.pop('ResponseMetadata', None)
+    return response
+
+# ------------------------------------------------------------------------------
+
+def log_detail_call(detail_function, detail_param, detail_param_value, complementary_params, detail_response):
+
+    """
+    Logs a successful detail call and cleans its response.
+
+    Args:
+        detail_function (str): The detail function called.
+        detail_param (str): The parameter of the detail function.
+        detail_param_value (any): The value of the parameter.
+        complementary_params (dict): Other parameters of the detail function, if any.
+        detail_response (dict): The response of the detail function.
+
+    Returns:
+        dict: The detail response, without 'ResponseMetadata' unless asked (arg 'with_meta').
+    """
+
+    if complementary_params:
+        write_log(f"Calling detail {detail_function} with params {detail_param}: {detail_param_value} and complementary params: {complementary_params}", log_file_path)
+    else:
+        write_log(f"Calling detail {detail_function} with params {detail_param}: {detail_param_value}", log_file_path)
+    return strip_metadata(detail_response)
+
+# ------------------------------------------------------------------------------
+
+def handle_detail_error(e, detail_function, detail_param, detail_param_value):
+
+    """
+    Handles an exception raised by a detail call.
+
+    Args:
+        e (Exception): The exception.
+        detail_function (str): The detail function called.
+        detail_param (str): The parameter of the detail function.
+        detail_param_value (any): The value of the parameter.
+
+    Raises:
+        ClientError: If the error comes from another function than the detail function.
+
+    Returns:
+        dict: An empty detail response.
+    """
+
+    if isinstance(e, ClientError):
+
+        exception_function_name = transform_function_name(e.operation_name)
+        if exception_function_name != detail_function:
+            raise e
+
+    else:
+
+        write_log(f"Error (e2) calling detail {detail_function} with params {detail_param}: {detail_param_value}: {e} ({type(e)})", log_file_path)
+
+    return {}
+
+# ------------------------------------------------------------------------------
+
+def call_detail(client, detail_function, detail_param, detail_param_value, complementary_params):
+
+    """
+    Calls a detail function for one inventory item. Called through the detail executor.
+    The response comes from the detail cache when the same call was already made (or is in flight).
+
+    Args:
+        client (object): The client object used to call the detail function.
+        detail_function (str): The detail function to call.
+        detail_param (str): The parameter of the detail function.
+        detail_param_value (any): The value of the parameter.
+        complementary_params (dict): Other parameters of the detail function, if any.
+
+    Raises:
+        ClientError: If an error occurs while calling another function than the detail function.
+
+    Returns:
+        dict: The detail response, empty in case of error.
+    """
+
+    params = {detail_param: detail_param_value, **(complementary_params or {})}
+
+    try:
+        if detail_cache:
+            key = DetailCache.key(client.meta.service_model.service_name, client.meta.region_name, detail_function, params)
+            detail_response = detail_cache.call(key, lambda: strip_metadata(getattr(client, detail_function)(**params)))
+        else:
+            detail_response = getattr(client, detail_function)(**params)
+        return log_detail_call(detail_function, detail_param, detail_param_value, complementary_params, detail_response)
+    except Exception as e:
+        return handle_detail_error(e, detail_function, detail_param, detail_param_value)
+
+# ------------------------------------------------------------------------------
+
+async def async_call_detail(engine, client, detail_function, detail_param, detail_param_value, complementary_params):
+
+    """
+    Calls a detail function for one inventory item, with the asyncio engine.
+
+    Args:
+        engine (AsyncEngine): The asyncio engine.
+        client (object): The client object used to call the detail function.
+        detail_function (str): The detail function to call.
+        detail_param (str): The parameter of the detail function.
+        detail_param_value (any): The value of the parameter.
+        complementary_params (dict): Other parameters of the detail function, if any.
+
+    Raises:
+        ClientError: If an error occurs while calling another function than the detail function.
+
+    Returns:
+        dict: The detail response, empty in case of error.
+    """
+
+    params = {detail_param: detail_param_value, **(complementary_params or {})}
+
+    try:
+        if detail_cache:
+            key = DetailCache.key(client.meta.service_model.service_name, client.meta.region_name, detail_function, params)
+            async def fetch():
+                return strip_metadata(await engine.call(client, detail_function, detail=True, **params))
+            detail_response = await detail_cache.async_call(key, fetch)
+        else:
+            detail_response = await engine.call(client, detail_function, detail=True, **params)
+        return log_detail_call(detail_function, detail_param, detail_param_value, complementary_params, detail_response)
+    except Exception as e:
+        return handle_detail_error(e, detail_function, detail_param, detail_param_value)
+
+# ------------------------------------------------------------------------------
+
+def get_detail_batches(detail_calls, node):
+
+    """
+    Groups the detail calls of the batched details (the ones with a 'batch_size'): one call per batch of distinct identifiers.
+
+    Args:
+        detail_calls (list): The detail calls, as returned by get_detail_calls.
+        node (NodeSpec or dict): The inventory node specifying details to be retrieved.
+
+    Returns:
+        tuple: The (detail, identifiers, complementary_params) batches, and the positions of the detail calls to make one by one.
+    """
+
+    batched_details = {detail.name: detail for detail in as_node_spec(node).details if detail.batch_size}
+    batched_values = {}
+    complementary = {}
+    single_calls = []
+
+    for position, detail_call in enumerate(detail_calls):
+        detail, detail_param_value, complementary_params = detail_call[2], detail_call[5], detail_call[6]
+        if detail not in batched_details or not isinstance(detail_param_value, (str, int)):
+            single_calls.append(position)
+            continue
+        batched_values.setdefault(detail, {})[detail_param_value] = None # distinct, in the order of the items
+        complementary.setdefault(detail, complementary_params)
+
+    batches = []
+    for detail, values in batched_values.items():
+        values = list(values)
+        batch_size = batched_details[detail].batch_size
+        for start in range(0, len(values), batch_size):
+            batches.append((batched_details[detail], values[start:start + batch_size], complementary[detail]))
+
+    return batches, single_calls
+
+# ------------------------------------------------------------------------------
+
+def split_batch_response(detail, values, detail_response):
+
+    """
+    Splits the response of a batched detail call back to the items.
+
+    Args:
+        detail (DetailSpec): The batched detail.
+        values (list): The identifiers of the batch.
+        detail_response (dict): The response of the detail function (empty in case of error).
+
+    Returns:
+        dict: The detail response of each identifier, as if the detail function had been called for it alone
+        (the detail under the detail name, or an empty response if the detail was not found).
+    """
+
+    response_key = detail.batch_response_key
+    if response_key is None:
+        # The first list of objects, the lists of failures apart
+        response_key = next((name for name, value in detail_response.items()
+                             if isinstance(value, list) and value and isinstance(value[0], dict) and 'fail' not in name.lower()), None)
+
+    wanted = set(values)
+    responses = {value: {} for value in values}
+
+    for element in detail_response.get(response_key) or []:
+        if not isinstance(element, dict):
+            continue
+        if detail.batch_response_id:
+            identities = [element.get(detail.batch_response_id)]
+        else:
+            identities = [value for value in element.values() if isinstance(value, (str, int)) and value in wanted]
+        for identity in identities:
+            if identity in wanted:
+                responses[identity] = {detail.name: element}
+                break
+
+    return responses
+
+# ------------------------------------------------------------------------------
+
+def merge_detail(inventory, key, index, item, detail, detail_response):
+
+    """
+    Adds a detail response to an inventory item.
+
+    Args:
+        inventory (dict): The inventory containing the item.
+        key (str): The key of the items in the inventory (e.g., 'Buckets').
+        index (int): The index of the item in the inventory.
+        item (any): The inventory item.
+        detail (str): The detail name (the key of the detail in the response, or 'None' for the whole response).
+        detail_response (dict): The response of the detail function.
+
+    Returns:
+        None
+    """
+
+    # The response is sometimes empty, sometimes a string, sometimes a list or a dict
+
+    if len(detail_response) > 0 or with_empty:
+
+        if detail != "":
+            if detail != 'None':
+                if detail_response and detail not in detail_response:
+                    # A wrong detail name in the resource file, or a changed response: nothing is merged
+                    write_log(f"Detail {detail} not found in the response (keys: {list(detail_response)}), not merged in item {index} of {key}", log_file_path)
+                    return
+                detail_response = {detail: detail_response.get(detail)}
+        else:
+            detail_response = {detail: detail_response}
+
+        # Now we add the detail to the inventory
+
+        try:
+            if isinstance(item, tuple):
+                item[1][1].update(detail_response)
+            elif isinstance(item, dict):
+                if detail in item and isinstance(item[detail], dict):
+                    item[detail].update(detail_response[detail])
+                else:
+                    item.update(detail_response)
+            elif isinstance(item, list):
+                tmp_item = item[0]
+                if isinstance(tmp_item, str):
+                    item = [tmp_item, detail_response]
+                elif isinstance(tmp_item, dict):
+                    if detail in tmp_item and isinstance(tmp_item[detail], dict):
+                        tmp_item[detail].update(detail_response[detail])
+                    else:
+                        tmp_item.update(detail_response)
+                else:
+                    item[0] = detail_response
+            elif isinstance(item, str):
+                inventory[key][index] = [item, detail_response]
+            else:
+                raise TypeError(f"Unsupported item type: {type(item)}")
+        except (TypeError, AttributeError) as ei:
+            write_log(f"Error updating inventory with detail {detail_response}: {ei} ({type(ei)})", log_file_path)
+
+# ------------------------------------------------------------------------------
+
+def detail_handling(client, inventory, node, resource, key, unchanged=None):
+
+    """
+    Handles the details of inventory items by calling specified detail functions on the client.
+
+    The detail calls are submitted to the shared detail executor, so they run concurrently, and their
+    responses are merged back in the order of the items and of the details in the node.
+
+    Args:
+        client (object): The client object used to call detail functions.
+        inventory (dict): The inventory containing items to be processed.
+        node (NodeSpec or dict): The inventory node specifying details to be retrieved.
+        resource (str): The type of resource being processed (e.g., 's3').
+        key (str): The key of the items in the inventory (e.g., 'Buckets').
+        unchanged (dict): The items unchanged since the last snapshot, by index: their details are taken from the snapshot.
+
+    Raises:
+        ClientError: If an error occurs while calling the detail function on the client.
+
+    Returns:
+        None
+    """
+
+    # Calling all the corresponding detail resources (see 'extra_resource_call.json')
+
+    detail_calls = get_detail_calls(inventory, node, resource, key, unchanged)
+    batches, single_calls = get_detail_batches(detail_calls, node)
+    futures = {position: detail_executor.submit(call_detail, client, *detail_calls[position][3:]) for position in single_calls}
+    batch_futures = [detail_executor.submit(call_detail, client, detail.detail_function, detail.detail_param, values, complementary_params)
+                     for detail, values, complementary_params in batches]
+
+    batch_responses = {}
+    for (detail, values, _), future in zip(batches, batch_futures):
+        batch_responses.setdefault(detail.name, {}).update(split_batch_response(detail, values, future.result()))
+
+    # Now we add the details to the inventory, in a deterministic order
+
+    for position, detail_call in enumerate(detail_calls):
+        index, item, detail = detail_call[:3]
+        detail_response = futures[position].result() if position in futures else batch_responses[detail][detail_call[5]]
+        merge_detail(inventory, key, index, item, detail, detail_response)
+
+    reuse_details(inventory, node, key, unchanged)
+
+# ------------------------------------------------------------------------------
+
+async def async_detail_handling(engine, client, inventory, node, resource, key, unchanged=None):
+
+    """
+    Handles the details of inventory items with the asyncio engine. Same behaviour as detail_handling.
+
+    Args:
+        engine (AsyncEngine): The asyncio engine.
+        client (object): The client object used to call detail functions.
+        inventory (dict): The inventory containing items to be processed.
+        node (NodeSpec or dict): The inventory node specifying details to be retrieved.
+        resource (str): The type of resource being processed (e.g., 's3').
+        key (str): The key of the items in the inventory (e.g., 'Buckets').
+        unchanged (dict): The items unchanged since the last snapshot, by index: their details are taken from the snapshot.
+
+    Raises:
+        ClientError: If an error occurs while calling the detail function on the client.
+
+    Returns:
+        None
+    """
+
+    detail_calls = get_detail_calls(inventory, node, resource, key, unchanged)
+    batches, single_calls = get_detail_batches(detail_calls, node)
+    responses = await asyncio.gather(*(async_call_detail(engine, client, *detail_calls[position][3:]) for position in single_calls),
+                                     *(async_call_detail(engine, client, detail.detail_function, detail.detail_param, values, complementary_params)
+                                       for detail, values, complementary_params in batches))
+    single_responses = dict(zip(single_calls, responses))
+
+    batch_responses = {}
+    for (detail, values, _), response in zip(batches, responses[len(single_calls):]):
+        batch_responses.setdefault(detail.name, {}).update(split_batch_response(detail, values, response))
+
+    for position, detail_call in enumerate(detail_calls):
+        index, item, detail = detail_call[:3]
+        detail_response = single_responses[position] if position in single_responses else batch_responses[detail][detail_call[5]]
+        merge_detail(inventory, key, index, item, detail, detail_response)
+
+    reuse_details(inventory, node, key, unchanged)
+
+# ------------------------------------------------------------------------------
+
+def reuse_details(inventory, node, key, unchanged):
+
+    """
+    Puts back the items unchanged since the last snapshot, with the details they had then.
+
+    Args:
+        inventory (dict): The inventory containing items to be processed.
+        node (NodeSpec or dict): The inventory node specifying details to be retrieved.
+        key (str): The key of the items in the inventory (e.g., 'Buckets').
+        unchanged (dict): The items unchanged since the last snapshot (with their details), by index.
+
+    Returns:
+        None
+    """
+
+    if not unchanged or not isinstance(inventory[key], list):
+        return
+
+    for index, previous_item in unchanged.items():
+        inventory[key][index] = previous_item
+    counters.increment('skipped_details', len(unchanged) * len(as_node_spec(node).details))
+
+# ------------------------------------------------------------------------------
+
+def store_results(category, resource, object_type, region_name, items=None, response_metadata=None):
+
+    """
+    Stores a page of inventory items in the results. Several pages of the same node are merged.
+
+    Args:
+        category (str): The category of the resource.
+        resource (str): The type of AWS resource.
+        object_type (str): The key of the items in the response (e.g., 'Buckets').
+        region_name (str): The AWS region name, or 'global'.
+        items (list or dict): The items of the page. If None, only the structure is created.
+        response_metadata (dict): The response metadata, stored only if the items are a dict.
+
+    Returns:
+        None
+    """
+
+    with results_lock:
+
+        region_results = results.setdefault(category, {}).setdefault(resource, {}).setdefault(object_type, {})
+
+        if items is None:
+            return
+
+        previous_items = region_results.get(region_name)
+        if isinstance(previous_items, list) and isinstance(items, list):
+            previous_items.extend(items)
+        elif isinstance(previous_items, dict) and isinstance(items, dict):
+            previous_items.update(items)
+        else:
+            region_results[region_name] = items
+
+        if response_metadata and isinstance(region_results[region_name], dict):
+            # MetaData only if the key is present and if we asked for it (arg 'with_meta')
+            region_results[region_name]['ResponseMetadata'] = response_metadata
+
+# ------------------------------------------------------------------------------
+
+def merge_pages(pages):
+
+    """
+    Merges the stored pages of a task, like store_results merges them in the results.
+
+    Args:
+        pages (list): The items of each page (lists, or dicts).
+
+    Returns:
+        list or dict: A new list (or dict) of the items, or None if no page was stored.
+    """
+
+    if not pages:
+        return None
+    if all(isinstance(page, list) for page in pages):
+        return [item for page in pages for item in page]
+    merged = {}
+    for page in pages:
+        if isinstance(page, dict):
+            merged.update(page)
+    return merged
+
+# ------------------------------------------------------------------------------
+
+def pop_stored_items(category, resource, object_type, region_name):
+
+    """
+    Removes the items stored for an object type in a region from the results.
+
+    Args:
+        category (str): The category of the resource.
+        resource (str): The type of AWS resource.
+        object_type (str): The key of the items in the response (e.g., 'Buckets').
+        region_name (str): The AWS region name, or 'global'.
+
+    Returns:
+        list or dict: The stored items, or None if nothing was stored.
+    """
+
+    with results_lock:
+
+        return results.get(category, {}).get(resource, {}).get(object_type, {}).pop(region_name, None)
+
+# ------------------------------------------------------------------------------
+
+def write_records(category, resource, object_type, region_name, items):
+
+    """
+    Writes inventory items to the output sink: one record per item of a list, one record for a dict.
+    The records of a call have the same collection time.
+
+    Args:
+        category (str): The category of the resource.
+        resource (str): The type of AWS resource.
+        object_type (str): The key of the items in the response (e.g., 'Buckets').
+        region_name (str): The AWS region name, or 'global'.
+        items (list or dict): The items, or None if nothing was stored.
+
+    Returns:
+        None
+    """
+
+    if items is None:
+        return
+
+    collected_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    for item in items if isinstance(items, list) else [items]:
+        output_sink.write({'category': category, 'resource': resource, 'object_type': object_type, 'region': region_name, 'collected_at': collected_at, 'item': item})
+
+# ------------------------------------------------------------------------------
 
-# Progress counters
-total_tasks = 0  # Counter for the total number of tasks
-completed_tasks = 0  # Counter for the number of completed tasks
-progress_bar = None  # Progress bar object
+def prepare_page(category, resource, region_name, page, object_type):
 
-# resource response counters
-successful_resources = 0  # Counter for the number of successful resource responses
-failed_resources = 0  # Counter for the number of failed resource responses
-skipped_resources = 0  # Counter for skipped resources
-empty_resources = 0
-filled_resources = 0
+    """
+    Prepares a page of an inventory call before its details are retrieved and it is stored.
 
-# Determine the number of CPU cores
-num_cores = multiprocessing.cpu_count()
+    Args:
+        category (str): The category of the resource.
+        resource (str): The type of AWS resource.
+        region_name (str): The AWS region name, or 'global'.
+        page (dict): The response of the inventory call (not modified: the paginator still needs its tokens).
+        object_type (str): The object type found in the previous pages, or None for the first page.
 
-# Set the number of threads to 2 to 4 times the number of CPU cores
-num_threads = num_cores * 4  # You can adjust this multiplier based on your needs
-# num_threads = 1 # For test purposes with no MT
+    Returns:
+        tuple: (inventory, response_metadata, object_type, to_store), where 'to_store' tells if the page has to be stored.
+    """
 
-# ------------------------------------------------------------------------------
+    inventory = dict(page)
 
-# Multithreading Class
+    # --- Cmd line arg "with-meta" ('ResponseMetaData)
 
-# ------------------------------------------------------------------------------
+    response_metadata = inventory.pop('ResponseMetadata', None)
 
-class InventoryThread(threading.Thread):
+    # --- Constructing the inventory
 
-    """Thread class for performing inventory tasks."""
+    strip_pagination_keys(inventory) # no "NextToken" or other pagination keys
 
-    def __init__(self, category, region_name, resource, boto_resource_name, node_details, key, progress_callback):
-        """
-        Initialize a new instance of the class.
-        Args:
-            category (str): The category of the resource.
-            region_name (str): The name of the AWS region.
-            resource (str): The specific resource type.
-            boto_resource_name (str): The name of the boto resource.
-            node_details (dict): Details about the node.
-            key (str): The key associated with the resource.
-            progress_callback (callable): A callback function to report progress.
-        """
+    empty_items = True # a result is considered as 'empty' if it has no interesting value ('NextToken' or 'ResponseMetada' have no intersting value for an inventory)
 
-        threading.Thread.__init__(self)
-        self.category = category
-        self.region_name = region_name
-        self.resource = resource
-        self.boto_resource_name = boto_resource_name
-        self.key = key
-        self.node_details = node_details
-        self.progress_callback = progress_callback
+    for key, value in inventory.items():
+        if not is_empty(value):
+            empty_items = False
+            break
 
-    def run(self):
-        """Run the inventory task."""
-        inventory_handling(self.category, self.region_name, self.resource, self.boto_resource_name, self.node_details, self.key, self.progress_callback)
+    if object_type is None:
+        object_type = list(inventory.keys())[0] if inventory else 'Unknown'
+        store_results(category, resource, object_type, region_name)
 
-# ------------------------------------------------------------------------------
+    # --- Stored if not empty, or we want to list the empty values too (arg 'with_empty')
 
-# Inventory Management Functions
+    to_store = (not empty_items or with_empty) and object_type in inventory
+
+    return inventory, response_metadata if with_meta else None, object_type, to_store
 
 # ------------------------------------------------------------------------------
 
-def detail_handling(client, inventory, node_details, resource, key):
+def handle_inventory_error(e, resource, region_name, func):
 
     """
-    Handles the details of inventory items by calling specified detail functions on the client.
+    Logs and counts an exception raised by an inventory call.
 
     Args:
-        client (object): The client object used to call detail functions.
-        inventory (dict): The inventory containing items to be processed.
-        node_details (dict): The node in the inventory specifying details to be retrieved.
-        resource (str): The type of resource being processed (e.g., 's3').
-        account_id (str): The account ID used for certain resource types.
-
-    Raises:
-        ClientError: If an error occurs while calling the detail function on the client.
+        e (Exception): The exception.
+        resource (str): The type of AWS resource.
+        region_name (str): The AWS region name, or 'global'.
+        func (str): The inventory function called.
 
     Returns:
         None
     """
 
-    global account_id, with_empty
-
-    inventory_item = inventory[key]
-
-    for index, item in enumerate(inventory_item):
-
-        the_node_details = node_details[key]['details']
-
-        for detail in the_node_details:
-
-            the_details = the_node_details[detail]
-
-            item_search_id = the_details['item_search_id']
-            detail_function = the_details['detail_function']
-            detail_param = the_details['detail_param']   
-            complementary_params = the_details.get('complementary_param', None)
+    if isinstance(e, AttributeError):
 
-            # Loop over the inventory items to retrieve the detail
-
-            if isinstance(item, tuple):
-                if item[1]:
-                    detail_param_value = item[1]
-                else:
-                    detail_param_value = item.get(item_search_id, None)
-            elif isinstance(item, dict):
-                detail_param_value = item[item_search_id]
-            elif isinstance(item, list):
-                detail_param_tmp = item[0]
-                if isinstance(detail_param_tmp, str):
-                    detail_param_value = detail_param_tmp
-                else:
-                    detail_param_value = detail_param_tmp[detail_param]
-            else:
-                detail_param_value = item
+        write_log(f"Error (1) querying {resource} in {region_name} using {func}: {e} ({type(e)})", log_file_path)
+        counters.increment('failed_resources')
 
-            # exception for s3 location: we need an additionnal arg (account id)
+    elif isinstance(e, ClientError):
 
-            if resource == 's3' and detail_function == 'get_bucket_location':
-                if not complementary_params:
-                    complementary_params = {'ExpectedBucketOwner': account_id}
-                else:
-                    complementary_params.update({'ExpectedBucketOwner': account_id})
+        if type(e).__name__ == 'AWSOrganizationsNotInUseException':
 
-            # General case
+            write_log(f"Warning (2): Skipping {resource} in {region_name} due to organizations not in use error: {e} ({type(e)})", log_file_path)
+            counters.increment('skipped_resources')
 
-            detail_response = {}
+        else:
 
-            # Calling all the corresponding detail resources (see 'extra_resource_call.json')
+            write_log(f"Error (3) querying {resource} in {region_name} using {func}: {e} ({type(e)})", log_file_path)
+            counters.increment('failed_resources')
 
-            try:
+    elif isinstance(e, EndpointConnectionError):
 
-                if complementary_params:
-                    detail_response = client.__getattribute__(detail_function)(**{detail_param: detail_param_value, **complementary_params})
-                    write_log(f"Calling detail {detail_function} with params {detail_param}: {detail_param_value} and complementary params: {complementary_params}", log_file_path)
-                else:
-                    detail_response = client.__getattribute__(detail_function)(**{detail_param: detail_param_value})
-                    write_log(f"Calling detail {detail_function} with params {detail_param}: {detail_param_value}", log_file_path)
-                if not with_meta:
-                    detail_response.pop('ResponseMetadata', None)
+        write_log(f"Warning (4): Skipping {resource} in {region_name} due to connection error: {e} ({type(e)})", log_file_path)
+        counters.increment('skipped_resources')
 
-            except ClientError as e1:
+    else:
 
-                exception_function_name = transform_function_name(e1.operation_name)
-                if exception_function_name != detail_function:
-                    raise e1
+        write_log(f"Error (e) querying {resource} in {region_name} using {func}: {e} ({type(e)})", log_file_path)
+        counters.increment('failed_resources')
 
-            except Exception as e2:
+# ------------------------------------------------------------------------------
 
-                write_log(f"Error (e2) calling detail {detail_function} with params {detail_param}: {detail_param_value}: {e2} ({type(e2)})", log_file_path)
+def count_inventory(resource, region_name, filled_items):
 
-            # The response is sometimes empty, sometimes a string, sometimes a list or a dict
+    """
+    Counts a successful inventory of a node.
 
-            if len(detail_response) > 0 or with_empty:
+    Args:
+        resource (str): The type of AWS resource.
+        region_name (str): The AWS region name, or 'global'.
+        filled_items (bool): True if some items were stored.
 
-                if detail != "":
-                    if detail != 'None':
-                        detail_response = {detail: detail_response[detail]}
-                else:
-                    detail_response = {detail: detail_response}
+    Returns:
+        None
+    """
 
-                # Now we add the detail to the inventory
+    counters.increment('successful_resources')
 
-                try:
-                    if isinstance(item, tuple):
-                        item[1][1].update(detail_response)
-                    elif isinstance(item, dict):
-                        if detail in item and isinstance(item[detail], dict):
-                            item[detail].update(detail_response[detail])
-                        else:
-                            item.update(detail_response)
-                    elif isinstance(item, list):
-                        tmp_item = item[0]
-                        if isinstance(tmp_item, str):
-                            item = [tmp_item, detail_response]
-                        elif isinstance(tmp_item, dict):
-                            if detail in tmp_item and isinstance(tmp_item[detail], dict):
-                                tmp_item[detail].update(detail_response[detail])
-                            else:
-                                tmp_item.update(detail_response)
-                        else:
-                            item[0] = detail_response
-                    elif isinstance(item, str):
-                        inventory[key][index] = [item, detail_response]
-                    else:
-                        raise TypeError(f"Unsupported item type: {type(item)}")
-                except (TypeError, AttributeError) as ei:
-                    write_log(f"Error updating inventory with detail {detail_response}: {ei} ({type(ei)})", log_file_path)
-            pass
+    if filled_items:
+        counters.increment('filled_resources')
+    else:
+        # The inventory is empty, but don't forget to count (for the progression bar)
+        counters.increment('empty_resources')
+        write_log(f"Empty results for {resource} in {region_name}", log_file_path)
 
 # ------------------------------------------------------------------------------
 
-
-def inventory_handling(category, region_name, resource, boto_resource_name, node_details, key, progress_callback):
+def inventory_handling(category, region_name, resource, boto_resource_name, node_name, node, progress_callback, stored_pages=None):
 
     """
-    Handles the inventory process for a given AWS resource in a specified region.
+    Handles the inventory process for one inventory node of a given AWS resource in a specified region.
 
     Parameters:
         category (str): The category of the resource.
-        region (str): The AWS region where the resource is located.
+        region_name (str): The AWS region where the resource is located.
         resource (str): The type of AWS resource to inventory.
         boto_resource_name (str): The name used in boto3 (genrally the same, but you have surprises)
-        node_details (dict): Details about the node, including the function to call and any additional details.
-        key (str): A key used for logging or identification purposes.
+        node_name (str): The name of the inventory node (ex: 'Buckets').
+        node (NodeSpec or dict): Details about the node, including the function to call and any additional details.
         progress_callback (function): A callback function to report progress.
-    
-    Returns:
-        None
+        stored_pages (list): If given, the stored items of each page are appended to it (for the journal).
 
-    Raises:
-        AttributeError: If there is an attribute error during the inventory process.
-        ClientError: If there is a client error during the inventory process.
-        EndpointConnectionError: If there is a connection error during the inventory process.
-        Exception: For any other exceptions that occur during the inventory process.
+    Returns:
+        str: The object type of the items if the node was inventoried, None if the inventory failed.
 
     Notes:
     - This function logs the start and end of the inventory process.
     - It handles specific exceptions for EC2 resources that require a region even when global.
     - The function supports threading and reports progress through the progress_callback.
     - It constructs the inventory and handles empty results based on the provided arguments.
-    - Detailed resource information can be retrieved if specified in node_details.
+    - Detailed resource information can be retrieved if specified in the node.
+    - Errors of the inventory calls (AttributeError, ClientError, EndpointConnectionError...) are logged and counted.
     """
 
     # --- Main body of the 'inventory_handling' function
 
-    global account_id, results, successful_resources, failed_resources, skipped_resources, empty_resources, filled_resources
-
-    pass
-    write_log(f"Starting inventory for {resource} in {region_name}", log_file_path)
+    node = as_node_spec(node, node_name)
+    func = node.function
+    snapshot_key = SnapshotStore.key(category, resource, node_name, region_name)
+    write_log(f"Starting inventory for {resource} in {region_name} using {func}", log_file_path)
 
     try:
 
-        # --- Some exceptions for EC2 that needs a region even when global (ex : DescribeRegions)
-
-        if region_name != 'global':
-            client = boto3.client(boto_resource_name.lower(), region_name=region_name)
-        else:
-            if resource == 'ec2':
-                client = boto3.client(boto_resource_name.lower(), region_name='us-east-1')
-            else:
-                client = boto3.client(boto_resource_name.lower())
-
-        # --- Inventory call for the resource. Reminder: called through threading
+        client = get_client(resource, boto_resource_name, region_name)
 
-        # RAJOUTER BOUCLE sur node_details, pour chacun des détails
+        # --- Inventory calls for the node, one per page. Reminder: called through threading
+        #     Each page is detailed and stored as soon as it is received
 
-        for item in node_details:
+        object_type = None
+        filled_items = False
 
-            # Each resource can have multiple nodes. Generally, only one node is used, but some resources require multiple nodes to retrieve all the information.
+        try:
 
-            node = node_details[item]
-            func = node['function']
+            start_time = time.time()
 
-            try:
+            for page in iter_pages(client, func, node):
 
-                # --- API call for the resource 
-                start_time = time.time()
-                inventory = client.__getattribute__(func)()
+                # --- API call for the resource
                 end_time = time.time()
-                successful_resources += 1
                 write_log(f"API call for {resource} in {region_name} for {func} took {end_time - start_time:.2f} seconds", log_file_path)
-            
-            except AttributeError as e1:
 
-                write_log(f"Error (1) querying {resource} in {region_name} using {node_details['function']}: {e1} ({type(e1)})", log_file_path)
-                failed_resources += 1
+                inventory, response_metadata, object_type, to_store = prepare_page(category, resource, region_name, page, object_type)
 
-            except ClientError as e2:
+                if to_store:
 
-                if type(e2).__name__ == 'AWSOrganizationsNotInUseException':
+                    # --- With the incremental mode, the items unchanged since the last snapshot keep their details
 
-                    write_log(f"Warning (2): Skipping {resource} in {region_name} due to organizations not in use error: {e2} ({type(e2)})", log_file_path)
-                    skipped_resources += 1
+                    unchanged = snapshot_store.unchanged_items(snapshot_key, inventory[object_type], node) if snapshot_store else None
 
-                else:
+                    # --- In case of: we want more information about the resource
+                    #     Calling all the corresponding detail resources
+
+                    if node.details:
+                        detail_handling(client, inventory, node, resource, object_type, unchanged)
+
+                    start_time = time.time()
+                    store_results(category, resource, object_type, region_name, inventory[object_type], response_metadata)
+                    if stored_pages is not None:
+                        stored_pages.append(inventory[object_type])
+                    end_time = time.time()
+                    write_log(f"Processing results for {resource} in {region_name} for function {func} took {end_time - start_time:.2f} seconds", log_file_path)
+                    filled_items = True
+
+                start_time = time.time()
 
-                    write_log(f"Error (3) querying {resource} in {region_name} using {node_details['function']}: {e2} ({type(e2)})", log_file_path)
-                    failed_resources += 1
+        except Exception as e:
 
-            except EndpointConnectionError as e3:
+            handle_inventory_error(e, resource, region_name, func)
+            return
 
-                write_log(f"Warning (4): Skipping {resource} in {region_name} due to connection error: {e3} ({type(e3)})", log_file_path)
-                skipped_resources += 1
+        count_inventory(resource, region_name, filled_items)
+        return object_type
 
+    except Exception as e:
+
+        write_log(f"Error (e) querying {resource} in {region_name} using {func}: {e} ({type(e)})", log_file_path)
+
+    finally:
 
-            except Exception as e:
+        progress_callback(1)
+        write_log(f"End of inventory for {resource} in {region_name} using {func}", log_file_path)
 
-                write_log(f"Error (e) querying {resource} in {region_name} using {node_details['function']}: {e} ({type(e)})", log_file_path)
-                failed_resources += 1
+# ------------------------------------------------------------------------------
 
-            # --- Cmd line arg "with-meta" ('ResponseMetaData)
+async def async_inventory_handling(engine, category, region_name, resource, boto_resource_name, node_name, node, progress_callback, stored_pages=None):
 
-            if not with_meta:
-                response_metadata = inventory.pop('ResponseMetadata', None)
+    """
+    Handles the inventory process for one inventory node, with the asyncio engine. Same behaviour as inventory_handling.
 
-            # --- Constructing the inventory
+    Parameters:
+        engine (AsyncEngine): The asyncio engine.
+        category (str): The category of the resource.
+        region_name (str): The AWS region where the resource is located.
+        resource (str): The type of AWS resource to inventory.
+        boto_resource_name (str): The name used in boto3.
+        node_name (str): The name of the inventory node (ex: 'Buckets').
+        node (NodeSpec or dict): Details about the node, including the function to call and any additional details.
+        progress_callback (function): A callback function to report progress.
+        stored_pages (list): If given, the stored items of each page are appended to it (for the journal).
 
-            empty_items = True # a result is considered as 'empty' if it has no interesting value ('NextToken' or 'ResponseMetada' have no intersting value for an inventory)
+    Returns:
+        str: The object type of the items if the node was inventoried, None if the inventory failed.
+    """
 
-            for key, value in inventory.items():
-                if not is_empty(value) and key not in {'NextToken'}:
-                    empty_items = False
-                    break
+    node = as_node_spec(node, node_name)
+    func = node.function
+    snapshot_key = SnapshotStore.key(category, resource, node_name, region_name)
+    write_log(f"Starting inventory for {resource} in {region_name} using {func}", log_file_path)
 
-            object_type = list(inventory.keys())[0] if inventory else 'Unknown'
-            if category not in results:
-                results[category] = {}
-            if resource not in results[category]:
-                results[category][resource] = {}
-            if object_type not in results[category][resource]:
-                results[category][resource][object_type] = {}
+    try:
 
-            if not empty_items or with_empty:
+        client = await engine.get_client(boto_resource_name.lower(), get_client_region(resource, region_name))
 
-				# --- Here: not empty, or we want to list the empty values too (arg 'with_empty')# --- Here: not empty, or we want to list the empty values too (arg 'with_empty')# --- Here: not empty, or we want to list the empty values too (arg 'with_empty')# --- Here: not empty, or we want to list the empty values too (arg 'with_empty')# --- Here: not empty, or we want to list the empty values too (arg 'with_empty')# --- Here: not empty, or we want to list the empty values too (arg 'with_empty')# --- Here: not empty, or we want to list the empty values too (arg 'with_empty')# --- Here: not empty, or we want to list the empty values too (arg 'with_empty')
+        object_type = None
+        filled_items = False
 
-                if region_name not in results[category][resource][object_type]:
-                    results[category][resource][object_type][region_name] = {}
+        try:
 
-                start_time = time.time()
+            start_time = time.time()
 
-                inventory.pop('NextToken', None) # no "NextToken"
-                results[category][resource][object_type][region_name] = inventory[object_type]
-                if with_meta and response_metadata:
-                    # MetaData only if the key is present and if we asked for it (arg 'with_meta')
-                    results[category][resource][object_type][region_name]['ResponseMetadata'] = response_metadata
+            async for page in engine.iter_pages(client, func, node):
 
                 end_time = time.time()
-                write_log(f"Processing results for {resource} in {region_name} for function {func} took {end_time - start_time:.2f} seconds", log_file_path)
-                filled_resources += 1
+                write_log(f"API call for {resource} in {region_name} for {func} took {end_time - start_time:.2f} seconds", log_file_path)
 
-                # --- In case of: we want more information about the resource
-                #     Calling all the corresponding detail resources 
+                inventory, response_metadata, object_type, to_store = prepare_page(category, resource, region_name, page, object_type)
 
-                detail_handling(client, inventory, node_details, resource, key)
+                if to_store:
 
-            else:
+                    unchanged = snapshot_store.unchanged_items(snapshot_key, inventory[object_type], node) if snapshot_store else None
+
+                    if node.details:
+                        await async_detail_handling(engine, client, inventory, node, resource, object_type, unchanged)
+
+                    start_time = time.time()
+                    store_results(category, resource, object_type, region_name, inventory[object_type], response_metadata)
+                    if stored_pages is not None:
+                        stored_pages.append(inventory[object_type])
+                    end_time = time.time()
+                    write_log(f"Processing results for {resource} in {region_name} for function {func} took {end_time - start_time:.2f} seconds", log_file_path)
+                    filled_items = True
+
+                start_time = time.time()
+
+        except Exception as e:
 
-                # The inventory is empty, but don't forget to count (for the progression bar)
-                empty_resources += 1
-                write_log(f"Empty results for {resource} in {region_name}", log_file_path)
+            handle_inventory_error(e, resource, region_name, func)
+            return
+
+        count_inventory(resource, region_name, filled_items)
+        return object_type
 
     except Exception as e:
 
-        write_log(f"Error (e) querying {resource} in {region_name} using {node_details['function']}: {e} ({type(e)})", log_file_path)
+        write_log(f"Error (e) querying {resource} in {region_name} using {func}: {e} ({type(e)})", log_file_path)
 
     finally:
 
         progress_callback(1)
-        write_log(f"End of inventory for {resource} in {region_name} using {node_details['function']}", log_file_path)
+        write_log(f"End of inventory for {resource} in {region_name} using {func}", log_file_path)
 
 # ------------------------------------------------------------------------------
 
-def resource_inventory(progress_callback, thread_list, category, resource, boto_resource_name, node_details, region_name):
+def resource_inventory(progress_callback, task_list, category, resource, boto_resource_name, node_details, region_name):
 
     """
-    Collects resource inventory for a specified AWS resource and region, and updates progress.
+    Schedules one inventory task per inventory node of a specified AWS resource and region.
 
     Args:
         progress_callback (function): A callback function to update progress.
-        thread_list (list): A list to store threads for concurrent execution.
+        task_list (list): A list to store the tasks for concurrent execution.
         category (str): The category of the AWS resource.
         resource (str): The AWS resource to query.
         boto_resource_name (str): The name of the boto resource.
-        functions (list): A list of functions to execute for the resource.
-        node_details (list): A list to store inventory nodes.
+        node_details (dict): The inventory nodes of the resource (NodeSpec or dict), by node name.
         region_name (str): A AWS region name.
 
     Returns:
         None
     """
 
-    global total_tasks
-
     for node_name in node_details:
 
         write_log(f"Querying category: {category}, resource: {resource}, node_name: {node_name}, region: {region_name}", log_file_path)
-        total_tasks += 1  # Increment total_tasks for each sub-task. One for each attribute in the node_details
-        # total_tasks += len(node_details) * len(node_details[node_name]['details'])  # Increment for each detail function call
-        thread = InventoryThread(category, region_name, resource, boto_resource_name, node_details, f"{resource} in {region_name}", progress_callback)
+        counters.increment('total_tasks')  # One task for each (resource, node, region)
+        task = InventoryTask(category, region_name, resource, boto_resource_name, node_name, node_details[node_name], progress_callback)
         print('.', end='')
-        thread_list.append(thread)
+        task_list.append(task)
+
+
+# ------------------------------------------------------------------------------
+
+def resume_tasks(task_list, journal):
+
+    """
+    Replays the tasks completed in the journal of an interrupted run: their items are stored and counted again,
+    without any API call.
+
+    Args:
+        task_list (list): The planned inventory tasks.
+        journal (Journal): The journal of the run.
 
+    Returns:
+        list: The tasks still to run.
+    """
+
+    remaining_tasks = []
+
+    for task in task_list:
+
+        record = journal.get(task)
+
+        if record is None:
+            remaining_tasks.append(task)
+            continue
+
+        if output_sink:
+            write_records(task.category, task.resource, record['object_type'], task.region_name, record['items'])
+        else:
+            store_results(task.category, task.resource, record['object_type'], task.region_name)
+            if record['items'] is not None:
+                store_results(task.category, task.resource, record['object_type'], task.region_name, record['items'])
+        count_inventory(task.resource, task.region_name, record['items'] is not None)
+        counters.increment('resumed_tasks')
+        counters.increment('completed_tasks')
+
+    return remaining_tasks
 
 # ------------------------------------------------------------------------------
 
@@ -478,15 +1320,16 @@ def list_used_resources(inventory_structure):
     List used resources based on the provided YAML files.
 
     This function performs the following steps:
-    1. Retrieves all AWS regions.
+    1. Retrieves all AWS regions enabled in the account.
     2. Creates a structure of resources based on the provided IAM policy files.
-    3. Initializes and manages threads to query both global and regional resources.
+    3. Schedules one task per (resource, node, region) to query both global and regional resources,
+       except in the regions where the service is not available (botocore endpoint data).
     4. Updates a progress bar to reflect the progress of the inventory process.
     5. Logs the execution time and results of the inventory process.
     6. Writes the results to a JSON file.
 
     Args:
-        inventory_structure (list): A structure of resources based on the provided YAML file with all informations about the resources.
+        inventory_structure (InventoryPlan or list): The compiled inventory plan, or the content of the YAML files (compiled here).
 
     Returns:
         dict: A dictionary of the used resources.
@@ -503,73 +1346,153 @@ def list_used_resources(inventory_structure):
             amount (int): The amount by which to update the progress bar.
         """
 
+        counters.increment('completed_tasks', amount)
         progress_bar.update(amount)
 
  
 
     # ------------------------------------------------------------------------------
 
-    global account_id, results, total_tasks, progress_bar, successful_resources, failed_resources, filled_resources, empty_resources
+    global account_id, results, progress_bar, journal, output_sink, snapshot_store, detail_cache
 
     start_time = time.time()
 
     # --- Get AWS regions
 
-    regions = get_all_regions()
+    regions = enabled_regions(get_all_regions(client_pool.get_session()))
 
     if not regions:
         write_log("Unable to retrieve the list of regions.", log_file_path)
         return
 
-    thread_list = []
+    task_list = []
+
+    # --- Availability of the services in the regions, to prune the tasks that can't succeed
+
+    availability = ServiceAvailability(client_pool.get_session()) if prune else None
+
+    # --- Handle all resources of the plan
+
+    plan = inventory_structure if isinstance(inventory_structure, InventoryPlan) else compile_plan(inventory_structure)
+
+    for spec in plan.resources:
+
+        resource = spec.name
+        boto_resource_name = spec.boto_resource_name
+        node_details = spec.nodes
+
+        if spec.rate_limit is not None:
+            rate_limiter.configure(spec.service, spec.rate_limit, spec.rate_burst)
+
+        if spec.is_global:
+
+            # For global resources, we only need to query once
+            if availability and not availability.is_available(spec.service):
+                write_log(f"Pruned resource {resource}: service {boto_resource_name} unknown to botocore", log_file_path)
+                counters.increment('pruned_tasks', len(node_details))
+                continue
+            resource_inventory(progress_callback, task_list, spec.category, resource, boto_resource_name, node_details, 'global')
+
+        else:
+
+            # For local resources, we need to query each region where the service is available
+
+            for region in regions:
+                if availability and not availability.is_available(spec.service, region['RegionName']):
+                    write_log(f"Pruned resource {resource} in region {region['RegionName']}: service {boto_resource_name} not available", log_file_path)
+                    counters.increment('pruned_tasks', len(node_details))
+                    continue
+                resource_inventory(progress_callback, task_list, spec.category, resource, boto_resource_name, node_details, region['RegionName'])
+
+    # --- A dry run stops once the tasks are planned
+
+    if dry_run:
+        print(f"\nDry run: {counters.get('total_tasks')} tasks planned in {len(regions)} regions, {counters.get('pruned_tasks')} tasks pruned (service not available in the region)")
+        return results
 
     # --- Retrieve the AWS account ID using STS
 
-    sts_client = boto3.client('sts')
+    sts_client = client_pool.get_client('sts')
     account_id = sts_client.get_caller_identity()["Account"]
 
     # --- Modify the JSON file path to include the account ID
 
-    json_file_path = os.path.join(output_dir, f"inventory_{account_id}_{timestamp}.json")
+    json_file_path = os.path.join(output_dir, f"inventory_{account_id}_{run_id}.json")
+    delta_file_path = os.path.join(output_dir, f"delta_{account_id}_{run_id}.json")
 
-    # --- Handle all resources
+    # --- With the incremental mode, the items are compared with the last snapshot of the account
 
-    for resource_info in inventory_structure:
+    if incremental:
+        snapshot_store = SnapshotStore(os.path.join(snapshot_dir, account_id))
 
-        for resource in resource_info:
+    # --- The responses of the detail calls are shared by the items with the same detail (optionally between runs)
 
-            inventory_info = resource_info[resource]
+    if use_detail_cache:
+        detail_cache = DetailCache(detail_cache_ttl, detail_cache_mb * 1024 * 1024,
+                                   os.path.join(cache_dir, f"details_{account_id}.pickle") if persist_detail_cache else None)
 
-            category = inventory_info.get('category', 'unknown')
-            boto_resource_name = inventory_info.get('boto_resource_name', [])
-            regions_type = inventory_info.get('region_type', ['local'])
-            node_details = inventory_info.get('inventory_nodes', [])
+    # --- With an output sink, the items are written as soon as each task completes, by a single writer thread (in batches)
 
-            if 'global' in regions_type:
+    encoder = JsonEncoder(json_encoder, compact_output)
 
-                # For global resources, we only need to query once
-                resource_inventory(progress_callback, thread_list, category, resource, boto_resource_name, node_details, 'global')
+    if output_format in SINK_FORMATS:
+        output_sink = open_sink(output_format, os.path.join(output_dir, f"inventory_{account_id}_{run_id}"), account_id, encoder)
+        if with_extra:
+            write_records('regions', 'ec2', 'Regions', 'global', regions)
 
-            else:
+    # --- The completed tasks are journaled, so the run can be resumed (the ones already in the journal are not run again)
+
+    journal = Journal(journal_file_path)
+    task_list = resume_tasks(task_list, journal)
 
-                # For local resources, we need to query each region
+    # --- Start the longest expected tasks first, from the durations of the previous runs of the account
 
-                for region in regions:
-                    resource_inventory(progress_callback, thread_list, category, resource, boto_resource_name, node_details, region['RegionName'])
+    timing_history = TimingHistory(os.path.join(history_dir, f"timings_{account_id}.json"))
+    task_list = timing_history.sort_tasks(task_list)
 
     # --- Initialize progress bar with the total number of sub-tasks
 
-    print()
-    progress_bar = tqdm(total=total_tasks, desc="Inventory Progress", unit="sub-task")
+    print(f"\nRun id: {run_id} (if interrupted, resume it with --resume {run_id})")
+    progress_bar = tqdm(total=counters.get('total_tasks'), initial=counters.get('resumed_tasks'), desc="Inventory Progress", unit="sub-task", disable=not show_progress)
 
-    # --- Use ThreadPoolExecutor to manage the threads
+    # --- Use ThreadPoolExecutor (or the asyncio engine) to run the tasks
 
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        for thread in thread_list:
-            executor.submit(thread.run)
+    journal.open()
+
+    try:
+        if engine == 'asyncio':
+            AsyncEngine(client_pool, max_in_flight=max_in_flight, max_detail_in_flight=max(1, max_in_flight // 2), assumed_role=assumed_role).run(task_list)
+        else:
+            # The pool has max_workers threads, but only adaptive_workers.workers of them run a task at the same time
+            adaptive_workers.start()
+            with ThreadPoolExecutor(max_workers=adaptive_workers.max_workers) as executor:
+                for task in task_list:
+                    executor.submit(adaptive_workers.run, task.run)
+            adaptive_workers.stop()
+    finally:
+        # Even if the run is interrupted, the completed tasks are in the journal (and in the output of the sink)
+        journal.close()
+        if output_sink:
+            output_sink.close()
+        call_telemetry.close()
 
     progress_bar.close()
 
+    # --- Keep the durations of the tasks for the next runs
+
+    for task in task_list:
+        if task.duration is not None:
+            timing_history.record(task.resource, task.node_name, task.region_name, task.duration)
+    timing_history.save()
+
+    if detail_cache:
+        detail_cache.save()
+
+    # --- Keep the new snapshot (the failed tasks keep their previous items)
+
+    if snapshot_store:
+        snapshot_store.save(run_id, [SnapshotStore.key(task.category, task.resource, task.node_name, task.region_name) for task in task_list])
+
     # --- Include the list of regions if --with-extra is specified
 
     if with_extra:
@@ -581,63 +1504,456 @@ def list_used_resources(inventory_structure):
     # --- Display summary of the inventory process
 
     print(f"\nTotal execution time: {execution_time:.2f} seconds")
-    print(f"Total resources called: {total_tasks}")  # Divide by 2 to get the actual number of resources called
-    print(f"Successful resources: {successful_resources} ({filled_resources} resources with datas, {empty_resources} empty resources)")
-    print(f"Failed resources: {failed_resources}")
-    print(f"Skipped resources: {skipped_resources}")
-    
-    # --- Write the results to a JSON file
-
-    with open(json_file_path, "w") as json_file:
-        json.dump(results, json_file, indent=4, default=json_serial)
+    summary = counters.snapshot()
+    print(f"Total resources called: {summary['total_tasks']} ({summary['completed_tasks']} completed)")
+    print(f"Successful resources: {summary['successful_resources']} ({summary['filled_resources']} resources with datas, {summary['empty_resources']} empty resources)")
+    print(f"Failed resources: {summary['failed_resources']}")
+    print(f"Skipped resources: {summary['skipped_resources']}")
+    print(f"Pruned tasks: {summary['pruned_tasks']} (service not available in the region)")
+    if summary['resumed_tasks']:
+        print(f"Resumed tasks: {summary['resumed_tasks']} (completed in the journal of the run {run_id})")
+    if adaptive_workers.history:
+        worker_counts = [sample['workers'] for sample in adaptive_workers.history]
+        print(f"Workers: {worker_counts[0]} at start, {min(worker_counts)} to {max(worker_counts)} during the run, {worker_counts[-1]} at the end")
+    pool_stats = client_pool.stats()
+    print(f"Boto3 clients: {pool_stats['clients']} created, {pool_stats['hits']} reused ({pool_stats['misses']} misses)")
+    rate_stats = rate_limiter.stats()
+    print(f"API calls: {rate_stats['calls']} ({rate_stats['throttles']} throttled, {rate_stats['wait_time']:.2f} seconds waited for the rate limits)")
+    throttled_services = sorted((stats['throttles'], service) for service, stats in rate_stats['services'].items() if stats['throttles'])
+    if throttled_services:
+        print("Most throttled services: " + ", ".join(f"{service} ({throttles})" for throttles, service in reversed(throttled_services[-5:])))
+    print(f"Call records: {call_telemetry.path} ({call_telemetry.records} records)")
+    if detail_cache:
+        cache_stats = detail_cache.stats()
+        print(f"Detail cache: {cache_stats['hits']} hits, {cache_stats['deduplicated']} in-flight hits, {cache_stats['misses']} misses "
+              f"({cache_stats['hit_rate']:.1%} hit rate, {cache_stats['loaded']} loaded, {cache_stats['evictions']} evicted, {cache_stats['bytes'] / 1024:.0f} KB)")
+    if snapshot_store:
+        totals = snapshot_store.totals
+        print(f"Changes since the run {snapshot_store.previous_run_id or '(none, first snapshot)'}: {totals['added']} added, {totals['removed']} removed, "
+              f"{totals['modified']} modified, {totals['unchanged']} unchanged items ({summary['skipped_details']} detail calls skipped)")
+
+    # --- Write the results to a JSON file (already written as the tasks completed with an output sink)
+    #     With the incremental mode, only the changes since the last snapshot are written
+    #     The file is written one category at a time, through the compressor if any
+
+    write_start_time = time.time()
+
+    if output_sink:
+        print(f"{output_format.upper()} output: {output_sink.path} ({output_sink.records_written} records)")
+        if getattr(output_sink, 'error', None):
+            print(f"Output error, {output_sink.records_skipped} records not written: {output_sink.error}")
+            write_log(f"Error of the {output_format} output {output_sink.path}: {output_sink.error}", log_file_path)
+    elif snapshot_store:
+        delta = {
+            'account_id': account_id,
+            'run_id': run_id,
+            'previous_run_id': snapshot_store.previous_run_id,
+            'summary': snapshot_store.totals,
+            'changes': sort_results(snapshot_store.delta()),
+        }
+        delta_file_path = write_json(delta_file_path, delta, encoder, compression)
+        print(f"Delta output: {delta_file_path}")
+    else:
+        json_file_path = write_json(json_file_path, sort_results(results), encoder, compression)
+        print(f"JSON output: {json_file_path} ({encoder.name} encoder, written in {time.time() - write_start_time:.2f} seconds)")
+
+    write_time = time.time() - write_start_time
+
+    # --- The output is written: the journal is only needed to resume the run if it failed
+
+    if getattr(output_sink, 'error', None):
+        print(f"Journal kept to resume the run: {journal_file_path}")
+    else:
+        journal.remove()
+
+    # --- Write the run metrics (number of workers over time)
+
+    run_metrics = {
+        'engine': engine,
+        'execution_time': round(execution_time, 3),
+        'tasks': summary['total_tasks'],
+        'counters': summary,
+        'min_workers': adaptive_workers.min_workers,
+        'max_workers': adaptive_workers.max_workers,
+        'workers': adaptive_workers.history,
+        'detail_cache': detail_cache.stats() if detail_cache else None,
+        'encoder': encoder.name,
+        'write_time': round(write_time, 3),
+    }
+    with open(metrics_file_path, "w") as metrics_file:
+        json.dump(run_metrics, metrics_file, indent=4)
 
     return results
 
 
 # ------------------------------------------------------------------------------
 
-# Main Function
+# Multi-account Functions
 
 # ------------------------------------------------------------------------------
 
-if __name__ == "__main__":
+# Options of the run given to the processes of the account pool (a spawned process starts with the defaults)
+WORKER_OPTIONS = ('resource_dir', 'with_meta', 'with_extra', 'with_empty', 'engine', 'max_in_flight', 'output_format', 'max_attempts',
+                  'prune', 'incremental', 'use_detail_cache', 'detail_cache_ttl', 'detail_cache_mb', 'persist_detail_cache',
+                  'num_threads', 'min_workers', 'max_workers', 'num_detail_threads', 'timestamp', 'run_id',
+                  'role_session_name', 'role_duration', 'external_id', 'json_encoder', 'compact_output', 'compression')
 
-    # --- Handle command-line arguments
+def get_worker_options():
+
+    """
+    Get the options of the run, for the processes of the account pool.
+
+    Returns:
+        dict: The value of each option, by global name.
+    """
+
+    options = {name: globals()[name] for name in WORKER_OPTIONS}
+    options['rate_limit'] = rate_limiter.default_rate
+    return options
+
+# ------------------------------------------------------------------------------
+
+def init_account_worker(plan, options):
+
+    """
+    Initialize a process of the account pool: the options of the run, and the plan shared by all the accounts of the process.
+
+    Args:
+        plan (InventoryPlan): The compiled inventory plan.
+        options (dict): The options of the run, as returned by get_worker_options.
+    """
+
+    global worker_plan, source_client_pool, detail_executor, show_progress
+
+    options = dict(options)
+    rate_limiter.default_rate = options.pop('rate_limit')
+    globals().update(options)
+
+    worker_plan = plan
+    show_progress = False
+    detail_executor = ThreadPoolExecutor(max_workers=num_detail_threads, thread_name_prefix='detail')
+
+    # The roles are assumed with the default credentials. All the pools of the process share one data loader,
+    # so the service models are read once for all the accounts of the process
+    source_client_pool = ClientPool(max_attempts=max_attempts)
+
+# ------------------------------------------------------------------------------
+
+def run_account(role_arn):
+
+    """
+    Inventory one account, with the credentials of an assumed role, in a process of the account pool.
+
+    The state of the run (results, counters, clients, rate limits, log files...) is reset for each account, so a
+    process can inventory several accounts one after the other. The output of the inventory is written in the
+    log file of the account.
+
+    Args:
+        role_arn (str): The ARN of the role to assume in the account.
+
+    Returns:
+        dict: The outcome of the account: role, account ID, status, error, execution time, counters and log file.
+    """
+
+    global results, counters, account_id, journal, output_sink, snapshot_store, detail_cache, progress_bar, assumed_role
+    global log_file_path, metrics_file_path, calls_file_path, journal_file_path, rate_limiter, adaptive_workers, call_telemetry, client_pool
+
+    start_time = time.time()
+    account = account_of_role(role_arn)
+
+    results = {}
+    counters = ShardedCounters(counter_names)
+    account_id = journal = output_sink = snapshot_store = detail_cache = progress_bar = None
+    log_file_path = os.path.join(log_dir, f"log_{timestamp}_{account}.log")
+    metrics_file_path = os.path.join(log_dir, f"metrics_{timestamp}_{account}.json")
+    calls_file_path = os.path.join(log_dir, f"calls_{timestamp}_{account}.jsonl")
+    journal_file_path = os.path.join(output_dir, f"journal_{account}_{run_id}.jsonl")
+
+    # The rate limits and the throttling are per account
+    rate_limiter = RateLimiter(rate_limiter.default_rate)
+    adaptive_workers = AdaptiveConcurrency(num_threads, min_workers, max_workers)
+    call_telemetry = CallTelemetry(calls_file_path)
+    assumed_role = AssumedRole(source_client_pool.get_client('sts'), role_arn, role_session_name, role_duration, external_id)
+
+    outcome = {'role_arn': role_arn, 'account_id': account, 'status': 'failed', 'error': None}
+    output = io.StringIO()
+
+    try:
+        max_pool_connections = max_in_flight if engine == 'asyncio' else adaptive_workers.max_workers + num_detail_threads
+        client_pool = create_client_pool(max_pool_connections, assumed_role.credentials())
+        with contextlib.redirect_stdout(output):
+            list_used_resources(worker_plan)
+        outcome['status'] = 'completed'
+    except Exception as e:
+        outcome['error'] = f"{type(e).__name__}: {e}"
+        write_log(f"Inventory of the account {account} with the role {role_arn} failed: {outcome['error']}", log_file_path)
+    finally:
+        call_telemetry.close()
+
+    try:
+        for line in output.getvalue().splitlines():
+            if line.strip():
+                write_log(line.strip(), log_file_path)
+
+        outcome['execution_time'] = round(time.time() - start_time, 3)
+        outcome['counters'] = counters.snapshot()
+        outcome['credential_refreshes'] = assumed_role.refreshes
+        outcome['log_file'] = log_file_path
+    finally:
+        # The log of the account is complete: its writer (thread and file) is not kept in the process
+        close_log(log_file_path)
+
+    # The results of the account are in its output file: they are not kept in the process
+    results = {}
+    return outcome
+
+# ------------------------------------------------------------------------------
+
+def run_accounts(role_arns, plan, processes):
+
+    """
+    Inventory several accounts in a pool of processes, each process running the accounts with its threads (or asyncio engine).
+
+    The plan is compiled once and given to each process. Each account gets its own output, log, metrics, timing
+    history, snapshot and detail cache files (named after the account). An account that fails (ex: the role can't be
+    assumed) doesn't stop the others.
+
+    Args:
+        role_arns (list): The ARNs of the roles to assume, one per account.
+        plan (InventoryPlan): The compiled inventory plan.
+        processes (int): The number of processes.
+
+    Returns:
+        list: The outcome of each account, in the order of the roles.
+    """
+
+    start_time = time.time()
+    outcomes = {}
+
+    # The processes are spawned rather than forked: the parent already has threads (log writers)
+    context = multiprocessing.get_context('spawn')
+
+    print(f"\nRun id: {run_id}, {len(role_arns)} accounts in {processes} processes")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=init_account_worker, initargs=(plan, get_worker_options())) as executor:
+        futures = {executor.submit(run_account, role_arn): role_arn for role_arn in role_arns}
+        with tqdm(total=len(futures), desc="Accounts", unit="account") as accounts_bar:
+            for future in as_completed(futures):
+                role_arn = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = {'role_arn': role_arn, 'account_id': account_of_role(role_arn), 'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+                outcomes[role_arn] = outcome
+                write_log(f"Account {outcome['account_id']}: {outcome['status']}" + (f" ({outcome['error']})" if outcome['error'] else ""), log_file_path)
+                accounts_bar.update(1)
+
+    outcomes = [outcomes[role_arn] for role_arn in role_arns]
+    execution_time = time.time() - start_time
+
+    # --- Display and write the summary of the accounts
+
+    print(f"\nTotal execution time: {execution_time:.2f} seconds")
+    for outcome in outcomes:
+        if outcome['status'] == 'completed':
+            account_counters = outcome['counters']
+            print(f"Account {outcome['account_id']}: {account_counters['completed_tasks']}/{account_counters['total_tasks']} tasks, "
+                  f"{account_counters['failed_resources']} failed resources, {outcome['execution_time']:.2f} seconds")
+        else:
+            print(f"Account {outcome['account_id']}: failed ({outcome['error']})")
+    failed = sum(1 for outcome in outcomes if outcome['status'] != 'completed')
+    print(f"Accounts: {len(outcomes) - failed} completed, {failed} failed")
+
+    accounts_file_path = os.path.join(output_dir, f"accounts_{run_id}.json")
+    with open(accounts_file_path, "w") as json_file:
+        json.dump({'run_id': run_id, 'execution_time': round(execution_time, 3), 'processes': processes, 'accounts': outcomes}, json_file, indent=4)
+    print(f"Accounts summary: {accounts_file_path}")
+
+    return outcomes
+
+# ------------------------------------------------------------------------------
+
+def build_parser():
+
+    """
+    Builds the parser of the command-line arguments, with the current options as defaults.
+
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
 
     parser = argparse.ArgumentParser(description='AWS Inventory Script')
     parser.add_argument('--resource-dir', type=str, default='resources', help='The directory containing the resource files containing the inventory resources')
     parser.add_argument('--with-meta', action='store_true', help='Include metadata in the inventory')
     parser.add_argument('--with-extra', action='store_true', help='Include Availability Zones, Regions and Account Attributes in the inventory')
     parser.add_argument('--with-empty', action='store_true', help='Include empty values in the inventory')
-    args = parser.parse_args()
+    parser.add_argument('--workers', type=int, default=num_threads, help='The initial number of workers of the thread engine, adjusted at runtime')
+    parser.add_argument('--min-workers', type=int, default=min_workers, help='The minimum number of workers of the thread engine')
+    parser.add_argument('--max-workers', type=int, default=max_workers, help='The maximum number of workers of the thread engine')
+    parser.add_argument('--detail-workers', type=int, default=num_detail_threads, help='The maximum number of concurrent detail calls')
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default=engine, help='The collection engine: a thread pool, or an asyncio event loop')
+    parser.add_argument('--max-in-flight', type=int, default=max_in_flight, help='The maximum number of API calls in flight with the asyncio engine (half of them at most for detail calls)')
+    parser.add_argument('--rate-limit', type=float, default=rate_limiter.default_rate, help='The maximum number of calls per second per service and region, for the resources without a rate_limit')
+    parser.add_argument('--max-attempts', type=int, default=max_attempts, help='The maximum number of attempts of each API call (throttled calls are retried)')
+    parser.add_argument('--no-prune', action='store_true', help='Query every service in every region, even where botocore says it is not available')
+    parser.add_argument('--format', choices=['json', *SINK_FORMATS], default=output_format,
+                        help='The output format: one JSON document written at the end, or one record per item written as each task completes (JSON lines, SQLite table or Parquet file per object type)')
+    parser.add_argument('--encoder', choices=['auto', *ENCODERS], default=json_encoder, help='The JSON encoder of the outputs (auto: orjson, else msgspec, else the json module)')
+    parser.add_argument('--compact', action='store_true', help='Write the JSON documents without indentation (about half the size)')
+    parser.add_argument('--compress', choices=list(COMPRESSIONS), help='Compress the JSON documents as they are written (.gz or .zst)')
+    parser.add_argument('--resume', type=str, metavar='RUN_ID', help='Resume an interrupted run: the tasks completed in its journal are not run again')
+    parser.add_argument('--dry-run', action='store_true', help='Only plan the tasks and print how many would run and how many were pruned')
+    parser.add_argument('--no-plan-cache', action='store_true', help='Parse the resource files again, without using or writing the compiled plan cache')
+    parser.add_argument('--no-detail-cache', action='store_true', help='Call the detail functions for every item, even when several items share the same detail')
+    parser.add_argument('--detail-cache-ttl', type=float, default=detail_cache_ttl, help='The time to live of the cached detail responses, in seconds')
+    parser.add_argument('--detail-cache-mb', type=int, default=detail_cache_mb, help='The memory budget of the detail cache, in MB (least recently used responses evicted)')
+    parser.add_argument('--persist-detail-cache', action='store_true', help='Keep the detail cache between runs (responses reused until their TTL expires)')
+    parser.add_argument('--incremental', action='store_true', help='Compare with the last snapshot of the account: no detail calls for the unchanged items, and only the changes are written')
+    parser.add_argument('--role-arn', nargs='+', action='extend', metavar='ROLE_ARN', help='Inventory the accounts of these roles (assumed with the default credentials)')
+    parser.add_argument('--role-arns-file', type=str, metavar='FILE', help='Inventory the accounts of the roles listed in a file (one role ARN per line)')
+    parser.add_argument('--organization-unit', type=str, metavar='OU_ID', help='Inventory the active accounts of an AWS Organizations OU (or root) and of its child OUs')
+    parser.add_argument('--role-name', type=str, default=DEFAULT_ROLE_NAME, help='The role assumed in the accounts of the OU')
+    parser.add_argument('--external-id', type=str, help='The external ID required to assume the roles, if any')
+    parser.add_argument('--role-duration', type=int, default=role_duration, help='The duration of the assumed role credentials, in seconds (refreshed before they expire)')
+    parser.add_argument('--account-processes', type=int, help='The number of processes inventorying the accounts (default: the number of CPUs, at most one per account)')
+    return parser
+
+# ------------------------------------------------------------------------------
+
+def parse_args(argv=None, parser=None):
+
+    """
+    Parses and checks the command-line arguments.
+
+    Args:
+        argv (list): The arguments, None for the ones of the command line.
+        parser (argparse.ArgumentParser): The parser, None to build it.
+
+    Returns:
+        argparse.Namespace: The arguments.
+
+    Raises:
+        SystemExit: If an argument is invalid, or if options that can't be used together are given (parser.error).
+    """
+
+    parser = parser or build_parser()
+    args = parser.parse_args(argv)
+
+    if args.incremental and (args.resume or args.format != 'json'):
+        parser.error('--incremental cannot be used with --resume or --format ndjson, sqlite or parquet')
+    if args.encoder != 'auto' and args.encoder not in available_encoders():
+        parser.error(f"--encoder {args.encoder} needs {args.encoder} (pip install {args.encoder})")
+    if args.compress and args.compress not in available_compressions():
+        parser.error(f"--compress {args.compress} needs zstandard (pip install zstandard)")
+    if args.format == 'parquet':
+        try:
+            import pyarrow
+        except ImportError:
+            parser.error('--format parquet needs pyarrow (pip install pyarrow)')
+
+    if (args.role_arn or args.role_arns_file or args.organization_unit) and (args.resume or args.dry_run):
+        parser.error('--resume and --dry-run cannot be used with several accounts (--role-arn, --role-arns-file, --organization-unit)')
+
+    return args
+
+# ------------------------------------------------------------------------------
+
+# Main Function
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    # --- Handle command-line arguments
+
+    parser = build_parser()
+    args = parse_args(parser=parser)
+    multi_account = bool(args.role_arn or args.role_arns_file or args.organization_unit)
 
     resource_dir = args.resource_dir
     with_meta = args.with_meta
     with_extra = args.with_extra
     with_empty = args.with_empty
+    engine = args.engine
+    max_in_flight = args.max_in_flight
+    output_format = args.format
+    json_encoder = args.encoder
+    compact_output = args.compact
+    compression = args.compress
+    max_attempts = args.max_attempts
+    rate_limiter.default_rate = args.rate_limit
+    prune = not args.no_prune
+    num_threads = args.workers
+    min_workers = args.min_workers
+    max_workers = args.max_workers
+    adaptive_workers = AdaptiveConcurrency(num_threads, min_workers, max_workers)
+    dry_run = args.dry_run
+    use_plan_cache = not args.no_plan_cache
+    incremental = args.incremental
+    use_detail_cache = not args.no_detail_cache
+    detail_cache_ttl = args.detail_cache_ttl
+    detail_cache_mb = args.detail_cache_mb
+    persist_detail_cache = args.persist_detail_cache
+    external_id = args.external_id
+    role_duration = args.role_duration
+    if args.resume:
+        run_id = args.resume
+        journal_file_path = os.path.join(output_dir, f"journal_{run_id}.jsonl")
+        if not os.path.exists(journal_file_path):
+            print(f"No journal found for the run {run_id} ({journal_file_path}).")
+            sys.exit(1)
+
+    if args.detail_workers != num_detail_threads:
+        num_detail_threads = args.detail_workers
+        detail_executor = ThreadPoolExecutor(max_workers=num_detail_threads, thread_name_prefix='detail')
+
+    if engine == 'asyncio':
+        client_pool = create_client_pool(max_in_flight)
+    else:
+        client_pool = create_client_pool(adaptive_workers.max_workers + num_detail_threads)
 
     # --- Find all policy files matching the pattern inventory_policy_local_X.json
 
     policy_files = glob.glob(os.path.join(resource_dir, 'inventory_policy_local_*.json'))
 
-    # --- Find all YAML policy files in the policy directory
+    # --- Compile the YAML resource files into the inventory plan (reused from the cache while the files are unchanged)
 
-    yaml_policy_files = glob.glob(os.path.join(resource_dir, '*.yaml'))
+    plan_cache_path = os.path.join(cache_dir, f"plan_{hashlib.sha1(os.path.abspath(resource_dir).encode()).hexdigest()[:12]}.pickle") if use_plan_cache else None
+    inventory_plan, from_cache = load_plan(resource_dir, plan_cache_path)
 
-    # --- Convert YAML policy files to JSON and keep this structure for later use
-
-    inventory_structure = []
-    for yaml_file in yaml_policy_files:
-        with open(yaml_file, 'r') as file:
-            yaml_content = yaml.safe_load(file)
-            inventory_structure.append(yaml_content)
-
-    if not inventory_structure:
+    if inventory_plan is None:
         print("No resource files found.")
         sys.exit(1)
 
+    write_log(f"Inventory plan: {len(inventory_plan.resources)} resources ({'from the cache' if from_cache else 'compiled from the resource files'})", log_file_path)
+    for error in inventory_plan.errors:
+        write_log(f"Invalid entry left out of the inventory plan: {error}", log_file_path)
+
+    # --- With several accounts, the roles are assumed in a pool of processes sharing the plan
+
+    if multi_account:
+        role_arns = list(args.role_arn or [])
+        if args.role_arns_file:
+            with open(args.role_arns_file, 'r') as file:
+                role_arns += [line.strip() for line in file if line.strip() and not line.startswith('#')]
+        if args.organization_unit:
+            organization_accounts = list_organization_accounts(client_pool.get_client('organizations'), args.organization_unit)
+            partition = client_pool.get_session().get_partition_for_region(client_pool.get_session().region_name or 'us-east-1')
+            role_arns += [role_arn_of_account(account['Id'], args.role_name, partition) for account in organization_accounts]
+        role_arns = list(dict.fromkeys(role_arns))
+        for role_arn in role_arns:
+            try:
+                account_of_role(role_arn)
+            except ValueError as e:
+                parser.error(str(e))
+        if not role_arns:
+            print("No account to inventory.")
+            sys.exit(1)
+        processes = args.account_processes or min(len(role_arns), os.cpu_count() or 1)
+        outcomes = run_accounts(role_arns, inventory_plan, processes)
+        sys.exit(0 if all(outcome['status'] == 'completed' for outcome in outcomes) else 1)
+
     # --- Perform inventory and list used resources
 
-    resources_data = list_used_resources(inventory_structure)
+    resources_data = list_used_resources(inventory_plan)
 
     # That's all folks!
\ No newline at end of file
@@ -0,0 +1,64 @@
+# pagination.py
+
+from plan import as_node_spec
+
+# Keys of a response that only drive the pagination and have no interest for an inventory
+PAGINATION_KEYS = {'NextToken', 'nextToken', 'NextPageToken', 'nextPageToken', 'Marker', 'NextMarker', 'IsTruncated'}
+
+def iter_pages(client, function, node):
+    """
+    Iterate over the pages returned by an inventory function, one API call per page.
+
+    A botocore paginator is used when the service defines one. Otherwise, the optional 'pagination' entry of
+    the node describes the tokens to use (ex: {'input_token': 'nextToken', 'output_token': 'nextToken', 'limit_key': 'maxResults'}).
+    Without both, the function is called only once.
+
+    Args:
+        client (object): The boto3 client.
+        function (str): The inventory function to call (ex: 'describe_instances').
+        node (NodeSpec or dict): The inventory node, with the optional 'page_size' and 'pagination' keys.
+
+    Yields:
+        dict: The response of each call, as soon as it is received.
+    """
+    node = as_node_spec(node)
+    page_size = node.page_size
+
+    if client.can_paginate(function):
+
+        pagination_config = {'PageSize': page_size} if page_size else {}
+        yield from client.get_paginator(function).paginate(PaginationConfig=pagination_config)
+
+    elif node.output_token:
+
+        params = {}
+        if page_size and node.limit_key:
+            params[node.limit_key] = page_size
+
+        seen_tokens = set()
+        while True:
+            page = getattr(client, function)(**params)
+            token = page.get(node.output_token)
+            yield page
+            if not token or token in seen_tokens:
+                break
+            seen_tokens.add(token)
+            params[node.input_token] = token
+
+    else:
+
+        yield getattr(client, function)()
+
+def strip_pagination_keys(page):
+    """
+    Remove the pagination keys from a response.
+
+    Args:
+        page (dict): The response of an inventory call.
+
+    Returns:
+        dict: The same response, without the pagination keys.
+    """
+    for key in PAGINATION_KEYS:
+        page.pop(key, None)
+    return page
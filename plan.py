@@ -0,0 +1,303 @@
+# plan.py
+
+import os
+import glob
+import pickle
+import hashlib
+import yaml
+
+# The C LibYAML loader is much faster than the pure Python one, when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+# Version of the cached plans: a cache of another version is ignored (change it when the descriptors change)
+PLAN_VERSION = 2
+
+# ------------------------------------------------------------------------------
+
+class DetailSpec:
+
+    """A detail function to call for each item of an inventory node (or for each batch of items)."""
+
+    __slots__ = ('name', 'item_search_id', 'detail_function', 'detail_param', 'complementary_params', 'batch_size', 'batch_response_key', 'batch_response_id')
+
+    def __init__(self, name, item_search_id, detail_function, detail_param, complementary_params=None, batch_size=None, batch_response_key=None, batch_response_id=None):
+        """
+        Initialize a detail descriptor.
+
+        Args:
+            name (str): The object type of the detail (the key of the detail in the item, ex: 'Configuration').
+            item_search_id (str): The key in the item to use as an identifier.
+            detail_function (str): The detail function to call.
+            detail_param (str): The parameter of the detail function (a list parameter for a batched detail).
+            complementary_params (dict): Other parameters of the detail function, if any.
+            batch_size (int): The maximum number of identifiers per call, None to call the function for each item.
+            batch_response_key (str): The list of the response holding the details of a batch, None to find it.
+            batch_response_id (str): The key of the identifier in each detail of a batch, None to find it.
+        """
+
+        self.name = name
+        self.item_search_id = item_search_id
+        self.detail_function = detail_function
+        self.detail_param = detail_param
+        self.complementary_params = complementary_params
+        self.batch_size = batch_size
+        self.batch_response_key = batch_response_key
+        self.batch_response_id = batch_response_id
+
+class NodeSpec:
+
+    """An inventory node of a resource: the inventory function, its pagination and its details."""
+
+    __slots__ = ('name', 'function', 'page_size', 'input_token', 'output_token', 'limit_key', 'details')
+
+    def __init__(self, name, function, page_size=None, input_token=None, output_token=None, limit_key=None, details=()):
+        """
+        Initialize a node descriptor.
+
+        Args:
+            name (str): The name of the node (ex: 'Buckets').
+            function (str): The inventory function to call (ex: 'list_buckets').
+            page_size (int): The number of items to ask for in each page, if any.
+            input_token (str): The pagination parameter of the function, for the functions without a botocore paginator.
+            output_token (str): The pagination key of the response, None if the node has no 'pagination'.
+            limit_key (str): The page size parameter of the function, if any.
+            details (tuple): The DetailSpec of the node.
+        """
+
+        self.name = name
+        self.function = function
+        self.page_size = page_size
+        self.input_token = input_token
+        self.output_token = output_token
+        self.limit_key = limit_key
+        self.details = details
+
+    @classmethod
+    def from_dict(cls, name, node, errors=None):
+        """
+        Compile a node of a resource file.
+
+        Args:
+            name (str): The name of the node.
+            node (dict): The node, as read from the YAML file.
+            errors (list): If given, the invalid details are left out and reported in it.
+
+        Returns:
+            NodeSpec: The node descriptor.
+        """
+
+        pagination = node.get('pagination') or {}
+        details = []
+        for detail_name, detail in (node.get('details') or {}).items():
+            missing = [key for key in ('item_search_id', 'detail_function', 'detail_param') if not isinstance(detail, dict) or key not in detail]
+            if missing and errors is not None:
+                errors.append(f"detail {detail_name} of node {name}: missing {', '.join(missing)}")
+                continue
+            details.append(DetailSpec(detail_name, detail['item_search_id'], detail['detail_function'], detail['detail_param'], detail.get('complementary_param'),
+                                      detail.get('batch_size'), detail.get('batch_response_key'), detail.get('batch_response_id')))
+
+        return cls(name, node.get('function'), node.get('page_size'),
+                   pagination.get('input_token', 'NextToken') if pagination else None,
+                   pagination.get('output_token', 'NextToken') if pagination else None,
+                   pagination.get('limit_key'), tuple(details))
+
+def as_node_spec(node, name=None):
+    """
+    Get the descriptor of a node, compiling it if it is still a dict (ex: a node built by hand).
+
+    Args:
+        node (NodeSpec or dict): The node.
+        name (str): The name of the node.
+
+    Returns:
+        NodeSpec: The node descriptor.
+    """
+
+    return node if isinstance(node, NodeSpec) else NodeSpec.from_dict(name, node)
+
+class ResourceSpec:
+
+    """A resource of the resource files, with its inventory nodes."""
+
+    __slots__ = ('name', 'category', 'boto_resource_name', 'service', 'is_global', 'rate_limit', 'rate_burst', 'nodes')
+
+    def __init__(self, name, category, boto_resource_name, is_global, nodes, rate_limit=None, rate_burst=None):
+        """
+        Initialize a resource descriptor.
+
+        Args:
+            name (str): The name of the resource (ex: 's3').
+            category (str): The category of the resource (ex: 'Storage').
+            boto_resource_name (str): The name of the boto3 client.
+            is_global (bool): True for a global resource (queried once), False for a local one (queried in each region).
+            nodes (dict): The NodeSpec of each inventory node, by node name.
+            rate_limit (float): The maximum number of calls per second, if any.
+            rate_burst (int): The number of calls that can be made at once, if any.
+        """
+
+        self.name = name
+        self.category = category
+        self.boto_resource_name = boto_resource_name
+        self.service = boto_resource_name.lower()
+        self.is_global = is_global
+        self.nodes = nodes
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+
+class InventoryPlan:
+
+    """The compiled, validated resource files: the resources to inventory, and the errors found in the files."""
+
+    __slots__ = ('resources', 'errors')
+
+    def __init__(self, resources, errors=()):
+        """
+        Initialize a plan.
+
+        Args:
+            resources (list): The ResourceSpec of the plan, in the order of the files.
+            errors (list): The invalid entries left out of the plan, as messages.
+        """
+
+        self.resources = resources
+        self.errors = list(errors)
+
+# ------------------------------------------------------------------------------
+
+def compile_plan(inventory_structure):
+    """
+    Compile and validate the content of the resource files. The entries that can't be run are left out and reported.
+
+    Args:
+        inventory_structure (list): The content of each resource file.
+
+    Returns:
+        InventoryPlan: The plan.
+    """
+
+    resources = []
+    errors = []
+    for resource_info in inventory_structure:
+        for resource, inventory_info in (resource_info or {}).items():
+            if not isinstance(inventory_info, dict) or not inventory_info.get('boto_resource_name'):
+                errors.append(f"{resource}: missing boto_resource_name")
+                continue
+
+            nodes = {}
+            node_errors = []
+            for node_name, node in (inventory_info.get('inventory_nodes') or {}).items():
+                if not isinstance(node, dict) or not node.get('function'):
+                    node_errors.append(f"node {node_name}: missing function")
+                    continue
+                nodes[node_name] = NodeSpec.from_dict(node_name, node, node_errors)
+            errors += [f"{resource}: {message}" for message in node_errors]
+
+            region_type = inventory_info.get('region_type', ['local'])
+            resources.append(ResourceSpec(resource, inventory_info.get('category', 'unknown'), inventory_info['boto_resource_name'],
+                                          'global' in region_type, nodes, inventory_info.get('rate_limit'), inventory_info.get('rate_burst')))
+
+    return InventoryPlan(resources, errors)
+
+def file_signatures(yaml_files):
+    """
+    Get the signature of the resource files: name, modification time and size.
+
+    Args:
+        yaml_files (list): The paths of the files.
+
+    Returns:
+        list: The (name, mtime in ns, size) of each file.
+    """
+
+    signatures = []
+    for yaml_file in yaml_files:
+        stat = os.stat(yaml_file)
+        signatures.append((os.path.basename(yaml_file), stat.st_mtime_ns, stat.st_size))
+    return signatures
+
+def file_hashes(yaml_files):
+    """
+    Get the SHA-256 of the content of the resource files.
+
+    Args:
+        yaml_files (list): The paths of the files.
+
+    Returns:
+        list: The (name, SHA-256) of each file.
+    """
+
+    hashes = []
+    for yaml_file in yaml_files:
+        with open(yaml_file, 'rb') as file:
+            hashes.append((os.path.basename(yaml_file), hashlib.sha256(file.read()).hexdigest()))
+    return hashes
+
+def load_plan(resource_dir, cache_path=None):
+    """
+    Load the inventory plan of the resource files of a directory.
+
+    The compiled plan is cached in a pickle file. It is reused as long as the files have the same modification times
+    and sizes, or the same content (hashes) when they were only touched. Otherwise, the files are parsed again
+    (with the C LibYAML loader if available) and the cache is rewritten.
+
+    Args:
+        resource_dir (str): The directory containing the YAML resource files.
+        cache_path (str): The path of the cache file, None to parse the files without cache.
+
+    Returns:
+        tuple: The InventoryPlan (None if there is no resource file) and True if it came from the cache.
+    """
+
+    yaml_files = sorted(glob.glob(os.path.join(resource_dir, '*.yaml')))
+    if not yaml_files:
+        return None, False
+
+    signatures = file_signatures(yaml_files)
+    hashes = None
+    cache = None
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as file:
+                cache = pickle.load(file)
+        except Exception:
+            cache = None
+        if not isinstance(cache, dict) or cache.get('version') != PLAN_VERSION:
+            cache = None
+
+    if cache:
+        if cache['signatures'] == signatures:
+            return cache['plan'], True
+        hashes = file_hashes(yaml_files)
+        if cache['hashes'] == hashes:
+            cache['signatures'] = signatures
+            save_plan_cache(cache_path, cache)
+            return cache['plan'], True
+
+    inventory_structure = []
+    for yaml_file in yaml_files:
+        with open(yaml_file, 'r') as file:
+            inventory_structure.append(yaml.load(file, Loader=YamlLoader))
+    plan = compile_plan(inventory_structure)
+
+    if cache_path:
+        save_plan_cache(cache_path, {'version': PLAN_VERSION, 'signatures': signatures, 'hashes': hashes or file_hashes(yaml_files), 'plan': plan})
+    return plan, False
+
+def save_plan_cache(cache_path, cache):
+    """
+    Write the cache of a plan (in a temporary file, then renamed, so a reader never sees a partial file).
+
+    Args:
+        cache_path (str): The path of the cache file.
+        cache (dict): The version, signatures and hashes of the files, and the plan.
+    """
+
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        pickle.dump(cache, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, cache_path)
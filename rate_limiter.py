@@ -0,0 +1,209 @@
+# rate_limiter.py
+
+import time
+import asyncio
+import inspect
+import threading
+
+# Error codes returned by the AWS services when a call is throttled
+THROTTLING_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException', 'RequestThrottled',
+    'TooManyRequestsException', 'RequestLimitExceeded', 'EC2ThrottledException', 'ProvisionedThroughputExceededException',
+    'TransactionInProgressException', 'BandwidthLimitExceeded', 'LimitExceededException', 'PriorRequestNotComplete',
+    'SlowDown', 'RequestLimitExceededException',
+}
+
+class TokenBucket:
+
+    """
+    Token bucket with an AIMD (additive increase, multiplicative decrease) refill rate.
+
+    Each throttled response halves the rate, each successful one adds 'increase' calls per second to it, up to
+    the configured rate. A call takes one token; when there is none left, it waits until the bucket is refilled.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.5, increase=0.5, decrease=0.5):
+        """
+        Initialize a new token bucket.
+
+        Args:
+            rate (float): The maximum number of calls per second.
+            burst (int): The capacity of the bucket. Defaults to the rate.
+            min_rate (float): The minimum number of calls per second, after throttling.
+            increase (float): The rate added after each successful call.
+            decrease (float): The factor applied to the rate after each throttled call.
+        """
+
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.min_rate = min(min_rate, self.max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.calls = 0
+        self.throttles = 0
+        self.wait_time = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token, possibly in advance.
+
+        Returns:
+            float: The number of seconds to wait before calling.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1
+            self.calls += 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.wait_time += wait
+            return wait
+
+    def acquire(self):
+        """Take a token, waiting for it if needed."""
+
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def async_acquire(self):
+        """Take a token, waiting for it on the event loop if needed."""
+
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_response(self, throttled):
+        """
+        Adapt the rate to a response.
+
+        Args:
+            throttled (bool): True if the call was throttled.
+        """
+
+        with self._lock:
+            if throttled:
+                self.throttles += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+# ------------------------------------------------------------------------------
+
+class RateLimiter:
+
+    """
+    Rate limits of the API calls, with one token bucket per (service, region).
+
+    The limiter is hooked on the botocore events of each client: a token is taken before each HTTP request
+    (including the retries and the pages of a paginator), and the rate is adapted to each response.
+    """
+
+    def __init__(self, default_rate=25, default_burst=None):
+        """
+        Initialize a new rate limiter.
+
+        Args:
+            default_rate (float): The maximum number of calls per second for the services without a specific limit.
+            default_burst (int): The capacity of the buckets for the services without a specific limit.
+        """
+
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self._limits = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def configure(self, service, rate, burst=None):
+        """
+        Set the rate limit of a service, in every region.
+
+        Args:
+            service (str): The boto3 service name (ex: 'ec2').
+            rate (float): The maximum number of calls per second.
+            burst (int): The capacity of the bucket.
+        """
+
+        with self._lock:
+            self._limits[service] = (rate, burst)
+
+    def bucket(self, service, region_name):
+        """
+        Get the token bucket of a service in a region.
+
+        Args:
+            service (str): The boto3 service name (ex: 'ec2').
+            region_name (str): The AWS region name.
+
+        Returns:
+            TokenBucket: The bucket, created on the first call.
+        """
+
+        key = (service, region_name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    rate, burst = self._limits.get(service, (self.default_rate, self.default_burst))
+                    bucket = TokenBucket(rate, burst)
+                    self._buckets[key] = bucket
+        return bucket
+
+    def register(self, client):
+        """
+        Hook the rate limiter on the events of a client (boto3 or aiobotocore).
+
+        Args:
+            client (object): The client.
+        """
+
+        bucket = self.bucket(client.meta.service_model.service_name, client.meta.region_name)
+
+        def on_response(parsed_response=None, context=None, **kwargs):
+            error_code = (parsed_response or {}).get('Error', {}).get('Code')
+            throttled = error_code in THROTTLING_ERROR_CODES
+            if throttled and context is not None:
+                context['throttle_count'] = context.get('throttle_count', 0) + 1
+            bucket.on_response(throttled)
+
+        if inspect.iscoroutinefunction(client._make_api_call):
+            async def before_send(**kwargs):
+                await bucket.async_acquire()
+        else:
+            def before_send(**kwargs):
+                bucket.acquire()
+
+        client.meta.events.register('before-send', before_send)
+        client.meta.events.register('response-received', on_response)
+
+    def stats(self):
+        """
+        Get the statistics of the rate limiter.
+
+        Returns:
+            dict: The number of calls, throttled calls and seconds waited, for all the buckets and for each service.
+        """
+
+        with self._lock:
+            buckets = dict(self._buckets)
+
+        services = {}
+        for (service, region_name), bucket in buckets.items():
+            service_stats = services.setdefault(service, {'calls': 0, 'throttles': 0, 'wait_time': 0.0})
+            service_stats['calls'] += bucket.calls
+            service_stats['throttles'] += bucket.throttles
+            service_stats['wait_time'] += bucket.wait_time
+
+        return {
+            'calls': sum(stats['calls'] for stats in services.values()),
+            'throttles': sum(stats['throttles'] for stats in services.values()),
+            'wait_time': sum(stats['wait_time'] for stats in services.values()),
+            'services': services,
+        }
@@ -0,0 +1,273 @@
+# sinks.py
+
+import os
+import re
+import json
+import queue
+import sqlite3
+import threading
+from utils import json_serial, AsyncLineWriter
+from snapshot import item_identity
+
+# pyarrow is optional: without it, the Parquet output is not available
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Output formats of the sinks, with the extension of their output
+SINK_FORMATS = {'ndjson': '.ndjson', 'sqlite': '.sqlite', 'parquet': '.parquet'}
+
+def table_name(resource, object_type):
+    """
+    Get the name of the table of an object type.
+
+    Args:
+        resource (str): The type of AWS resource (ex: 's3').
+        object_type (str): The key of the items in the responses (ex: 'Buckets').
+
+    Returns:
+        str: The name of the table (ex: 's3_Buckets'), with only letters, digits and underscores.
+    """
+
+    return re.sub(r'\W', '_', f"{resource}_{object_type}")
+
+def open_sink(output_format, path, account_id, encoder=None):
+    """
+    Open the sink of an output format.
+
+    Args:
+        output_format (str): 'ndjson', 'sqlite' or 'parquet'.
+        path (str): The path of the output, without extension.
+        account_id (str): The account of the inventory.
+        encoder (JsonEncoder): The encoder of the items, None for the json module.
+
+    Returns:
+        object: The sink, with the write(record) and close() methods, and the path, records_written, records_skipped
+        and error attributes.
+
+    Raises:
+        ValueError: If the format is unknown, or if its library is not installed.
+    """
+
+    if output_format == 'ndjson':
+        return AsyncLineWriter(path + SINK_FORMATS['ndjson'], mode="w", encoder=encoder.encode_line if encoder else None)
+    if output_format == 'sqlite':
+        return SQLiteSink(path + SINK_FORMATS['sqlite'], account_id, encoder=encoder)
+    if output_format == 'parquet':
+        if pyarrow is None:
+            raise ValueError("The Parquet output needs pyarrow (pip install pyarrow)")
+        return ParquetSink(path + SINK_FORMATS['parquet'], account_id, encoder=encoder)
+    raise ValueError(f"Unknown output format: {output_format}")
+
+# ------------------------------------------------------------------------------
+
+class BatchSink:
+
+    """
+    Writer of the inventory records in batches, running in a background thread.
+
+    The collectors only put their records in a queue, so they never wait for the output: the writer thread takes the
+    records waiting in the queue (at most 'batch_size' at a time), groups them by table and writes each group at once.
+    A record is a dict with the category, resource, object_type, region, collected_at and item keys. The records must
+    not be modified once they are written.
+
+    The output is opened and closed in the writer thread (a SQLite connection can't be shared between threads).
+    An error of the output stops the writes: it is kept in 'error', and the next records are dropped (counted in
+    'records_skipped').
+    """
+
+    _STOP = object()
+
+    def __init__(self, path, account_id, batch_size=1000, encoder=None):
+        """
+        Start the writer thread.
+
+        Args:
+            path (str): The path of the output.
+            account_id (str): The account of the records.
+            batch_size (int): The maximum number of records per batch.
+            encoder (JsonEncoder): The encoder of the items, None for the json module.
+        """
+
+        self.path = path
+        self.account_id = account_id
+        self.batch_size = batch_size
+        self.encode = encoder.encode_line if encoder else lambda item: json.dumps(item, default=json_serial)
+        self.records_written = 0
+        self.batches_written = 0
+        self.records_skipped = 0
+        self.error = None
+        self._queue = queue.Queue()
+        self._closed = False
+        self._write_lock = threading.Lock() # no record is queued after the stop of the writer
+        self._thread = threading.Thread(target=self._run, name='sink-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        """
+        Queue a record, to be written with the next batch.
+
+        Args:
+            record (dict): The record.
+
+        Raises:
+            RuntimeError: If the sink is closed.
+        """
+        with self._write_lock:
+            if self._closed or not self._thread.is_alive():
+                raise RuntimeError(f"The sink of {self.path} is closed" + (f" ({self.error})" if self.error else ""))
+            self._queue.put(record)
+
+    def _run(self):
+        try:
+            self.open()
+        except Exception as e:
+            self.error = e
+        stopped = False
+        while not stopped:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is self._STOP:
+                batch.pop()
+                stopped = True
+            if not batch:
+                continue
+            if self.error:
+                self.records_skipped += len(batch)
+                continue
+            tables = {}
+            for record in batch:
+                tables.setdefault(table_name(record['resource'], record['object_type']), []).append(record)
+            try:
+                for name, records in tables.items():
+                    self.write_batch(name, records)
+                self.records_written += len(batch)
+                self.batches_written += 1
+            except Exception as e:
+                self.error = e
+                self.records_skipped += len(batch)
+        try:
+            self.finish()
+        except Exception as e:
+            self.error = self.error or e
+
+    def encode_item(self, record):
+        """
+        Get the columns of a record.
+
+        Args:
+            record (dict): The record.
+
+        Returns:
+            tuple: The account ID, region, collection time, category, identity of the item and JSON of the item.
+        """
+        item = record['item']
+        return (self.account_id, record['region'], record['collected_at'], record['category'],
+                item_identity(item), self.encode(item))
+
+    def open(self):
+        """Open the output (in the writer thread)."""
+
+    def write_batch(self, name, records):
+        """
+        Write the records of a table (in the writer thread).
+
+        Args:
+            name (str): The name of the table.
+            records (list): The records.
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """Close the output (in the writer thread)."""
+
+    def close(self):
+        """Write the queued records, then close the output."""
+        with self._write_lock:
+            stopping = not self._closed and self._thread.is_alive()
+            self._closed = True
+            if stopping:
+                self._queue.put(self._STOP)
+        self._thread.join()
+
+# ------------------------------------------------------------------------------
+
+class SQLiteSink(BatchSink):
+
+    """
+    Inventory records in a SQLite database: one table per (resource, object type), listed in the 'inventory_tables'
+    table. Each row has the account, region and collection time (indexed), the category, the identity of the item
+    (its ARN, ID or name when it has one) and the JSON of the item.
+
+    Example:
+        SELECT region, json_extract(item, '$.Instances[0].InstanceType') FROM ec2_Reservations WHERE account_id = '123456789012'
+    """
+
+    def open(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute("CREATE TABLE inventory_tables (table_name TEXT PRIMARY KEY, category TEXT, resource TEXT, object_type TEXT)")
+        self._tables = set()
+
+    def create_table(self, name, record):
+        """
+        Create the table of an object type, with its indexes, and add it to the list of the tables.
+
+        Args:
+            name (str): The name of the table.
+            record (dict): A record of the table.
+        """
+        self._connection.execute(f'CREATE TABLE "{name}" (account_id TEXT, region TEXT, collected_at TEXT, category TEXT, item_id TEXT, item TEXT)')
+        for column in ('account_id', 'region', 'collected_at'):
+            self._connection.execute(f'CREATE INDEX "{name}_{column}" ON "{name}" ({column})')
+        self._connection.execute("INSERT INTO inventory_tables VALUES (?, ?, ?, ?)", (name, record['category'], record['resource'], record['object_type']))
+        self._tables.add(name)
+
+    def write_batch(self, name, records):
+        with self._connection:
+            if name not in self._tables:
+                self.create_table(name, records[0])
+            self._connection.executemany(f'INSERT INTO "{name}" VALUES (?, ?, ?, ?, ?, ?)', [self.encode_item(record) for record in records])
+
+    def finish(self):
+        connection = getattr(self, '_connection', None)
+        if connection is not None:
+            connection.execute("PRAGMA journal_mode = DELETE") # a single file, without the WAL files
+            connection.close()
+
+# ------------------------------------------------------------------------------
+
+class ParquetSink(BatchSink):
+
+    """
+    Inventory records in Parquet files (needs pyarrow): a directory with one file per (resource, object type), each
+    batch being a row group. The columns are the same as the ones of the SQLite tables: the account, region and
+    collection time (with the statistics of each row group, to filter on them), the category, the identity of the
+    item and the JSON of the item.
+    """
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._schema = pyarrow.schema([('account_id', pyarrow.string()), ('region', pyarrow.string()), ('collected_at', pyarrow.string()),
+                                       ('category', pyarrow.string()), ('item_id', pyarrow.string()), ('item', pyarrow.string())])
+        self._writers = {}
+
+    def write_batch(self, name, records):
+        writer = self._writers.get(name)
+        if writer is None:
+            writer = self._writers[name] = pyarrow.parquet.ParquetWriter(os.path.join(self.path, f"{name}.parquet"), self._schema, compression='zstd')
+        columns = list(zip(*(self.encode_item(record) for record in records)))
+        writer.write_table(pyarrow.Table.from_arrays([pyarrow.array(column, pyarrow.string()) for column in columns], schema=self._schema))
+
+    def finish(self):
+        for writer in getattr(self, '_writers', {}).values():
+            writer.close()
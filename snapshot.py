@@ -0,0 +1,264 @@
+# snapshot.py
+
+import os
+import json
+import hashlib
+import threading
+from utils import json_serial
+
+# Keys identifying an item when its node has no detail (and so no item_search_id), in order of preference
+IDENTITY_KEYS = ('Arn', 'ARN', 'arn', 'Id', 'id', 'Name', 'name')
+IDENTITY_SUFFIXES = ('Arn', 'ARN', 'Id', 'Name')
+
+def fingerprint(item):
+    """
+    Get the fingerprint of an item, as returned by the inventory function (before its details are added).
+
+    Args:
+        item (any): The item.
+
+    Returns:
+        str: The SHA-1 of the canonical JSON of the item.
+    """
+
+    return hashlib.sha1(json.dumps(item, sort_keys=True, separators=(',', ':'), default=json_serial).encode()).hexdigest()
+
+def item_identity(item, search_id=None):
+    """
+    Get the identity of an item, to find it again in the next runs.
+
+    Args:
+        item (any): The item, as returned by the inventory function.
+        search_id (str): The item_search_id of the first detail of the node, if any.
+
+    Returns:
+        str: The identity of the item, or None if it has none (it is then identified by its fingerprint).
+    """
+
+    if isinstance(item, str):
+        return item
+    if not isinstance(item, dict):
+        return None
+    if search_id and isinstance(item.get(search_id), str):
+        return item[search_id]
+    for key in IDENTITY_KEYS:
+        if isinstance(item.get(key), str):
+            return item[key]
+    for suffix in IDENTITY_SUFFIXES:
+        for key, value in item.items():
+            if isinstance(key, str) and key.endswith(suffix) and isinstance(value, str):
+                return value
+    return None
+
+# ------------------------------------------------------------------------------
+
+class SnapshotStore:
+
+    """
+    Local store of the last inventory snapshot of an account, for the incremental mode.
+
+    The items of each task (resource, node, region) are kept in a JSON blob named after the SHA-256 of its content,
+    so an unchanged task writes nothing new. The index maps each task to its blob. For each item, the store keeps its
+    identity, the fingerprint of the item as listed (before the details) and the item with its details: when the
+    fingerprint is unchanged, the details are taken from the snapshot instead of being called again.
+
+    The index is only rewritten at the end of a complete run, so an interrupted run leaves the previous snapshot intact.
+    """
+
+    def __init__(self, directory):
+        """
+        Initialize the store, loading the index of the previous snapshot if any.
+
+        Args:
+            directory (str): The directory of the store (one per account).
+        """
+
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        self.blob_dir = os.path.join(directory, 'tasks')
+
+        index = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as file:
+                    index = json.load(file)
+            except ValueError:
+                index = {}
+        self.previous_run_id = index.get('run_id')
+        self.previous = index.get('tasks', {})
+        self.current = dict(self.previous)
+        self.changes = []
+        self.totals = {'added': 0, 'removed': 0, 'modified': 0, 'unchanged': 0}
+
+        self._loaded = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(category, resource, node_name, region_name):
+        """
+        Get the key of a task in the store.
+
+        Args:
+            category (str): The category of the resource.
+            resource (str): The type of AWS resource.
+            node_name (str): The name of the inventory node.
+            region_name (str): The AWS region name, or 'global'.
+
+        Returns:
+            str: The key of the task.
+        """
+
+        return f"{category}/{resource}/{node_name} in {region_name}"
+
+    def previous_items(self, key):
+        """
+        Get the items of a task in the previous snapshot.
+
+        Args:
+            key (str): The key of the task.
+
+        Returns:
+            dict: The [fingerprint, item] of each item, by identity.
+        """
+
+        with self._lock:
+            if key in self._loaded:
+                return self._loaded[key]
+            blob_hash = self.previous.get(key)
+
+        items = {}
+        if blob_hash:
+            try:
+                with open(os.path.join(self.blob_dir, f"{blob_hash}.json"), 'r', encoding='utf-8') as file:
+                    items = {identity: [item_fingerprint, item] for identity, item_fingerprint, item in json.load(file)['items']}
+            except (OSError, ValueError, KeyError):
+                items = {}
+
+        with self._lock:
+            return self._loaded.setdefault(key, items)
+
+    def unchanged_items(self, key, items, node):
+        """
+        Find the items of a page unchanged since the previous snapshot, and keep the page for the new snapshot.
+
+        Args:
+            key (str): The key of the task.
+            items (list or dict): The items of the page, as returned by the inventory function.
+            node (NodeSpec): The inventory node.
+
+        Returns:
+            dict: The previous item (with its details) of each unchanged item of a list, by index in the page.
+        """
+
+        listed = items if isinstance(items, list) else [items]
+        search_id = node.details[0].item_search_id if node.details else None
+        previous = self.previous_items(key)
+
+        entries = []
+        unchanged = {}
+        for index, item in enumerate(listed):
+            item_fingerprint = fingerprint(item)
+            if isinstance(items, list):
+                identity = item_identity(item, search_id) or item_fingerprint
+            else:
+                identity = '' # the whole response is the item (ex: a summary), changed or not
+            entries.append([identity, item_fingerprint])
+            previous_item = previous.get(identity)
+            if isinstance(items, list) and previous_item and previous_item[0] == item_fingerprint:
+                unchanged[index] = previous_item[1]
+
+        with self._lock:
+            self._pending.setdefault(key, []).append((entries, items))
+        return unchanged
+
+    def commit(self, category, resource, node_name, region_name, object_type):
+        """
+        Keep the items of a completed task in the new snapshot, and find its changes since the previous one.
+
+        Args:
+            category (str): The category of the resource.
+            resource (str): The type of AWS resource.
+            node_name (str): The name of the inventory node.
+            region_name (str): The AWS region name, or 'global'.
+            object_type (str): The key of the items in the results (ex: 'Buckets').
+
+        Returns:
+            dict: The number of added, removed, modified and unchanged items of the task.
+        """
+
+        key = self.key(category, resource, node_name, region_name)
+        previous = self.previous_items(key)
+        with self._lock:
+            pages = self._pending.pop(key, [])
+            self._loaded.pop(key, None)
+
+        # The items have their details now: the pages were detailed in place
+        current = {}
+        for entries, items in pages:
+            for (identity, item_fingerprint), item in zip(entries, items if isinstance(items, list) else [items]):
+                unique_identity, suffix = identity, 1
+                while unique_identity in current:
+                    suffix += 1
+                    unique_identity = f"{identity}#{suffix}"
+                current[unique_identity] = [item_fingerprint, item]
+
+        added = [item for identity, (_, item) in current.items() if identity not in previous]
+        modified = [item for identity, (item_fingerprint, item) in current.items() if identity in previous and previous[identity][0] != item_fingerprint]
+        removed = sorted(identity for identity in previous if identity not in current)
+        counts = {'added': len(added), 'removed': len(removed), 'modified': len(modified), 'unchanged': len(current) - len(added) - len(modified)}
+
+        data = json.dumps({'object_type': object_type, 'items': [[identity, *entry] for identity, entry in current.items()]}, default=json_serial).encode()
+        blob_hash = hashlib.sha256(data).hexdigest()
+        blob_path = os.path.join(self.blob_dir, f"{blob_hash}.json")
+        if not os.path.exists(blob_path):
+            os.makedirs(self.blob_dir, exist_ok=True)
+            temp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, blob_path)
+
+        with self._lock:
+            self.current[key] = blob_hash
+            for name, count in counts.items():
+                self.totals[name] += count
+            if added or removed or modified:
+                self.changes.append({'category': category, 'resource': resource, 'object_type': object_type, 'region': region_name,
+                                     'added': added, 'removed': removed, 'modified': modified})
+        return counts
+
+    def save(self, run_id, keys):
+        """
+        Write the index of the new snapshot, and remove the blobs it doesn't use anymore.
+
+        Args:
+            run_id (str): The identifier of the run.
+            keys (list): The keys of the tasks planned by the run: the failed ones keep their previous items.
+        """
+
+        tasks = {key: self.current[key] for key in sorted(set(keys)) if key in self.current}
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'run_id': run_id, 'tasks': tasks}, file, indent=1)
+        os.replace(temp_path, self.index_path)
+
+        used = {f"{blob_hash}.json" for blob_hash in tasks.values()}
+        for name in os.listdir(self.blob_dir) if os.path.isdir(self.blob_dir) else []:
+            if name not in used:
+                os.remove(os.path.join(self.blob_dir, name))
+
+    def delta(self):
+        """
+        Get the changes since the previous snapshot, in the structure of the inventory (category, resource, object type, region).
+
+        Returns:
+            dict: The added and modified items (with their details) and the identities of the removed items.
+        """
+
+        changes = {}
+        with self._lock:
+            for change in self.changes:
+                changes.setdefault(change['category'], {}).setdefault(change['resource'], {}).setdefault(change['object_type'], {})[change['region']] = {
+                    'added': change['added'], 'removed': change['removed'], 'modified': change['modified']}
+        return changes
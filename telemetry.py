@@ -0,0 +1,145 @@
+# telemetry.py
+
+import time
+import threading
+from utils import AsyncLineWriter
+from pagination import PAGINATION_KEYS
+from rate_limiter import THROTTLING_ERROR_CODES
+
+def count_items(parsed_response):
+    """
+    Count the items of a response: the elements of its lists, the metadata and pagination keys apart.
+
+    Args:
+        parsed_response (dict): The parsed response.
+
+    Returns:
+        int: The number of items, or None if the response has no list.
+    """
+
+    counts = [len(value) for key, value in parsed_response.items() if key != 'ResponseMetadata' and key not in PAGINATION_KEYS and isinstance(value, list)]
+    return sum(counts) if counts else None
+
+# ------------------------------------------------------------------------------
+
+class CallTelemetry:
+
+    """
+    Structured record of each API call (inventory, detail and every page of a paginator), in a JSON lines file.
+
+    The telemetry is hooked on the botocore events of each client, so every call is recorded, whatever the engine.
+    A record has the service, region, operation, start time, duration, HTTP status, number of retries, throttled flag,
+    response size (bytes), number of items and error code. The file is written by a background thread.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the telemetry. The file is created with the first record.
+
+        Args:
+            path (str): The path of the JSON lines file.
+        """
+
+        self.path = path
+        self.records = 0
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def register(self, client):
+        """
+        Hook the telemetry on the events of a client (boto3 or aiobotocore).
+
+        Args:
+            client (object): The client.
+        """
+
+        service = client.meta.service_model.service_name
+        region_name = client.meta.region_name
+
+        # The call starts with 'before-parameter-build': handlers of 'before-call' may be skipped (ex: by a Stubber)
+        def before_call(model=None, context=None, **kwargs):
+            if context is not None:
+                context['telemetry'] = {'start': time.time(), 'start_counter': time.perf_counter(), 'attempts': 0, 'throttled': False, 'status': None, 'bytes': None}
+
+        def on_response(response_dict=None, parsed_response=None, context=None, **kwargs):
+            call = (context or {}).get('telemetry')
+            if call is None:
+                return
+            call['attempts'] += 1
+            if response_dict:
+                call['status'] = response_dict.get('status_code')
+                body = response_dict.get('body')
+                call['bytes'] = len(body) if isinstance(body, (bytes, bytearray)) else None
+            if (parsed_response or {}).get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+                call['throttled'] = True
+
+        def after_call(model=None, parsed=None, context=None, **kwargs):
+            self.emit(service, region_name, model, context, parsed, None)
+
+        def after_call_error(model=None, exception=None, context=None, **kwargs):
+            self.emit(service, region_name, model, context, None, exception)
+
+        client.meta.events.register('before-parameter-build', before_call)
+        client.meta.events.register('response-received', on_response)
+        client.meta.events.register('after-call', after_call)
+        client.meta.events.register('after-call-error', after_call_error)
+
+    def emit(self, service, region_name, model, context, parsed, exception):
+        """
+        Write the record of a finished call.
+
+        Args:
+            service (str): The service of the client.
+            region_name (str): The region of the client.
+            model (OperationModel): The operation called.
+            context (dict): The request context, with the data collected during the call.
+            parsed (dict): The parsed response, if the call succeeded.
+            exception (Exception): The exception, if the call failed.
+        """
+
+        call = (context or {}).pop('telemetry', None)
+        if call is None:
+            return
+
+        error_code = None
+        if exception is not None:
+            error_code = getattr(exception, 'response', {}).get('Error', {}).get('Code') or type(exception).__name__
+        elif parsed and 'Error' in parsed:
+            error_code = parsed['Error'].get('Code')
+
+        self.write({
+            'service': service,
+            'region': region_name,
+            'operation': model.name if model is not None else None,
+            'start': round(call['start'], 6),
+            'duration': round(time.perf_counter() - call['start_counter'], 6),
+            'status': call['status'] or (parsed or {}).get('ResponseMetadata', {}).get('HTTPStatusCode'),
+            'retries': max(0, call['attempts'] - 1),
+            'throttled': call['throttled'] or error_code in THROTTLING_ERROR_CODES,
+            'bytes': call['bytes'],
+            'items': count_items(parsed) if isinstance(parsed, dict) and error_code is None else None,
+            'error': error_code,
+        })
+
+    def write(self, record):
+        """
+        Queue a record, opening the file on the first one.
+
+        Args:
+            record (dict): The record.
+        """
+
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = AsyncLineWriter(self.path, flush_interval=0.5)
+        self._writer.write(record)
+
+    def close(self):
+        """Write the pending records and close the file."""
+
+        with self._lock:
+            if self._writer:
+                self._writer.close()
+                self.records += self._writer.lines_written
+                self._writer = None
@@ -1,63 +1,648 @@
 import pytest
+import os
+import time
+import json
+import threading
+import boto3
+from botocore.stub import Stubber
+from botocore.credentials import Credentials
 from unittest.mock import AsyncMock, patch, MagicMock
-from ..new_inventory_api import InventoryThread, detail_handling, inventory_handling, resource_inventory, list_used_resources
-
-# Test InventoryThread Initialization
-def test_inventory_thread_initialization():
-    thread = InventoryThread('category', 'region_name', 'resource', 'boto_resource_name', {'key': 'value'}, 'key', lambda x: x)
-    assert thread.category == 'category'
-    assert thread.region_name == 'region_name'
-    assert thread.resource == 'resource'
-    assert thread.boto_resource_name == 'boto_resource_name'
-    assert thread.node_details == {'key': 'value'}
-    assert thread.key == 'key'
-    assert thread.progress_callback is not None
+from new_inventory_api import InventoryTask, detail_handling, inventory_handling, resource_inventory, list_used_resources, resume_tasks, call_detail, merge_detail, get_detail_param_value, parse_args
+from client_pool import ClientPool
+from pagination import iter_pages
+from async_engine import AsyncEngine
+from rate_limiter import TokenBucket, RateLimiter
+from availability import ServiceAvailability, enabled_regions
+from concurrency import AdaptiveConcurrency
+from timing_history import TimingHistory
+from checkpoint import Journal
+from utils import AsyncLineWriter, write_log, close_log, flush_logs, json_serial
+from telemetry import CallTelemetry
+from metrics import ShardedCounters
+from plan import compile_plan, load_plan, NodeSpec, DetailSpec
+from snapshot import SnapshotStore
+from detail_cache import DetailCache
+from sinks import SQLiteSink
+from encoders import JsonEncoder, write_json, available_encoders
+from accounts import AssumedRole, account_of_role, list_organization_accounts
+from inventory_reader import JsonCursor, iter_items, read_item
+from inventory_query import query, build_index, index_path
+from inventory_diff import diff_outputs
+import new_inventory_api
+import utils
+
+# Test InventoryTask Initialization
+def test_inventory_task_initialization():
+    task = InventoryTask('category', 'region_name', 'resource', 'boto_resource_name', 'node_name', {'key': 'value'}, lambda x: x)
+    assert task.category == 'category'
+    assert task.region_name == 'region_name'
+    assert task.resource == 'resource'
+    assert task.boto_resource_name == 'boto_resource_name'
+    assert task.node_name == 'node_name'
+    assert task.node == {'key': 'value'}
+    assert task.key == 'resource/node_name in region_name'
+    assert task.progress_callback is not None
 
 # Mock boto3 client
 @pytest.fixture
 def mock_boto3_client():
-    with patch('new_inventory_api.boto3.client') as mock:
+    with patch('new_inventory_api.client_pool.get_client') as mock:
         yield mock
 
 # Test detail_handling Function
 def test_detail_handling(mock_boto3_client: MagicMock | AsyncMock):
     client = mock_boto3_client.return_value
     inventory = {'key': [('item', {'detail': 'value'})]}
-    node_details = {'key': {'details': {'detail': {'item_search_id': 'id', 'detail_function': 'function', 'detail_param': 'param'}}}}
-    detail_handling(client, inventory, node_details, 'resource', 'key')
+    node = {'details': {'detail': {'item_search_id': 'id', 'detail_function': 'function', 'detail_param': 'param'}}}
+    detail_handling(client, inventory, node, 'resource', 'key')
     client.function.assert_called()
 
+# Test detail_handling merges the concurrent detail calls in the order of the items
+def test_detail_handling_merge_order():
+    client = MagicMock()
+    client.get_function.side_effect = lambda FunctionName: (time.sleep(0.05 if FunctionName == 'f1' else 0), {'Configuration': {'Name': FunctionName}})[1]
+    inventory = {'Functions': [{'FunctionName': 'f1'}, {'FunctionName': 'f2'}]}
+    node = {'details': {'Configuration': {'item_search_id': 'FunctionName', 'detail_function': 'get_function', 'detail_param': 'FunctionName'}}}
+    detail_handling(client, inventory, node, 'lambda', 'Functions')
+    assert [item['Configuration']['Name'] for item in inventory['Functions']] == ['f1', 'f2']
+
+# Test a detail missing from its response is logged, and not merged in the item
+def test_merge_detail_missing_key():
+    item = {'FunctionName': 'f1'}
+    with patch('new_inventory_api.write_log') as mock_write_log:
+        merge_detail({'Functions': [item]}, 'Functions', 0, item, 'Configuration', {'Code': {'Location': 'url'}})
+    assert item == {'FunctionName': 'f1'}
+    assert 'Configuration not found' in mock_write_log.call_args.args[0]
+
+# Test the detail parameter of a tuple item without value is searched in its first element, if it is a dict
+def test_get_detail_param_value_tuple():
+    assert get_detail_param_value(('name', 'value'), 'Id', 'param') == 'value'
+    assert get_detail_param_value(({'Id': 'id-1'}, None), 'Id', 'param') == 'id-1'
+    assert get_detail_param_value(('name', {}), 'Id', 'param') is None
+
 # Test inventory_handling Function
 def test_inventory_handling(mock_boto3_client: MagicMock | AsyncMock):
     client = mock_boto3_client.return_value
-    node_details = {'item': {'function': 'list_buckets'}}
-    inventory_handling('category', 'region_name', 'resource', 'boto_resource_name', node_details, 'key', lambda x: x)
+    client.can_paginate.return_value = False
+    node = {'function': 'list_buckets'}
+    inventory_handling('category', 'region_name', 'resource', 'boto_resource_name', 'Buckets', node, lambda x: x)
     client.list_buckets.assert_called()
 
+# Test pagination with a botocore paginator
+def test_iter_pages_with_paginator():
+    client = boto3.client('lambda', region_name='us-east-1', aws_access_key_id='testing', aws_secret_access_key='testing')
+    with Stubber(client) as stubber:
+        stubber.add_response('list_functions', {'Functions': [{'FunctionName': 'f1'}], 'NextMarker': 'm1'}, {'MaxItems': 50})
+        stubber.add_response('list_functions', {'Functions': [{'FunctionName': 'f2'}]}, {'MaxItems': 50, 'Marker': 'm1'})
+        pages = list(iter_pages(client, 'list_functions', {'page_size': 50}))
+    assert [page['Functions'][0]['FunctionName'] for page in pages] == ['f1', 'f2']
+
+# Test pagination described in the YAML node
+def test_iter_pages_with_yaml_pagination():
+    client = MagicMock()
+    client.can_paginate.return_value = False
+    client.describe_connections.side_effect = [{'connections': [1], 'nextToken': 't1'}, {'connections': [2]}]
+    node = {'page_size': 10, 'pagination': {'input_token': 'nextToken', 'output_token': 'nextToken', 'limit_key': 'maxResults'}}
+    pages = list(iter_pages(client, 'describe_connections', node))
+    assert len(pages) == 2
+    client.describe_connections.assert_called_with(maxResults=10, nextToken='t1')
+
+# Test the asyncio engine (without aiobotocore)
+def test_async_engine_runs_tasks(mock_boto3_client: MagicMock | AsyncMock):
+    client = mock_boto3_client.return_value
+    client.can_paginate.return_value = False
+    client.list_buckets.return_value = {'Buckets': [{'Name': 'bucket'}]}
+    task = InventoryTask('Storage', 'global', 's3', 's3', 'Buckets', {'function': 'list_buckets'}, lambda x: x)
+    AsyncEngine(new_inventory_api.client_pool, max_in_flight=4, use_aiobotocore=False).run([task])
+    client.list_buckets.assert_called()
+    assert new_inventory_api.results['Storage']['s3']['Buckets']['global'] == [{'Name': 'bucket'}]
+
 # Test resource_inventory Function
 def test_resource_inventory():
-    thread_list = []
+    task_list = []
     progress_callback = lambda x: x
-    node_details = {'node': {'details': {}}}
-    resource_inventory(progress_callback, thread_list, 'category', 'resource', 'boto_resource_name', node_details, 'region_name')
-    assert len(thread_list) == 1
-    assert isinstance(thread_list[0], InventoryThread)
+    node_details = {'node': {'details': {}}, 'other_node': {'details': {}}}
+    resource_inventory(progress_callback, task_list, 'category', 'resource', 'boto_resource_name', node_details, 'region_name')
+    assert len(task_list) == 2
+    assert all(isinstance(task, InventoryTask) for task in task_list)
+    assert [task.node_name for task in task_list] == ['node', 'other_node']
 
 # Test list_used_resources Function
 @patch('new_inventory_api.get_all_regions', return_value=[{'RegionName': 'us-east-1'}])
-@patch('new_inventory_api.boto3.client')
-def test_list_used_resources(mock_boto3_client: MagicMock | AsyncMock, mock_get_all_regions):
+@patch('new_inventory_api.client_pool.get_client')
+def test_list_used_resources(mock_boto3_client: MagicMock | AsyncMock, mock_get_all_regions, monkeypatch: pytest.MonkeyPatch, tmp_path):
+    # The run writes its output, log and timing history in the current directory
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(new_inventory_api.log_dir)
+    os.makedirs(new_inventory_api.output_dir)
+    monkeypatch.setattr(new_inventory_api, 'with_extra', True)
+    monkeypatch.setattr(new_inventory_api, 'results', {})
     mock_sts_client = mock_boto3_client.return_value
     mock_sts_client.get_caller_identity.return_value = {"Account": "123456789012"}
     inventory_structure = [{'resource': {'category': 'cat', 'boto_resource_name': 'res', 'region_type': ['local'], 'inventory_nodes': {}}}]
     results = list_used_resources(inventory_structure)
     assert 'regions' in results
 
+# Test ClientPool reuse
+def test_client_pool_reuses_clients():
+    session = MagicMock()
+    pool = ClientPool(session_factory=lambda: session)
+    first = pool.get_client('s3', 'eu-west-1')
+    second = pool.get_client('s3', 'eu-west-1')
+    pool.get_client('s3', 'eu-west-3')
+    assert first is second
+    assert session.client.call_count == 2
+    assert pool.stats() == {'clients': 2, 'hits': 1, 'misses': 2}
+
+# Test the sessions of a pool with given credentials all get the same credentials object, through their provider
+def test_client_pool_shares_credentials():
+    credentials = Credentials('key', 'secret', 'token')
+    pool = ClientPool(credentials=credentials)
+    sessions = [pool.session_factory() for _ in range(2)]
+    assert all(session.get_credentials() is credentials for session in sessions)
+
+# Test the AIMD rate of TokenBucket
+def test_token_bucket_adapts_rate_to_throttling():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() > 0
+    bucket.on_response(throttled=True)
+    assert bucket.rate == 5
+    bucket.on_response(throttled=False)
+    assert bucket.rate == 5.5
+    assert (bucket.calls, bucket.throttles) == (3, 1)
+
+# Test RateLimiter hooks on the calls of a client
+def test_rate_limiter_registers_client():
+    limiter = RateLimiter(default_rate=100)
+    limiter.configure('sqs', 50, 10)
+    client = boto3.client('sqs', region_name='eu-west-1', aws_access_key_id='testing', aws_secret_access_key='testing')
+    limiter.register(client)
+    with Stubber(client) as stubber:
+        stubber.add_response('list_queues', {'QueueUrls': []})
+        client.list_queues()
+    bucket = limiter.bucket('sqs', 'eu-west-1')
+    assert bucket.max_rate == 50
+    assert limiter.stats()['services']['sqs']['throttles'] == 0
+
+# Test the pruning of the services not available in a region
+def test_service_availability():
+    availability = ServiceAvailability(boto3.Session())
+    assert availability.is_available('ec2', 'eu-west-3')
+    assert availability.is_available('braket', 'us-east-1')
+    assert not availability.is_available('braket', 'ap-south-1')
+    assert not availability.is_available('not_a_service', 'us-east-1')
+    assert availability.is_available('iam')
+    regions = [{'RegionName': 'us-east-1', 'OptInStatus': 'opt-in-not-required'}, {'RegionName': 'af-south-1', 'OptInStatus': 'not-opted-in'}]
+    assert [region['RegionName'] for region in enabled_regions(regions)] == ['us-east-1']
+
+# Test the number of workers follows the latency and the throttling of the calls
+def test_adaptive_concurrency():
+    controller = AdaptiveConcurrency(10, min_workers=2, max_workers=12, increase=2, decrease=0.5)
+    for _ in range(10):
+        controller.record(0.1)
+    assert controller.adjust() == 12
+    controller.record(0.1)
+    controller.record(0.1, throttled=True)
+    assert controller.adjust() == 6
+    controller.record(0.5)
+    assert controller.adjust() == 3
+    assert controller.adjust() == 3
+    assert controller.semaphore.limit == 3
+    assert [sample['workers'] for sample in controller.history] == [12, 6, 3, 3]
+
+    # The latency is compared per operation: fast IAM calls first, then slower describe calls, are not an overload
+    controller = AdaptiveConcurrency(4, min_workers=1, max_workers=20, increase=2, decrease=0.5)
+    controller.record(0.02, operation='iam.ListRoles')
+    assert controller.adjust() == 6
+    for _ in range(5):
+        controller.record(0.4, operation='ec2.DescribeInstances')
+    controller.record(0.02, operation='iam.ListRoles')
+    assert controller.adjust() == 8
+
+# Test the latency is measured from the sending of the request, after the wait of the rate limiter
+def test_adaptive_concurrency_excludes_rate_limit_wait():
+    controller = AdaptiveConcurrency(4)
+    client = boto3.client('ec2', region_name='us-east-1', aws_access_key_id='t', aws_secret_access_key='t')
+    client.meta.events.register('before-send', lambda **kwargs: time.sleep(0.2))  # the rate limiter, registered first
+    controller.register(client)
+    client.meta.events.emit('before-send.ec2.DescribeInstances', request=None)
+    client.meta.events.emit('response-received.ec2.DescribeInstances', parsed_response={}, context={})
+    assert list(controller._latencies) == ['ec2.DescribeInstances']
+    assert controller._latencies['ec2.DescribeInstances'][0] < 0.1
+
+# Test the longest expected tasks are scheduled first
+def test_timing_history_sorts_longest_first(tmp_path):
+    path = str(tmp_path / 'timings_123456789012.json')
+    history = TimingHistory(path, default=1.0)
+    history.record('ec2', 'Instances', 'us-east-1', 8.0)
+    history.record('ec2', 'Instances', 'eu-west-1', 4.0)
+    history.record('sqs', 'QueueUrls', 'us-east-1', 0.5)
+    history.save()
+    history = TimingHistory(path, default=1.0)
+    assert history.estimate('ec2', 'Instances', 'eu-west-3') == 6.0
+    assert history.estimate('ec2', 'Volumes', 'us-east-1') == 6.0
+    assert history.estimate('lambda', 'Functions', 'us-east-1') == 1.0
+    tasks = [InventoryTask('cat', region, resource, resource, node, {}, None) for resource, node, region in
+             [('sqs', 'QueueUrls', 'us-east-1'), ('lambda', 'Functions', 'us-east-1'), ('ec2', 'Instances', 'eu-west-1'), ('ec2', 'Instances', 'us-east-1')]]
+    assert [task.key for task in history.sort_tasks(tasks)] == ['ec2/Instances in us-east-1', 'ec2/Instances in eu-west-1', 'lambda/Functions in us-east-1', 'sqs/QueueUrls in us-east-1']
+
+# Test the tasks completed in the journal are replayed instead of run again
+def test_journal_resume(tmp_path):
+    path = str(tmp_path / 'journal_run.jsonl')
+    done = InventoryTask('Storage', 'eu-west-1', 's3', 's3', 'Buckets', {}, None)
+    todo = InventoryTask('Compute', 'eu-west-1', 'lambda', 'lambda', 'Functions', {}, None)
+    journal = Journal(path).open()
+    journal.record(done, 'Buckets', [{'Name': 'bucket'}])
+    journal.close()
+    with open(path, 'a') as file:
+        file.write('{"task": "lambda/Func')  # interrupted while writing
+    journal = Journal(path)
+    assert journal.get(done)['items'] == [{'Name': 'bucket'}]
+    assert journal.get(todo) is None
+    with patch.dict(new_inventory_api.results, clear=True):
+        assert resume_tasks([done, todo], journal) == [todo]
+        assert new_inventory_api.results['Storage']['s3']['Buckets']['eu-west-1'] == [{'Name': 'bucket'}]
+    journal.remove()
+    assert not os.path.exists(path)
+
+# Test a task journals only its own items, even if another node stores items of the same object type and region
+def test_journal_records_task_items(tmp_path):
+    path = str(tmp_path / 'journal_run.jsonl')
+    task = InventoryTask('Storage', 'eu-west-1', 's3', 's3', 'Buckets', {}, None)
+    task.stored_pages = [[{'Name': 'a'}], [{'Name': 'b'}]]
+    journal = Journal(path).open()
+    with patch.dict(new_inventory_api.results, {'Storage': {'s3': {'Buckets': {'eu-west-1': [{'Name': 'a'}, {'Name': 'other'}, {'Name': 'b'}]}}}}, clear=True), \
+         patch.object(new_inventory_api, 'journal', journal):
+        task.checkpoint('Buckets')
+        new_inventory_api.results['Storage']['s3']['Buckets']['eu-west-1'].append({'Name': 'later'})
+    journal.close()
+    assert Journal(path).get(task)['items'] == [{'Name': 'a'}, {'Name': 'b'}]
+
+# Test an object that can't be encoded is skipped and reported, without losing the other ones
+def test_async_line_writer_errors(tmp_path):
+    path = str(tmp_path / 'records.jsonl')
+    writer = AsyncLineWriter(path, default=None)
+    for obj in ({'a': 1}, {'b': object()}, {'c': 3}):
+        writer.write(obj)
+    writer.close()
+    with open(path) as file:
+        assert [json.loads(line) for line in file] == [{'a': 1}, {'c': 3}]
+    assert writer.lines_written == 2 and writer.records_skipped == 1 and isinstance(writer.error, TypeError)
+    with pytest.raises(RuntimeError):
+        writer.write({'d': 4})
+
+# Test the NDJSON output writes the items of a completed task and frees them
+def test_ndjson_output(tmp_path):
+    path = str(tmp_path / 'inventory.ndjson')
+    sink = AsyncLineWriter(path, mode='w')
+    task = InventoryTask('Storage', 'eu-west-1', 's3', 's3', 'Buckets', {}, None)
+    with patch.dict(new_inventory_api.results, {'Storage': {'s3': {'Buckets': {'eu-west-1': [{'Name': 'a'}, {'Name': 'b'}]}}}}, clear=True), \
+         patch.object(new_inventory_api, 'output_sink', sink), patch.object(new_inventory_api, 'journal', None):
+        task.checkpoint('Buckets')
+        assert new_inventory_api.results['Storage']['s3']['Buckets'] == {}
+    sink.close()
+    with open(path) as file:
+        records = [json.loads(line) for line in file]
+    assert [record['item']['Name'] for record in records] == ['a', 'b']
+    assert records[0]['region'] == 'eu-west-1'
+
+# Test the SQLite output: one indexed table per object type, with the JSON of each item
+def test_sqlite_output(tmp_path):
+    import sqlite3
+    path = str(tmp_path / 'inventory.sqlite')
+    sink = SQLiteSink(path, '123456789012', batch_size=2)
+    task = InventoryTask('Storage', 'eu-west-1', 's3', 's3', 'Buckets', {}, None)
+    with patch.dict(new_inventory_api.results, {'Storage': {'s3': {'Buckets': {'eu-west-1': [{'Name': 'a'}, {'Name': 'b'}, {'Name': 'c'}]}}}}, clear=True), \
+         patch.object(new_inventory_api, 'output_sink', sink), patch.object(new_inventory_api, 'journal', None):
+        task.checkpoint('Buckets')
+    sink.close()
+    assert sink.error is None and sink.records_written == 3
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT table_name, resource, object_type FROM inventory_tables").fetchall() == [('s3_Buckets', 's3', 'Buckets')]
+    rows = connection.execute("SELECT account_id, region, item_id, json_extract(item, '$.Name') FROM s3_Buckets ORDER BY rowid").fetchall()
+    assert rows == [('123456789012', 'eu-west-1', name, name) for name in 'abc']
+    assert {row[1] for row in connection.execute("PRAGMA index_list(s3_Buckets)")} == {'s3_Buckets_account_id', 's3_Buckets_region', 's3_Buckets_collected_at'}
+    connection.close()
+    with pytest.raises(RuntimeError):
+        sink.write({'category': 'Storage', 'resource': 's3', 'object_type': 'Buckets', 'region': 'eu-west-1', 'collected_at': '', 'item': {}})
+
+# Test the encoders write the same document as the json module, streamed one top-level value at a time and compressed
+def test_json_encoders(tmp_path):
+    import gzip
+    from datetime import datetime, timezone
+    document = {'Compute': {'ec2': {'Instances': {'eu-west-1': [{'LaunchTime': datetime(2024, 1, 1, tzinfo=timezone.utc), 'Ids': [1, 2**70]}]}}},
+                'Storage': {}, 'regions': [{'RegionName': 'eu-west-1'}]}
+    path = write_json(str(tmp_path / 'json.json'), document, JsonEncoder('json'))
+    with open(path, 'rb') as file:
+        assert file.read() == json.dumps(document, indent=4, default=json_serial).encode()
+    expected = json.loads(json.dumps(document, default=json_serial))
+    for name in available_encoders():
+        for compact in (False, True):
+            path = write_json(str(tmp_path / f"{name}_{compact}.json"), document, JsonEncoder(name, compact), 'gzip')
+            assert path.endswith('.json.gz')
+            with gzip.open(path) as file:
+                assert json.loads(file.read()) == expected
+
+# Test the query of an output through its index: the items are found by key, then read at their offset
+def test_inventory_query(tmp_path):
+    reservations = [{'ReservationId': f"r-{n}", 'Instances': [{'InstanceId': f"i-{n}", 'InstanceType': 't3.micro' if n % 2 else 'm5.large',
+                     'Tags': [{'Key': 'Name', 'Value': f"sérveur-{n}"}, {'Key': 'Env', 'Value': 'prod' if n < 3 else 'dev'}]}]} for n in range(6)]
+    document = {'Compute': {'ec2': {'Reservations': {'eu-west-1': reservations[:4], 'us-east-1': reservations[4:]}}},
+                'Storage': {'s3': {'Buckets': {'global': [{'Name': 'bucket', 'Arn': 'arn:aws:s3:::bucket'}]}}}}
+    path = write_json(str(tmp_path / 'inventory.json'), document, JsonEncoder(available_encoders()[0]))
+    with open(path, 'rb') as file:
+        data = file.read()
+    # A small window makes the cursor read the items across several windows (and the non-ASCII characters)
+    cursor = JsonCursor(data, window=64)
+    assert cursor.peek() == '{'
+    items = list(iter_items(data))
+    assert len(items) == 7 and all(read_item(data, offset, length) == item for _, item, offset, length in items)
+
+    assert build_index(path) == 7
+    records = list(query(path, ids=['i-4']))
+    assert [(record['region'], record['item']['ReservationId']) for record in records] == [('us-east-1', 'r-4')]
+    assert [record['item']['ReservationId'] for record in query(path, tags=[('Env', 'prod')], region='eu-west-1')] == ['r-0', 'r-1', 'r-2']
+    assert [record['item']['ReservationId'] for record in query(path, tags=[('Env', 'dev')], where=[('Instances.InstanceType', 'm5.large')])] == ['r-4']
+    assert [record['item']['Name'] for record in query(path, arns=['arn:aws:s3:::bucket'])] == ['bucket']
+    assert list(query(path, names=['missing'])) == []
+    # An output written again gets a new index
+    write_json(str(tmp_path / 'inventory.json'), {'Storage': document['Storage']}, JsonEncoder('json'))
+    assert [record['resource'] for record in query(path)] == ['s3']
+
+# Test the comparison of two outputs: the items are matched by item_search_id, then by the key named after their type
+def test_inventory_diff(tmp_path):
+    def output(name, clusters, vpcs, summary):
+        document = {'Compute': {'ecs': {'clusters': {'eu-west-1': clusters}}},
+                    'Networking': {'ec2': {'Summary': {'global': summary}, 'Vpcs': {'eu-west-1': vpcs, 'us-east-1': [{'VpcId': 'vpc-us'}]}}}}
+        return write_json(str(tmp_path / name), document, JsonEncoder('json'))
+    ids = {('ecs', 'clusters'): 'clusterName'}
+    old = output('old.json', [{'clusterName': 'a', 'status': 'ACTIVE'}, {'clusterName': 'b', 'status': 'ACTIVE'}],
+                 [{'OwnerId': '1', 'VpcId': 'vpc-1'}, {'OwnerId': '1', 'VpcId': 'vpc-2', 'CidrBlock': '10.0.0.0/16'}], {'Count': 1})
+    new = output('new.json', [{'clusterName': 'b', 'status': 'INACTIVE'}, {'clusterName': 'c', 'status': 'ACTIVE'}],
+                 [{'OwnerId': '1', 'VpcId': 'vpc-2', 'CidrBlock': '10.1.0.0/16'}, {'OwnerId': '1', 'VpcId': 'vpc-1'}], {'Count': 2})
+    report = diff_outputs(old, new, ids, with_items=True)
+    assert report['totals'] == {'added': 1, 'removed': 1, 'changed': 3, 'unchanged': 2}
+    changes = {(change['resource'], change['object_type'], change['region']): change for change in report['changes']}
+    assert set(changes) == {('ecs', 'clusters', 'eu-west-1'), ('ec2', 'Vpcs', 'eu-west-1'), ('ec2', 'Summary', 'global')}
+    clusters = changes[('ecs', 'clusters', 'eu-west-1')]
+    assert (clusters['added'], clusters['removed'], clusters['changed']) == (['c'], ['a'], ['b'])
+    assert clusters['changed_items'] == [{'clusterName': 'b', 'status': 'INACTIVE'}]
+    assert changes[('ec2', 'Vpcs', 'eu-west-1')]['changed'] == ['vpc-2']
+
+    # An NDJSON output is compared the same way
+    with open(tmp_path / 'new.ndjson', 'w') as file:
+        for region, vpcs in (('us-east-1', [{'VpcId': 'vpc-us'}]), ('eu-west-1', [{'OwnerId': '1', 'VpcId': 'vpc-1'}])):
+            for vpc in vpcs:
+                file.write(json.dumps({'category': 'Networking', 'resource': 'ec2', 'object_type': 'Vpcs', 'region': region, 'item': vpc}) + '\n')
+    report = diff_outputs(old, str(tmp_path / 'new.ndjson'), ids)
+    assert report['totals'] == {'added': 0, 'removed': 4, 'changed': 0, 'unchanged': 2}
+
+    # The groups of a JSON output must be sorted to be merged
+    unsorted = write_json(str(tmp_path / 'unsorted.json'), {'Storage': {'s3': {'Buckets': {'global': ['a']}}}, 'Compute': {'ecs': {'clusters': {'eu-west-1': ['b']}}}}, JsonEncoder('json'))
+    with pytest.raises(ValueError):
+        diff_outputs(old, unsorted, ids)
+
+# Test the queued log messages are all written, in order, once flushed
+def test_write_log_is_flushed(tmp_path):
+    log_file_path = str(tmp_path / 'test.log')
+    for index in range(100):
+        write_log(f"message {index}", log_file_path)
+    flush_logs()
+    with open(log_file_path) as log_file:
+        lines = log_file.read().splitlines()
+    assert len(lines) == 100
+    assert lines[0].endswith(' - message 0') and lines[-1].endswith(' - message 99')
+
+# Test no message is lost when the logs are flushed (their writers closed) while threads are logging
+def test_write_log_during_flush(tmp_path):
+    log_file_path = str(tmp_path / 'test.log')
+    def log_messages(thread):
+        for index in range(200):
+            write_log(f"message {thread} {index}", log_file_path)
+    threads = [threading.Thread(target=log_messages, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        flush_logs()
+    for thread in threads:
+        thread.join()
+    flush_logs()
+    with open(log_file_path) as log_file:
+        assert len(log_file.read().splitlines()) == 800
+    writer = AsyncLineWriter(str(tmp_path / 'closed.jsonl'))
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.write({'a': 1})
+
+# Test closing one log writes its messages and stops its writer, the other logs staying open
+def test_close_log(tmp_path):
+    log_file_path, other_log_path = str(tmp_path / 'account.log'), str(tmp_path / 'other.log')
+    write_log("account message", log_file_path)
+    write_log("other message", other_log_path)
+    close_log(log_file_path)
+    assert log_file_path not in utils._log_writers and other_log_path in utils._log_writers
+    with open(log_file_path) as log_file:
+        assert log_file.read().endswith(' - account message\n')
+    write_log("reopened", log_file_path)
+    flush_logs()
+    with open(log_file_path) as log_file:
+        assert len(log_file.read().splitlines()) == 2
+
+# Test each call is recorded in the calls file
+def test_call_telemetry(tmp_path):
+    telemetry = CallTelemetry(str(tmp_path / 'calls.jsonl'))
+    client = boto3.client('sqs', region_name='eu-west-1', aws_access_key_id='testing', aws_secret_access_key='testing')
+    telemetry.register(client)
+    with Stubber(client) as stubber:
+        stubber.add_response('list_queues', {'QueueUrls': ['url1', 'url2'], 'NextToken': 'token'})
+        stubber.add_client_error('list_queues', service_error_code='ThrottlingException', http_status_code=400)
+        client.list_queues()
+        with pytest.raises(Exception):
+            client.list_queues()
+    telemetry.close()
+    with open(telemetry.path) as file:
+        records = [json.loads(line) for line in file]
+    assert telemetry.records == 2
+    assert records[0]['service'] == 'sqs' and records[0]['region'] == 'eu-west-1' and records[0]['operation'] == 'ListQueues'
+    assert records[0]['items'] == 2 and records[0]['error'] is None
+    assert records[1]['throttled'] is True and records[1]['status'] == 400
+
+# Test no increment is lost when many threads count at the same time
+def test_sharded_counters():
+    counters = ShardedCounters(['completed_tasks', 'failed_resources'])
+    def work():
+        for _ in range(10000):
+            counters.increment('completed_tasks')
+        counters.increment('failed_resources', 2)
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counters.snapshot() == {'completed_tasks': 80000, 'failed_resources': 16}
+    counters.reset()
+    assert counters.get('completed_tasks') == 0
+
+# Test the compiled plan leaves out the invalid nodes and flattens the pagination and details
+def test_compile_plan():
+    structure = [{'lambda': {'category': 'Compute', 'boto_resource_name': 'Lambda', 'region_type': 'local', 'inventory_nodes': {
+        'Functions': {'function': 'list_functions', 'page_size': 50, 'details': {'Configuration': {'item_search_id': 'FunctionName', 'detail_function': 'get_function', 'detail_param': 'FunctionName'}}},
+        'Connections': {'function': 'describe_connections', 'pagination': {'limit_key': 'maxResults'}},
+        'Table': {'item_search_id': 'TableName', 'detail_function': 'describe_table', 'detail_param': 'TableName'}}}}]
+    plan = compile_plan(structure)
+    spec = plan.resources[0]
+    assert spec.service == 'lambda' and spec.is_global is False
+    assert list(spec.nodes) == ['Functions', 'Connections']
+    assert spec.nodes['Functions'].details[0].detail_function == 'get_function'
+    assert spec.nodes['Connections'].output_token == 'NextToken' and spec.nodes['Connections'].limit_key == 'maxResults'
+    assert plan.errors == ['lambda: node Table: missing function']
+
+# Test the plan is reused from the cache while the resource files are unchanged
+def test_load_plan_cache(tmp_path):
+    resource_dir = tmp_path / 'resources'
+    resource_dir.mkdir()
+    (resource_dir / 'inventory.yaml').write_text("s3:\n    region_type: global\n    boto_resource_name: s3\n    category: Storage\n    inventory_nodes:\n        Buckets:\n            function: list_buckets\n")
+    cache_path = str(tmp_path / 'cache' / 'plan.pickle')
+    plan, from_cache = load_plan(str(resource_dir), cache_path)
+    assert not from_cache and plan.resources[0].nodes['Buckets'].function == 'list_buckets'
+    plan, from_cache = load_plan(str(resource_dir), cache_path)
+    assert from_cache and plan.resources[0].is_global
+    (resource_dir / 'inventory.yaml').write_text((resource_dir / 'inventory.yaml').read_text().replace('list_buckets', 'list_directory_buckets'))
+    plan, from_cache = load_plan(str(resource_dir), cache_path)
+    assert not from_cache and plan.resources[0].nodes['Buckets'].function == 'list_directory_buckets'
+
+# Test the incremental mode: unchanged items keep their details, and the changes are found
+def test_snapshot_store(tmp_path):
+    node = NodeSpec('Functions', 'list_functions', details=(DetailSpec('Configuration', 'FunctionName', 'get_function', 'FunctionName'),))
+    store = SnapshotStore(str(tmp_path))
+    key = SnapshotStore.key('Compute', 'lambda', 'Functions', 'eu-west-1')
+    items = [{'FunctionName': 'f1', 'Runtime': 'python3.12'}, {'FunctionName': 'f2', 'Runtime': 'python3.12'}]
+    assert store.unchanged_items(key, items, node) == {}
+    for item in items:
+        item['Configuration'] = {'Timeout': 3}
+    assert store.commit('Compute', 'lambda', 'Functions', 'eu-west-1', 'Functions') == {'added': 2, 'removed': 0, 'modified': 0, 'unchanged': 0}
+    store.save('run1', [key])
+
+    store = SnapshotStore(str(tmp_path))
+    assert store.previous_run_id == 'run1'
+    items = [{'FunctionName': 'f1', 'Runtime': 'python3.12'}, {'FunctionName': 'f3', 'Runtime': 'python3.13'}]
+    unchanged = store.unchanged_items(key, items, node)
+    assert unchanged == {0: {'FunctionName': 'f1', 'Runtime': 'python3.12', 'Configuration': {'Timeout': 3}}}
+    client = MagicMock()
+    client.get_function.return_value = {'Timeout': 30}
+    inventory = {'Functions': items}
+    detail_handling(client, inventory, node, 'lambda', 'Functions', unchanged)
+    assert client.get_function.call_count == 1
+    assert inventory['Functions'][0]['Configuration'] == {'Timeout': 3}
+    assert store.commit('Compute', 'lambda', 'Functions', 'eu-west-1', 'Functions') == {'added': 1, 'removed': 1, 'modified': 0, 'unchanged': 1}
+    assert store.delta()['Compute']['lambda']['Functions']['eu-west-1']['removed'] == ['f2']
+
+# Test the detail cache makes one call for concurrent identical calls, and expires, evicts and persists the responses
+def test_detail_cache(tmp_path):
+    cache = DetailCache(ttl=60, max_bytes=10000, path=str(tmp_path / 'details.pickle'))
+    calls = []
+    def describe():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'SecurityGroups': [{'GroupId': 'sg-1'}]}
+    key = DetailCache.key('ec2', 'eu-west-1', 'describe_security_groups', {'GroupIds': ['sg-1']})
+    threads = [threading.Thread(target=cache.call, args=(key, describe)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.call(key, describe) == {'SecurityGroups': [{'GroupId': 'sg-1'}]}
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats['misses'] == 1 and stats['hits'] + stats['deduplicated'] == 8
+    with pytest.raises(ValueError):
+        cache.call('failing', lambda: (_ for _ in ()).throw(ValueError('error')))
+    assert cache.stats()['entries'] == 1
+    for index in range(50):
+        cache.call(f"key{index}", lambda: {'Data': 'x' * 500})
+    assert cache.stats()['evictions'] > 0 and cache.size <= 10000
+    cache.save()
+    assert DetailCache(path=str(tmp_path / 'details.pickle')).stats()['loaded'] == cache.stats()['entries']
+    expired = DetailCache(ttl=0)
+    expired.call(key, describe)
+    expired.call(key, describe)
+    assert expired.stats()['expirations'] == 1
+
+# Test each caller of the detail cache gets its own copy of the response, without its metadata
+def test_detail_cache_copies(monkeypatch):
+    monkeypatch.setattr(new_inventory_api, 'detail_cache', DetailCache())
+    monkeypatch.setattr(new_inventory_api, 'with_meta', False)
+    client = MagicMock()
+    client.meta.service_model.service_name = 'ec2'
+    client.meta.region_name = 'eu-west-1'
+    client.describe_security_groups.side_effect = lambda **params: {'SecurityGroups': [{'GroupId': 'sg-1'}], 'ResponseMetadata': {'RequestId': 'r1'}}
+    first = call_detail(client, 'describe_security_groups', 'GroupIds', ['sg-1'], None)
+    first['SecurityGroups'][0]['Merged'] = True
+    second = call_detail(client, 'describe_security_groups', 'GroupIds', ['sg-1'], None)
+    assert second == {'SecurityGroups': [{'GroupId': 'sg-1'}]}
+    assert client.describe_security_groups.call_count == 1
+
+# Test the batched details are called once per batch, and the responses split back to their items
+def test_detail_handling_batches():
+    client = MagicMock()
+    client.describe_services.side_effect = lambda services: {
+        'services': [{'serviceArn': arn, 'status': 'ACTIVE'} for arn in services if arn != 's3'],
+        'failures': [{'arn': 's3', 'reason': 'MISSING'}]}
+    inventory = {'Services': [{'ServiceArn': 's1'}, {'ServiceArn': 's2'}, {'ServiceArn': 's1'}, {'ServiceArn': 's3'}]}
+    node = {'details': {'Service': {'item_search_id': 'ServiceArn', 'detail_function': 'describe_services', 'detail_param': 'services', 'batch_size': 2}}}
+    detail_handling(client, inventory, node, 'ecs', 'Services')
+    assert [call.kwargs['services'] for call in client.describe_services.call_args_list] == [['s1', 's2'], ['s3']]
+    assert [item.get('Service', {}).get('serviceArn') for item in inventory['Services']] == ['s1', 's2', 's1', None]
+
+# Test the assumed role credentials are cached, and the accounts of an OU are listed with the ones of its child OUs
+def test_accounts():
+    from datetime import datetime, timedelta, timezone
+    assert account_of_role('arn:aws:iam::111111111111:role/Inventory') == '111111111111'
+    with pytest.raises(ValueError):
+        account_of_role('arn:aws:iam::111111111111:user/Inventory')
+    sts_client = MagicMock()
+    sts_client.assume_role.return_value = {'Credentials': {'AccessKeyId': 'AK', 'SecretAccessKey': 'SK', 'SessionToken': 'ST',
+                                                           'Expiration': datetime.now(timezone.utc) + timedelta(hours=1)}}
+    role = AssumedRole(sts_client, 'arn:aws:iam::111111111111:role/Inventory', duration=900, external_id='id')
+    credentials = role.credentials()
+    assert role.credentials() is credentials and credentials.get_frozen_credentials().access_key == 'AK'
+    sts_client.assume_role.assert_called_once_with(RoleArn='arn:aws:iam::111111111111:role/Inventory', RoleSessionName='aws-inventory',
+                                                   DurationSeconds=900, ExternalId='id')
+    organizations = boto3.client('organizations', region_name='us-east-1')
+    stubber = Stubber(organizations)
+    stubber.add_response('list_accounts_for_parent', {'Accounts': [{'Id': '111111111111', 'Status': 'ACTIVE'}, {'Id': '222222222222', 'Status': 'SUSPENDED'}]}, {'ParentId': 'ou-root'})
+    stubber.add_response('list_organizational_units_for_parent', {'OrganizationalUnits': [{'Id': 'ou-child'}]}, {'ParentId': 'ou-root'})
+    stubber.add_response('list_accounts_for_parent', {'Accounts': [{'Id': '333333333333', 'Status': 'ACTIVE'}]}, {'ParentId': 'ou-child'})
+    stubber.add_response('list_organizational_units_for_parent', {'OrganizationalUnits': []}, {'ParentId': 'ou-child'})
+    with stubber:
+        assert [account['Id'] for account in list_organization_accounts(organizations, 'ou-root')] == ['111111111111', '333333333333']
+
 # Test Command-Line Arguments
-def test_command_line_args(monkeypatch: pytest.MonkeyPatch):
-    monkeypatch.setattr('sys.argv', ['new_inventory_api.py', '--resource-dir', 'resources', '--with-meta', '--with-extra', '--with-empty'])
-    import new_inventory_api
-    assert new_inventory_api.resource_dir == 'resources'
-    assert new_inventory_api.with_meta is True
-    assert new_inventory_api.with_extra is True
-    assert new_inventory_api.with_empty is True
\ No newline at end of file
+def test_command_line_args():
+    args = parse_args(['--resource-dir', 'resources', '--with-meta', '--with-extra', '--with-empty'])
+    assert args.resource_dir == 'resources'
+    assert args.with_meta is True
+    assert args.with_extra is True
+    assert args.with_empty is True
+    assert (args.engine, args.format, args.encoder, args.detail_workers) == ('threads', 'json', 'auto', new_inventory_api.num_detail_threads)
+    args = parse_args(['--engine', 'asyncio', '--format', 'sqlite', '--encoder', 'json', '--detail-workers', '8'])
+    assert (args.engine, args.format, args.encoder, args.detail_workers) == ('asyncio', 'sqlite', 'json', 8)
+    assert parse_args(['--incremental']).incremental is True
+
+# Test the invalid and conflicting command-line arguments are rejected
+@pytest.mark.parametrize('argv', [
+    ['--engine', 'processes'],
+    ['--format', 'csv'],
+    ['--detail-workers', 'many'],
+    ['--incremental', '--resume', '20240101_000000'],
+    ['--incremental', '--format', 'ndjson'],
+    ['--encoder', 'orjson'],
+    ['--role-arn', 'arn:aws:iam::123456789012:role/Inventory', '--dry-run'],
+])
+def test_command_line_args_errors(argv, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(new_inventory_api, 'available_encoders', lambda: ['json'])
+    with pytest.raises(SystemExit) as exit_info:
+        parse_args(argv)
+    assert exit_info.value.code == 2
\ No newline at end of file
@@ -0,0 +1,98 @@
+# timing_history.py
+
+import os
+import json
+from statistics import median
+
+class TimingHistory:
+
+    """
+    Durations of the inventory tasks in the previous runs, stored locally per account.
+
+    The history is used to start the longest expected tasks first (LPT scheduling), so the slow ones don't stretch
+    the tail of the run. Each duration is a moving average over the runs. A task never seen before gets the median
+    duration of the same node in the other regions, or else of the same resource, or else 'default'.
+    """
+
+    def __init__(self, path, alpha=0.5, default=1.0):
+        """
+        Initialize the history, loading the previous runs if the file exists.
+
+        Args:
+            path (str): The path of the JSON history file.
+            alpha (float): The weight of the last run in the moving average.
+            default (float): The expected duration of the tasks without any history, in seconds.
+        """
+
+        self.path = path
+        self.alpha = alpha
+        self.default = default
+        self.timings = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as file:
+                    self.timings = json.load(file)
+            except (OSError, ValueError):
+                self.timings = {}
+
+    def record(self, resource, node_name, region_name, duration):
+        """
+        Record the duration of a task.
+
+        Args:
+            resource (str): The resource of the task.
+            node_name (str): The inventory node of the task.
+            region_name (str): The region of the task.
+            duration (float): The duration of the task, in seconds.
+        """
+
+        regions = self.timings.setdefault(resource, {}).setdefault(node_name, {})
+        previous = regions.get(region_name)
+        regions[region_name] = round(duration if previous is None else self.alpha * duration + (1 - self.alpha) * previous, 4)
+
+    def estimate(self, resource, node_name, region_name):
+        """
+        Get the expected duration of a task.
+
+        Args:
+            resource (str): The resource of the task.
+            node_name (str): The inventory node of the task.
+            region_name (str): The region of the task.
+
+        Returns:
+            float: The expected duration, in seconds.
+        """
+
+        nodes = self.timings.get(resource, {})
+        regions = nodes.get(node_name, {})
+        if region_name in regions:
+            return regions[region_name]
+        if regions:
+            return median(regions.values())
+        durations = [duration for node_regions in nodes.values() for duration in node_regions.values()]
+        if durations:
+            return median(durations)
+        return self.default
+
+    def sort_tasks(self, tasks):
+        """
+        Sort tasks by expected duration, the longest first. Tasks with the same estimate keep their order.
+
+        Args:
+            tasks (list): The inventory tasks.
+
+        Returns:
+            list: The sorted tasks.
+        """
+
+        return sorted(tasks, key=lambda task: self.estimate(task.resource, task.node_name, task.region_name), reverse=True)
+
+    def save(self):
+        """Write the history file (through a temporary file, so an interrupted run can't corrupt it)."""
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(self.timings, file, indent=4, sort_keys=True)
+        os.replace(temp_path, self.path)
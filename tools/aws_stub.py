@@ -0,0 +1,608 @@
+"""
+Local stand-in for the AWS endpoints, used to benchmark the inventory engines without an AWS account.
+
+The responses are built from the botocore models, in the protocol of the called service (json, rest-json, query,
+ec2, rest-xml), after a configurable latency:
+
+- the inventory functions of the resource files return 'items' generated items, split in pages as the paginator
+  of the function (botocore or 'pagination' node of the resource file) expects,
+- the other functions (detail functions) return one generated object,
+- a share of the calls ('throttle_rate') is answered with the throttling error of the protocol.
+
+A few calls needed to start an inventory get real answers: ec2:DescribeRegions (the list of the simulated regions),
+sts:AssumeRole (credentials for the account of the role) and sts:GetCallerIdentity (the account of the credentials,
+a fake account by default). With 'items' set to 0, every other response is empty.
+
+Usage:
+    python tools/aws_stub.py --port 8765 --regions 4 --items 50 --page-size 20 --latency 0.05 --throttle-rate 0.02
+    AWS_ENDPOINT_URL=http://127.0.0.1:8765 AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing AWS_DEFAULT_REGION=us-east-1 python new_inventory_api.py
+"""
+
+import os
+import re
+import glob
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import yaml
+import botocore.session
+from botocore import xform_name
+
+STUB_ACCOUNT_ID = '123456789012'
+
+# Regions returned by ec2:DescribeRegions, the first 'regions' ones are used
+STUB_REGIONS = [
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-west-2', 'eu-west-3', 'eu-central-1',
+    'eu-north-1', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3', 'ap-southeast-1',
+    'ap-southeast-2', 'ca-central-1', 'sa-east-1',
+]
+
+CREDENTIAL_SCOPE = re.compile(r'Credential=([^/]+)/\d+/([^/]+)/([^/]+)/aws4_request')
+
+# Access keys given by sts:AssumeRole: the account of the role follows the prefix
+ASSUMED_KEY_PREFIX = 'STUB'
+
+# Depth of the generated objects: deeper structures and lists are left out
+MAX_DEPTH = 3
+
+STUB_TIMESTAMP = 1704067200 # 2024-01-01T00:00:00Z
+
+TOKEN_PREFIX = 'stub-token-'
+
+PAGINATION_MEMBER = re.compile(r'(?i)(token|marker)$|^IsTruncated$')
+
+# ------------------------------------------------------------------------------
+
+def load_service_models(resource_dir):
+    """
+    Load the botocore models of the services used in the resource files, and the pagination of their inventory functions.
+
+    Args:
+        resource_dir (str): The directory containing the YAML resource files.
+
+    Returns:
+        tuple: The service models by signing name (and endpoint prefix), and the pagination of each inventory
+        function by (service name, operation name). The pagination is None for the functions called only once.
+    """
+    session = botocore.session.get_session()
+    functions = {'ec2': {}, 'sts': {}}
+    for yaml_file in sorted(glob.glob(os.path.join(resource_dir, '*.yaml'))):
+        with open(yaml_file, 'r') as file:
+            for resource_info in yaml.safe_load(file).values():
+                nodes = functions.setdefault(resource_info['boto_resource_name'].lower(), {})
+                for node in (resource_info.get('inventory_nodes') or {}).values():
+                    if node.get('function'):
+                        nodes[node['function']] = node.get('pagination')
+
+    service_models = {}
+    inventory_operations = {}
+    for service, nodes in functions.items():
+        try:
+            service_model = session.get_service_model(service)
+        except Exception:
+            continue
+        service_models.setdefault(service_model.signing_name, []).append(service_model)
+        if service_model.endpoint_prefix != service_model.signing_name:
+            service_models.setdefault(service_model.endpoint_prefix, []).append(service_model)
+
+        try:
+            paginator_model = session.get_paginator_model(service)
+        except Exception:
+            paginator_model = None
+        operation_names = {xform_name(name): name for name in service_model.operation_names}
+        for function, pagination in nodes.items():
+            operation_name = operation_names.get(function)
+            if operation_name is None:
+                continue
+            if paginator_model is not None:
+                try:
+                    pagination = paginator_model.get_paginator(operation_name)
+                except ValueError:
+                    pass
+            inventory_operations[(service_model.service_name, operation_name)] = pagination
+
+    return service_models, inventory_operations
+
+def compile_route(operation_model):
+    """
+    Compile the HTTP route of an operation of a REST service.
+
+    Args:
+        operation_model (OperationModel): The operation.
+
+    Returns:
+        tuple: The HTTP method, the regular expression of the path, the query keys required by the route
+        (ex: '?location' for s3:GetBucketLocation), and the number of literal characters of the path.
+    """
+    path, _, query = operation_model.http.get('requestUri', '/').partition('?')
+    pattern = ''
+    literal = 0
+    for part in re.split(r'(\{[^}]+\})', path):
+        if part.startswith('{'):
+            pattern += '(.+)' if part.endswith('+}') else '([^/]+)'
+        else:
+            pattern += re.escape(part)
+            literal += len(part)
+    required = frozenset(key.split('=')[0] for key in query.split('&') if key)
+    return operation_model.http.get('method', 'POST'), re.compile(pattern.rstrip('/') + '/?'), required, literal
+
+# ------------------------------------------------------------------------------
+
+def generate_value(shape, name, index, depth=0):
+    """
+    Generate a value for a shape of a botocore model.
+
+    Args:
+        shape (Shape): The shape.
+        name (str): The name of the member holding the value.
+        index (int): The index of the generated item, to get distinct identifiers.
+        depth (int): The depth of the value in the generated item.
+
+    Returns:
+        object: The value, or None to leave the member out.
+    """
+    type_name = shape.type_name
+    if type_name == 'string':
+        return shape.enum[0] if shape.enum else f"{name}-{index}"
+    if type_name in ('integer', 'long'):
+        return index
+    if type_name in ('float', 'double'):
+        return float(index)
+    if type_name == 'boolean':
+        return False
+    if type_name == 'timestamp':
+        return STUB_TIMESTAMP
+    if depth >= MAX_DEPTH or getattr(shape, 'is_document_type', False):
+        return None
+    if type_name == 'structure':
+        return generate_structure(shape, index, depth + 1)
+    if type_name == 'list':
+        value = generate_value(shape.member, name, index, depth + 1)
+        return [value] if value is not None else None
+    return None # blobs and maps
+
+def generate_structure(shape, index, depth=0):
+    """
+    Generate the members of a structure found in the body of a response.
+
+    Args:
+        shape (StructureShape): The structure.
+        index (int): The index of the generated item.
+        depth (int): The depth of the structure in the generated item.
+
+    Returns:
+        dict: The value of each member, by member name.
+    """
+    structure = {}
+    for member_name, member_shape in shape.members.items():
+        if member_shape.serialization.get('location'):
+            continue # headers and status code
+        value = generate_value(member_shape, member_name, index, depth)
+        if value is not None:
+            structure[member_name] = value
+    return structure
+
+# ------------------------------------------------------------------------------
+
+def serialize_json(shape, value):
+    """
+    Serialize a generated value for the json and rest-json protocols.
+
+    Args:
+        shape (Shape): The shape of the value.
+        value (object): The value.
+
+    Returns:
+        object: The value, with the serialized names of the members.
+    """
+    if shape.type_name == 'structure':
+        return {shape.members[name].serialization.get('name', name): serialize_json(shape.members[name], member_value)
+                for name, member_value in value.items()}
+    if shape.type_name == 'list':
+        return [serialize_json(shape.member, member_value) for member_value in value]
+    return value
+
+def serialize_xml(shape, value, tag):
+    """
+    Serialize a generated value for the query, ec2 and rest-xml protocols.
+
+    Args:
+        shape (Shape): The shape of the value.
+        value (object): The value.
+        tag (str): The name of the XML element.
+
+    Returns:
+        str: The XML element(s).
+    """
+    if shape.type_name == 'structure':
+        return f"<{tag}>{serialize_members(shape, value)}</{tag}>"
+    if shape.type_name == 'list':
+        if shape.serialization.get('flattened'):
+            member_tag = shape.member.serialization.get('name', tag)
+            return ''.join(serialize_xml(shape.member, member_value, member_tag) for member_value in value)
+        member_tag = shape.member.serialization.get('name', 'member')
+        return f"<{tag}>{''.join(serialize_xml(shape.member, member_value, member_tag) for member_value in value)}</{tag}>"
+    if shape.type_name == 'boolean':
+        return f"<{tag}>{'true' if value else 'false'}</{tag}>"
+    if shape.type_name == 'timestamp':
+        return f"<{tag}>{time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(value))}</{tag}>"
+    return f"<{tag}>{escape(str(value))}</{tag}>"
+
+def serialize_members(shape, value):
+    """
+    Serialize the members of a generated structure as XML elements.
+
+    Args:
+        shape (StructureShape): The structure.
+        value (dict): The value of each member.
+
+    Returns:
+        str: The XML elements.
+    """
+    return ''.join(serialize_xml(shape.members[name], member_value, shape.members[name].serialization.get('name', name))
+                   for name, member_value in value.items())
+
+# ------------------------------------------------------------------------------
+
+class StubServer(ThreadingHTTPServer):
+
+    """HTTP server answering the AWS API calls of the inventory."""
+
+    daemon_threads = True
+
+    def __init__(self, address, resource_dir='resources', regions=4, latency=0.0, items=0, page_size=100, throttle_rate=0.0, seed=0):
+        """
+        Initialize a new stub server.
+
+        Args:
+            address (tuple): The (host, port) to listen on. Port 0 picks a free port.
+            resource_dir (str): The directory containing the YAML resource files.
+            regions (int): The number of simulated regions.
+            latency (float): The latency of each response, in seconds.
+            items (int): The number of items returned by each inventory function, in each region.
+            page_size (int): The number of items per page, when the call doesn't ask for a page size.
+            throttle_rate (float): The share of the calls answered with a throttling error (0 to 1).
+            seed (int): The seed of the throttling draws, for repeatable runs.
+        """
+        super().__init__(address, StubHandler)
+        self.service_models, self.inventory_operations = load_service_models(resource_dir)
+        self.routes = {}
+        self.regions = STUB_REGIONS[:regions]
+        self.latency = latency
+        self.items = items
+        self.page_size = page_size
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.throttled_count = 0
+        self.items_served = 0
+        self.operation_counts = Counter()
+        self.account_counts = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def endpoint_url(self):
+        """str: The URL to use as AWS_ENDPOINT_URL."""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        """Serve the requests in a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stats(self):
+        """
+        Get the counters of the server.
+
+        Returns:
+            dict: The number of requests, throttled requests, items served, and requests per operation and per account.
+        """
+        with self.lock:
+            return {
+                'requests': self.request_count,
+                'throttled': self.throttled_count,
+                'items': self.items_served,
+                'operations': dict(self.operation_counts),
+                'accounts': dict(self.account_counts),
+            }
+
+    def throttle(self):
+        """
+        Draw whether a call is throttled.
+
+        Returns:
+            bool: True if the call must get a throttling error.
+        """
+        if not self.throttle_rate:
+            return False
+        with self.lock:
+            throttled = self.random.random() < self.throttle_rate
+            self.throttled_count += throttled
+        return throttled
+
+    def find_operation(self, signing_name, method, path, query, target, action):
+        """
+        Find the operation called by a request.
+
+        Args:
+            signing_name (str): The signing name of the request (from its credential scope).
+            method (str): The HTTP method.
+            path (str): The path of the URL.
+            query (dict): The parameters of the query string.
+            target (str): The X-Amz-Target header (json protocol).
+            action (str): The Action parameter (query and ec2 protocols).
+
+        Returns:
+            tuple: The service model and the operation model, or (None, None) if the operation is unknown.
+        """
+        service_models = self.service_models.get(signing_name, [])
+
+        name = target.split('.')[-1] if target else action
+        if name:
+            # Services sharing a signing name (ex: rds, docdb and neptune) have the same operations: the inventory one first
+            candidates = [service_model for service_model in service_models if name in service_model.operation_names]
+            candidates.sort(key=lambda service_model: (service_model.service_name, name) not in self.inventory_operations)
+            if candidates:
+                return candidates[0], candidates[0].operation_model(name)
+            return None, None
+
+        if signing_name not in self.routes:
+            routes = []
+            for service_model in service_models:
+                if service_model.protocol in ('rest-json', 'rest-xml'):
+                    for operation_name in service_model.operation_names:
+                        operation_model = service_model.operation_model(operation_name)
+                        routes.append((*compile_route(operation_model), service_model, operation_model))
+            # The most specific routes first
+            routes.sort(key=lambda route: (len(route[2]), route[3]), reverse=True)
+            self.routes[signing_name] = routes
+
+        for route_method, pattern, required, _, service_model, operation_model in self.routes[signing_name]:
+            if route_method == method and required.issubset(query) and pattern.fullmatch(path):
+                return service_model, operation_model
+        return None, None
+
+# ------------------------------------------------------------------------------
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    """Handler of one AWS API request."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.handle_api_call()
+
+    do_GET = do_PUT = do_DELETE = do_HEAD = do_POST
+
+    def handle_api_call(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        server = self.server
+
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query, keep_blank_values=True).items()}
+        form = {}
+        if not self.headers.get('X-Amz-Target') and body and b'Action=' in body:
+            form = {key: values[0] for key, values in parse_qs(body.decode('utf-8', 'replace')).items()}
+
+        scope = CREDENTIAL_SCOPE.search(self.headers.get('Authorization', ''))
+        signing_name = scope.group(3) if scope else ''
+        access_key = scope.group(1) if scope else ''
+        self.account = access_key[len(ASSUMED_KEY_PREFIX):] if access_key.startswith(ASSUMED_KEY_PREFIX) else STUB_ACCOUNT_ID
+        service_model, operation_model = server.find_operation(signing_name, self.command, unquote(url.path), query,
+                                                               self.headers.get('X-Amz-Target'), form.get('Action'))
+        operation = operation_model.name if operation_model is not None else form.get('Action', '')
+        protocol = service_model.protocol if service_model is not None else 'json'
+
+        with server.lock:
+            server.request_count += 1
+            server.operation_counts[f"{signing_name}:{operation}"] += 1
+            server.account_counts[self.account] += 1
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        headers = {}
+        if operation not in ('DescribeRegions', 'GetCallerIdentity', 'AssumeRole') and server.throttle():
+            status, content_type, payload = self.build_throttling_error(protocol, signing_name, headers)
+        else:
+            if protocol == 'json':
+                params = json.loads(body or b'{}')
+            elif protocol in ('query', 'ec2'):
+                params = form
+            else:
+                params = self.rest_params(operation_model, query, body)
+            status = 200
+            content_type, payload = self.build_response(protocol, service_model, operation_model, operation, params)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('x-amzn-RequestId', 'stub')
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    @staticmethod
+    def rest_params(operation_model, query, body):
+        """
+        Get the parameters of a REST call sent in the query string or (rest-json) in the JSON body, by member name.
+
+        Args:
+            operation_model (OperationModel): The operation called.
+            query (dict): The parameters of the query string.
+            body (bytes): The body of the request.
+
+        Returns:
+            dict: The value of each parameter found.
+        """
+        if operation_model is None or operation_model.input_shape is None:
+            return {}
+        try:
+            document = json.loads(body) if body else {}
+        except ValueError:
+            document = {}
+        params = {}
+        for member_name, member_shape in operation_model.input_shape.members.items():
+            location = member_shape.serialization.get('location')
+            name = member_shape.serialization.get('name', member_name)
+            if location == 'querystring' and name in query:
+                params[member_name] = query[name]
+            elif not location and isinstance(document, dict) and name in document:
+                params[member_name] = document[name]
+        return params
+
+    def build_throttling_error(self, protocol, signing_name, headers):
+        """
+        Build the throttling error of a protocol.
+
+        Args:
+            protocol (str): The protocol of the service.
+            signing_name (str): The signing name of the service.
+            headers (dict): The headers of the response, completed with the error headers.
+
+        Returns:
+            tuple: The HTTP status, the content type and the body of the response.
+        """
+        if protocol in ('json', 'rest-json'):
+            headers['x-amzn-ErrorType'] = 'ThrottlingException'
+            return 400, 'application/x-amz-json-1.1', b'{"__type": "ThrottlingException", "message": "Rate exceeded"}'
+        if protocol == 'ec2':
+            return 503, 'text/xml', (b"<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded."
+                                     b"</Message></Error></Errors><RequestID>stub</RequestID></Response>")
+        if signing_name == 's3':
+            return 503, 'application/xml', b"<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>"
+        return 400, 'text/xml', (b"<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code><Message>Rate exceeded"
+                                 b"</Message></Error><RequestId>stub</RequestId></ErrorResponse>")
+
+    def build_response(self, protocol, service_model, operation_model, operation, params):
+        """
+        Build the response of a call in the protocol of the service.
+
+        Args:
+            protocol (str): The protocol of the service.
+            service_model (ServiceModel): The service called, or None if unknown.
+            operation_model (OperationModel): The operation called, or None if unknown.
+            operation (str): The name of the operation.
+            params (dict): The parameters of the call, by member name.
+
+        Returns:
+            tuple: The content type and the body of the response.
+        """
+        if operation == 'DescribeRegions':
+            items = ''.join(f"<item><regionName>{region}</regionName><endpoint>ec2.{region}.amazonaws.com</endpoint>"
+                            f"<optInStatus>opt-in-not-required</optInStatus></item>" for region in self.server.regions)
+            return 'text/xml', f"<DescribeRegionsResponse><regionInfo>{items}</regionInfo></DescribeRegionsResponse>".encode()
+        if operation == 'GetCallerIdentity':
+            return 'text/xml', (f"<GetCallerIdentityResponse><GetCallerIdentityResult><Account>{self.account}</Account>"
+                                f"<Arn>arn:aws:iam::{self.account}:user/stub</Arn><UserId>STUB</UserId>"
+                                f"</GetCallerIdentityResult></GetCallerIdentityResponse>").encode()
+        if operation == 'AssumeRole':
+            role_arn = params.get('RoleArn', '')
+            account = role_arn.split(':')[4] if role_arn.count(':') >= 5 else STUB_ACCOUNT_ID
+            expiration = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + int(params.get('DurationSeconds') or 3600)))
+            return 'text/xml', (f"<AssumeRoleResponse><AssumeRoleResult><Credentials><AccessKeyId>{ASSUMED_KEY_PREFIX}{account}</AccessKeyId>"
+                                f"<SecretAccessKey>stub</SecretAccessKey><SessionToken>stub</SessionToken><Expiration>{expiration}</Expiration>"
+                                f"</Credentials><AssumedRoleUser><Arn>{escape(role_arn)}</Arn><AssumedRoleId>STUB:stub</AssumedRoleId></AssumedRoleUser>"
+                                f"</AssumeRoleResult></AssumeRoleResponse>").encode()
+
+        shape = operation_model.output_shape if operation_model is not None else None
+        payload = shape.serialization.get('payload') if shape is not None else None
+        if payload:
+            shape = shape.members[payload] if shape.members[payload].type_name == 'structure' else None
+        data = self.generate_output(service_model, operation_model, shape, params) if shape is not None and self.server.items else {}
+
+        if protocol == 'query':
+            wrapper = shape.serialization.get('resultWrapper', f"{operation}Result") if shape is not None else f"{operation}Result"
+            members = serialize_members(shape, data) if data else ''
+            return 'text/xml', f"<{operation}Response><{wrapper}>{members}</{wrapper}></{operation}Response>".encode()
+        if protocol == 'ec2':
+            members = serialize_members(shape, data) if data else ''
+            return 'text/xml', f"<{operation}Response>{members}</{operation}Response>".encode()
+        if protocol == 'rest-xml':
+            if not data:
+                return 'application/xml', b''
+            tag = shape.serialization.get('name', f"{operation}Result")
+            return 'application/xml', f"<{tag}>{serialize_members(shape, data)}</{tag}>".encode()
+        body = json.dumps(serialize_json(shape, data)).encode() if data else b'{}'
+        return ('application/json' if protocol == 'rest-json' else 'application/x-amz-json-1.1'), body
+
+    def generate_output(self, service_model, operation_model, shape, params):
+        """
+        Generate the output of a call: a page of items for the inventory functions, one object for the others.
+
+        Args:
+            service_model (ServiceModel): The service called.
+            operation_model (OperationModel): The operation called.
+            shape (StructureShape): The shape of the body of the response.
+            params (dict): The parameters of the call, by member name.
+
+        Returns:
+            dict: The value of each member of the body.
+        """
+        key = (service_model.service_name, operation_model.name)
+        if key not in self.server.inventory_operations:
+            # One object, without pagination tokens: the detail functions aren't paginated
+            return {name: value for name, value in generate_structure(shape, 0).items() if not PAGINATION_MEMBER.search(name)}
+
+        pagination = self.server.inventory_operations[key] or {}
+        result_key = pagination.get('result_key')
+        if isinstance(result_key, list):
+            result_key = result_key[0]
+        if result_key not in shape.members or shape.members[result_key].type_name != 'list':
+            result_key = next((name for name, member in shape.members.items()
+                               if member.type_name == 'list' and not member.serialization.get('location')), None)
+        if result_key is None:
+            return generate_structure(shape, 0)
+
+        input_token = pagination.get('input_token')
+        output_token = pagination.get('output_token')
+        offset, size = 0, self.server.items
+        if isinstance(input_token, str) and isinstance(output_token, str) and output_token in shape.members:
+            token = str(params.get(input_token) or '')
+            offset = int(token[len(TOKEN_PREFIX):]) if token.startswith(TOKEN_PREFIX) else 0
+            limit_key = pagination.get('limit_key')
+            size = int(params.get(limit_key) or 0) or self.server.page_size
+        end = min(offset + size, self.server.items)
+
+        member_shape = shape.members[result_key].member
+        items = [generate_value(member_shape, result_key, index) for index in range(offset, end)]
+        data = {result_key: [item for item in items if item is not None]}
+        if end < self.server.items and output_token in shape.members:
+            data[output_token] = f"{TOKEN_PREFIX}{end}"
+        more_results = pagination.get('more_results')
+        if isinstance(more_results, str) and more_results in shape.members:
+            data[more_results] = end < self.server.items
+
+        with self.server.lock:
+            self.server.items_served += len(data[result_key])
+        return data
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Local stand-in for the AWS endpoints')
+    parser.add_argument('--port', type=int, default=8765, help='The port to listen on')
+    parser.add_argument('--resource-dir', type=str, default='resources', help='The directory containing the resource files')
+    parser.add_argument('--regions', type=int, default=4, help='The number of simulated regions')
+    parser.add_argument('--latency', type=float, default=0.0, help='The latency of each response, in seconds')
+    parser.add_argument('--items', type=int, default=0, help='The number of items returned by each inventory function in each region')
+    parser.add_argument('--page-size', type=int, default=100, help='The number of items per page, when the call asks for no page size')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='The share of the calls answered with a throttling error (0 to 1)')
+    args = parser.parse_args()
+
+    server = StubServer(('127.0.0.1', args.port), args.resource_dir, args.regions, args.latency, args.items, args.page_size, args.throttle_rate)
+    print(f"AWS stub listening on {server.endpoint_url}")
+    server.serve_forever()
@@ -0,0 +1,149 @@
+"""
+Benchmark of the JSON encoders of the outputs (encoders.py) on a synthetic inventory.
+
+The inventory has the structure of the real results (category, resource, object type, region, items) and items
+looking like AWS responses: nested structures, tags, and datetimes (serialized by json_serial with the json module,
+natively by orjson and msgspec). The distinct items are few and repeated, so a large document (1 GB by default)
+needs little memory to build; the encoders still encode every occurrence.
+
+Each available encoder writes the document indented and compact, without compression and with each available
+compression. The benchmark prints the time, the size of the file and the throughput (MB of uncompressed JSON
+per second).
+
+Usage:
+    python tools/bench_encoders.py --size-mb 1024
+    python tools/bench_encoders.py --size-mb 200 --encoder orjson --encoder json --compression none --compression gzip --save encoders.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from utils import json_serial
+from encoders import JsonEncoder, write_json, available_encoders, available_compressions
+
+CATEGORIES = ('Compute', 'Storage', 'Databases', 'Networking', 'IAM and Security')
+REGIONS = ('us-east-1', 'us-west-2', 'eu-west-1', 'eu-central-1', 'ap-southeast-1')
+
+# ------------------------------------------------------------------------------
+
+def generate_item(index, rng):
+    """
+    Generate an item looking like an AWS response (ex: an EC2 instance).
+
+    Args:
+        index (int): The index of the item.
+        rng (random.Random): The random generator.
+
+    Returns:
+        dict: The item.
+    """
+    launch_time = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=rng.randrange(10 ** 8))
+    return {
+        'Arn': f"arn:aws:ec2:eu-west-1:123456789012:instance/i-{index:017x}",
+        'InstanceId': f"i-{index:017x}",
+        'InstanceType': rng.choice(['t3.micro', 'm5.large', 'c6g.xlarge', 'r6i.2xlarge']),
+        'LaunchTime': launch_time,
+        'State': {'Code': 16, 'Name': 'running'},
+        'Monitoring': {'State': 'disabled'},
+        'Placement': {'AvailabilityZone': 'eu-west-1a', 'Tenancy': 'default'},
+        'PrivateIpAddress': f"10.{index % 256}.{index // 256 % 256}.{rng.randrange(256)}",
+        'SecurityGroups': [{'GroupId': f"sg-{rng.randrange(16 ** 8):08x}", 'GroupName': f"group-{n}"} for n in range(rng.randrange(1, 4))],
+        'BlockDeviceMappings': [{'DeviceName': f"/dev/xvd{chr(97 + n)}",
+                                 'Ebs': {'AttachTime': launch_time, 'DeleteOnTermination': True, 'Status': 'attached', 'VolumeId': f"vol-{rng.randrange(16 ** 8):08x}"}}
+                                for n in range(rng.randrange(1, 3))],
+        'Tags': [{'Key': key, 'Value': f"{key.lower()}-{rng.randrange(1000)}"} for key in ('Name', 'Environment', 'Owner', 'CostCenter')],
+        'EbsOptimized': bool(index % 2),
+        'CpuOptions': {'CoreCount': 2, 'ThreadsPerCore': 2},
+    }
+
+def generate_inventory(size_mb, distinct_items=2000, seed=0):
+    """
+    Generate a synthetic inventory of about size_mb MB of compact JSON.
+
+    Args:
+        size_mb (float): The approximate size of the compact JSON document, in MB.
+        distinct_items (int): The number of distinct items (repeated to reach the size).
+        seed (int): The seed of the random generator.
+
+    Returns:
+        tuple: The inventory, and its number of items.
+    """
+    rng = random.Random(seed)
+    pool = [generate_item(index, rng) for index in range(distinct_items)]
+    item_size = sum(len(json.dumps(item, separators=(',', ':'), default=json_serial)) for item in pool) / distinct_items
+    total_items = int(size_mb * 1024 * 1024 / item_size)
+
+    # The items are spread over category / resource / object type / region, like the inventory results
+    inventory = {}
+    slots = [(category, f"resource{resource}", f"Objects{resource}", region)
+             for category in CATEGORIES for resource in range(8) for region in REGIONS]
+    per_slot = max(1, total_items // len(slots))
+    for number, (category, resource, object_type, region) in enumerate(slots):
+        start = number * per_slot
+        inventory.setdefault(category, {}).setdefault(resource, {}).setdefault(object_type, {})[region] = \
+            [pool[index % distinct_items] for index in range(start, start + per_slot)]
+    return inventory, per_slot * len(slots)
+
+def run_encoder(inventory, encoder, compression, work_dir):
+    """
+    Write the inventory with an encoder and measure it.
+
+    Args:
+        inventory (dict): The inventory.
+        encoder (JsonEncoder): The encoder.
+        compression (str): The compression, or None.
+        work_dir (str): The directory of the written file (deleted after the measure).
+
+    Returns:
+        dict: The time, the size of the file.
+    """
+    start_time = time.perf_counter()
+    path = write_json(os.path.join(work_dir, 'inventory.json'), inventory, encoder, compression)
+    wall_time = time.perf_counter() - start_time
+    size = os.path.getsize(path)
+    os.remove(path)
+    return {'wall_time': round(wall_time, 3), 'size_mb': round(size / (1024 * 1024), 1)}
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark of the JSON encoders on a synthetic inventory')
+    parser.add_argument('--size-mb', type=float, default=1024, help='The approximate size of the inventory, in MB of compact JSON')
+    parser.add_argument('--encoder', action='append', choices=available_encoders(), help='The encoder(s) to benchmark (default: all the available ones)')
+    parser.add_argument('--compression', action='append', choices=['none', *available_compressions()], help='The compression(s) to benchmark (default: all the available ones)')
+    parser.add_argument('--save', type=str, metavar='FILE', help='Save the results in a JSON file')
+    args = parser.parse_args()
+
+    encoders = args.encoder or available_encoders()
+    compressions = args.compression or ['none', *available_compressions()]
+
+    start_time = time.perf_counter()
+    inventory, total_items = generate_inventory(args.size_mb)
+    print(f"Synthetic inventory: {total_items} items, about {args.size_mb:.0f} MB of compact JSON (generated in {time.perf_counter() - start_time:.1f} seconds)")
+    print(f"{'encoder':<9} {'layout':<8} {'compression':<12} {'time (s)':>9} {'size (MB)':>10} {'MB/s':>8}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in encoders:
+            for compact in (False, True):
+                encoder = JsonEncoder(name, compact)
+                for compression in compressions:
+                    measures = run_encoder(inventory, encoder, None if compression == 'none' else compression, work_dir)
+                    measures.update(encoder=name, layout='compact' if compact else 'indented', compression=compression,
+                                    throughput=round(args.size_mb / measures['wall_time'], 1))
+                    results.append(measures)
+                    print(f"{name:<9} {measures['layout']:<8} {compression:<12} {measures['wall_time']:>9.2f} {measures['size_mb']:>10.1f} {measures['throughput']:>8.1f}")
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({'size_mb': args.size_mb, 'items': total_items, 'results': results}, file, indent=4)
+        print(f"Results saved in {args.save}")
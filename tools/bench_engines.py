@@ -0,0 +1,87 @@
+"""
+Compare the collection engines (thread pool vs asyncio) against the local AWS stand-in (tools/aws_stub.py).
+
+Each engine runs the real inventory script on the real resource files, in a temporary working directory.
+The benchmark prints the wall time and the number of API calls of each run, and checks that the engines
+produce byte-identical inventory files.
+
+Usage:
+    python tools/bench_engines.py --regions 8 --latency 0.05 --runs 3
+"""
+
+import os
+import sys
+import glob
+import time
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from aws_stub import StubServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT_DIR, 'new_inventory_api.py')
+
+# ------------------------------------------------------------------------------
+
+def run_inventory(server, engine, extra_args):
+    """
+    Run one inventory against the stub server.
+
+    Args:
+        server (StubServer): The running stub server.
+        engine (str): The engine to use ('threads' or 'asyncio').
+        extra_args (list): Other command-line arguments for the inventory script.
+
+    Returns:
+        tuple: The wall time (seconds), the number of API calls, and the SHA-256 of the inventory file.
+    """
+    env = dict(os.environ,
+               AWS_ENDPOINT_URL=server.endpoint_url,
+               AWS_ACCESS_KEY_ID='testing',
+               AWS_SECRET_ACCESS_KEY='testing',
+               AWS_DEFAULT_REGION='us-east-1',
+               AWS_EC2_METADATA_DISABLED='true')
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        calls_before = server.request_count
+        start_time = time.time()
+        subprocess.run([sys.executable, SCRIPT, '--resource-dir', os.path.join(ROOT_DIR, 'resources'), '--engine', engine, *extra_args],
+                       cwd=work_dir, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wall_time = time.time() - start_time
+        output_file = max(glob.glob(os.path.join(work_dir, 'output', 'inventory_*.json')), key=os.path.getmtime)
+        with open(output_file, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+
+    return wall_time, server.request_count - calls_before, digest
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark of the collection engines')
+    parser.add_argument('--regions', type=int, default=4, help='The number of simulated regions')
+    parser.add_argument('--latency', type=float, default=0.05, help='The latency of each response, in seconds')
+    parser.add_argument('--runs', type=int, default=1, help='The number of runs per engine')
+    parser.add_argument('--max-in-flight', type=int, default=512, help='The maximum number of API calls in flight with the asyncio engine')
+    args = parser.parse_args()
+
+    server = StubServer(('127.0.0.1', 0), os.path.join(ROOT_DIR, 'resources'), args.regions, args.latency).start()
+    digests = set()
+
+    print(f"{'engine':<10} {'run':>4} {'wall time (s)':>14} {'API calls':>10} {'calls/s':>10}")
+    for engine in ('threads', 'asyncio'):
+        for run in range(args.runs):
+            wall_time, calls, digest = run_inventory(server, engine, ['--max-in-flight', str(args.max_in_flight)])
+            digests.add(digest)
+            print(f"{engine:<10} {run + 1:>4} {wall_time:>14.2f} {calls:>10} {calls / wall_time:>10.1f}")
+
+    server.shutdown()
+
+    if len(digests) == 1:
+        print("Outputs are byte-identical.")
+    else:
+        print("Outputs differ between runs!")
+        sys.exit(1)
@@ -0,0 +1,182 @@
+"""
+Benchmark of the whole inventory against the local AWS stand-in (tools/aws_stub.py), to catch performance
+regressions before deploying.
+
+Each run starts the real inventory script (list_used_resources) on the real resource files, in a temporary working
+directory, against a stub simulating N regions, M items per inventory function (split in pages), a latency and a
+throttling rate. The benchmark prints, for each run:
+
+- the wall time and the number of tasks per second,
+- the peak RSS of the inventory process,
+- the number of API calls received by the stub (and how many were throttled), and the items served.
+
+The results can be saved (--save) and compared with a previous run (--baseline): the benchmark exits with status 1
+if the median wall time, peak RSS or number of API calls grew by more than the tolerance.
+
+Usage:
+    python tools/bench_inventory.py --regions 4 --items 20 --page-size 10 --latency 0.02 --throttle-rate 0.01 --runs 3 --save bench.json
+    python tools/bench_inventory.py --regions 4 --items 20 --page-size 10 --latency 0.02 --throttle-rate 0.01 --runs 3 --baseline bench.json
+    python tools/bench_inventory.py --engine asyncio -- --max-in-flight 256
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import statistics
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from aws_stub import StubServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT_DIR, 'new_inventory_api.py')
+
+# Measures compared with the baseline: a higher value is a regression
+COMPARED_MEASURES = ('wall_time', 'peak_rss_mb', 'api_calls')
+
+# ------------------------------------------------------------------------------
+
+def run_inventory(server, engine, script_args):
+    """
+    Run one inventory against the stub server and measure it.
+
+    Args:
+        server (StubServer): The running stub server.
+        engine (str): The engine to use ('threads' or 'asyncio').
+        script_args (list): Other command-line arguments for the inventory script.
+
+    Returns:
+        dict: The measures of the run.
+    """
+    env = dict(os.environ,
+               AWS_ENDPOINT_URL=server.endpoint_url,
+               AWS_ACCESS_KEY_ID='testing',
+               AWS_SECRET_ACCESS_KEY='testing',
+               AWS_DEFAULT_REGION='us-east-1',
+               AWS_EC2_METADATA_DISABLED='true')
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        stats_before = server.stats()
+        start_time = time.perf_counter()
+        process = subprocess.Popen([sys.executable, SCRIPT, '--resource-dir', os.path.join(ROOT_DIR, 'resources'), '--engine', engine, *script_args],
+                                   cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # wait4 gives the resource usage of this process only (RUSAGE_CHILDREN would be the maximum over all the runs)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        wall_time = time.perf_counter() - start_time
+        stats_after = server.stats()
+
+        if process.returncode != 0:
+            raise RuntimeError(f"The inventory failed with the exit code {process.returncode}")
+
+        metrics_file = max(glob.glob(os.path.join(work_dir, 'log', 'metrics_*.json')), key=os.path.getmtime)
+        with open(metrics_file, 'r') as file:
+            counters = json.load(file)['counters']
+
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    peak_rss = usage.ru_maxrss / 1024 if sys.platform != 'darwin' else usage.ru_maxrss / (1024 * 1024)
+
+    return {
+        'engine': engine,
+        'wall_time': round(wall_time, 3),
+        'tasks': counters['total_tasks'],
+        'tasks_per_second': round(counters['completed_tasks'] / wall_time, 1),
+        'failed_tasks': counters['failed_resources'],
+        'peak_rss_mb': round(peak_rss, 1),
+        'api_calls': stats_after['requests'] - stats_before['requests'],
+        'throttled_calls': stats_after['throttled'] - stats_before['throttled'],
+        'items': stats_after['items'] - stats_before['items'],
+    }
+
+def summarize(runs):
+    """
+    Get the median of each measure over several runs.
+
+    Args:
+        runs (list): The measures of each run.
+
+    Returns:
+        dict: The median of each numeric measure.
+    """
+    return {key: statistics.median(run[key] for run in runs) for key, value in runs[0].items() if isinstance(value, (int, float))}
+
+def compare(summary, baseline, tolerance):
+    """
+    Compare the medians of a benchmark with a baseline.
+
+    Args:
+        summary (dict): The medians of the benchmark.
+        baseline (dict): The medians of the baseline.
+        tolerance (float): The growth allowed before a measure is a regression (ex: 0.2 for 20%).
+
+    Returns:
+        list: The regressions found, as messages.
+    """
+    regressions = []
+    for key in COMPARED_MEASURES:
+        if baseline.get(key) and summary[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {summary[key]} (baseline {baseline[key]}, +{summary[key] / baseline[key] - 1:.0%})")
+    return regressions
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark of the inventory against a local AWS stand-in')
+    parser.add_argument('--regions', type=int, default=4, help='The number of simulated regions')
+    parser.add_argument('--items', type=int, default=10, help='The number of items returned by each inventory function in each region')
+    parser.add_argument('--page-size', type=int, default=100, help='The number of items per page, when the call asks for no page size')
+    parser.add_argument('--latency', type=float, default=0.02, help='The latency of each response, in seconds')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='The share of the calls answered with a throttling error (0 to 1)')
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], action='append', help='The engine(s) to benchmark (default: threads)')
+    parser.add_argument('--runs', type=int, default=1, help='The number of runs per engine')
+    parser.add_argument('--save', type=str, metavar='FILE', help='Save the results in a JSON file, to be used as a baseline')
+    parser.add_argument('--baseline', type=str, metavar='FILE', help='Compare the results with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='The growth allowed before a measure is a regression (ex: 0.2 for 20%%)')
+    parser.add_argument('script_args', nargs=argparse.REMAINDER, help='Arguments for the inventory script, after --')
+    args = parser.parse_args()
+
+    engines = args.engine or ['threads']
+    script_args = args.script_args[1:] if args.script_args[:1] == ['--'] else args.script_args
+
+    server = StubServer(('127.0.0.1', 0), os.path.join(ROOT_DIR, 'resources'), args.regions, args.latency,
+                        args.items, args.page_size, args.throttle_rate).start()
+
+    print(f"{args.regions} regions, {args.items} items per inventory function, pages of {args.page_size}, "
+          f"{args.latency * 1000:.0f} ms latency, {args.throttle_rate:.1%} throttled")
+    print(f"{'engine':<10} {'run':>4} {'wall (s)':>9} {'tasks':>6} {'tasks/s':>8} {'failed':>7} {'peak RSS (MB)':>14} {'API calls':>10} {'throttled':>10} {'items':>8}")
+
+    results = {'parameters': {key: value for key, value in vars(args).items() if key not in ('save', 'baseline', 'tolerance')}, 'engines': {}}
+    for engine in engines:
+        runs = []
+        for run in range(args.runs):
+            measures = run_inventory(server, engine, script_args)
+            runs.append(measures)
+            print(f"{engine:<10} {run + 1:>4} {measures['wall_time']:>9.2f} {measures['tasks']:>6} {measures['tasks_per_second']:>8.1f} {measures['failed_tasks']:>7} "
+                  f"{measures['peak_rss_mb']:>14.1f} {measures['api_calls']:>10} {measures['throttled_calls']:>10} {measures['items']:>8}")
+        results['engines'][engine] = {'runs': runs, 'median': summarize(runs)}
+
+    server.shutdown()
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=4)
+        print(f"Results saved in {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        regressions = []
+        for engine, engine_results in results['engines'].items():
+            if engine in baseline['engines']:
+                regressions += [f"{engine} {message}" for message in compare(engine_results['median'], baseline['engines'][engine]['median'], args.tolerance)]
+        if regressions:
+            print("Regressions against the baseline:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"No regression against the baseline (tolerance {args.tolerance:.0%}).")
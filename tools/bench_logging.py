@@ -0,0 +1,102 @@
+"""
+Microbenchmark of utils.write_log: the previous backend (open, append and close the file for each message)
+against the queued one (one writer thread per log file, batched writes and flushes).
+
+Several threads log at the same time, like the inventory workers do. The benchmark prints the time spent by the
+callers, the total time until the messages are on disk, the number of file opens, and (on Linux) the number of
+write syscalls read from /proc/self/io.
+
+Usage:
+    python tools/bench_logging.py --threads 32 --messages 2000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils
+
+# ------------------------------------------------------------------------------
+
+def write_log_per_message(message, log_file_path):
+    """
+    The previous write_log: open, append and close the log file for each message.
+
+    Args:
+        message (str): The message to log.
+        log_file_path (str): The path to the log file.
+    """
+    with open(log_file_path, "a") as log_file:
+        log_file.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}\n")
+
+def write_syscalls():
+    """
+    Get the number of write syscalls of the process so far.
+
+    Returns:
+        int: The number of write syscalls, or None if /proc/self/io is not available.
+    """
+    try:
+        with open('/proc/self/io', 'r') as file:
+            for line in file:
+                if line.startswith('syscw:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+def run(write_function, log_file_path, threads, messages):
+    """
+    Log messages from several threads.
+
+    Args:
+        write_function (callable): The write_log function to benchmark.
+        log_file_path (str): The path to the log file.
+        threads (int): The number of threads.
+        messages (int): The number of messages per thread.
+
+    Returns:
+        tuple: The time spent by the callers, the time until the messages are on disk (seconds) and the number of write syscalls.
+    """
+    def worker(worker_id):
+        for index in range(messages):
+            write_function(f"API call for ec2 in eu-west-{worker_id} for describe_instances took 0.{index:04d} seconds", log_file_path)
+
+    syscalls_before = write_syscalls()
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(threads)))
+    caller_time = time.perf_counter() - start_time
+    utils.flush_logs()
+    total_time = time.perf_counter() - start_time
+    syscalls_after = write_syscalls()
+
+    with open(log_file_path, 'r') as file:
+        assert sum(1 for _ in file) == threads * messages
+
+    syscalls = syscalls_after - syscalls_before if syscalls_before is not None else None
+    return caller_time, total_time, syscalls
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark of the logging backends')
+    parser.add_argument('--threads', type=int, default=32, help='The number of logging threads')
+    parser.add_argument('--messages', type=int, default=2000, help='The number of messages per thread')
+    args = parser.parse_args()
+
+    total_messages = args.threads * args.messages
+    print(f"{args.threads} threads x {args.messages} messages = {total_messages} messages")
+    print(f"{'backend':<18} {'callers (s)':>12} {'on disk (s)':>12} {'opens':>8} {'write syscalls':>15}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, write_function, opens in (('open per message', write_log_per_message, total_messages), ('queued (utils)', utils.write_log, 1)):
+            log_file_path = os.path.join(work_dir, f"{name.split()[0]}.log")
+            caller_time, total_time, syscalls = run(write_function, log_file_path, args.threads, args.messages)
+            print(f"{name:<18} {caller_time:>12.3f} {total_time:>12.3f} {opens:>8} {syscalls if syscalls is not None else 'n/a':>15}")
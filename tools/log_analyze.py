@@ -1,62 +1,428 @@
+"""
+Run report of the inventory: latency, slowest operations, throttling, critical path and suggested concurrency.
+
+The report is built from the call records of the runs (log/calls_*.jsonl, one JSON record per API call), or, for
+the runs without them, from the "API call for ... took N seconds" lines of the text logs. The files are memory-mapped
+and streamed line by line into compact columns (array module), so multi-GB inputs don't need to fit in memory as
+Python objects. The statistics use NumPy when it is installed, and plain Python otherwise (same results).
+
+Usage:
+    python tools/log_analyze.py                       # newest run in log/
+    python tools/log_analyze.py --all                 # every run in log/
+    python tools/log_analyze.py log/calls_20250101_120000.jsonl log/log_20250101_110000.log --top 20
+"""
+
 import os
+import re
+import sys
 import glob
+import json
+import math
+import mmap
+import argparse
+from array import array
+from datetime import datetime
+
+# NumPy and orjson are optional: they only make the report faster
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+# Line of the text logs with the duration of an API call (the timestamp is the end of the call)
+API_CALL_LINE = re.compile(rb'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - API call for (\S+) in (\S+) for (\S+) took ([\d.]+) seconds')
+
+# Lines of the text logs with an error: (resource, function, message)
+ERROR_LINE = re.compile(rb'(?:Error|Warning) \(\w+\):? (?:querying|Skipping) (\S+) in \S+ (?:using (\S+)|due to [^:]*)?: (.*)$')
 
 # ------------------------------------------------------------------------------
 
-# Get the most recent log file in the log directory
-log_dir = 'log'
-list_of_files = glob.glob(os.path.join(log_dir, 'log_*.log'))
-log_file_path = max(list_of_files, key=os.path.getctime)
+class CallColumns:
+
+    """
+    Columns of the API calls of one run. The service, region, operation and error strings are stored as codes.
+    """
+
+    def __init__(self, name):
+        """
+        Initialize empty columns.
+
+        Args:
+            name (str): The name of the run (file name).
+        """
+        self.name = name
+        self.labels = {}
+        self.label_list = []
+        self.service = array('i')
+        self.region = array('i')
+        self.operation = array('i')
+        self.error = array('i')
+        self.start = array('d')
+        self.duration = array('d')
+        self.retries = array('i')
+        self.throttled = array('b')
+        self.bytes = array('q')
+        self.items = array('q')
+
+    def code(self, label):
+        """
+        Get the code of a string, adding it if needed.
+
+        Args:
+            label (str): The string.
+
+        Returns:
+            int: The code of the string.
+        """
+        code = self.labels.get(label)
+        if code is None:
+            code = self.labels[label] = len(self.label_list)
+            self.label_list.append(label)
+        return code
+
+    def append(self, service, region, operation, start, duration, retries=0, throttled=False, size=-1, items=-1, error=None):
+        """Append one call (size and items are -1 when unknown)."""
+        self.service.append(self.code(service))
+        self.region.append(self.code(region))
+        self.operation.append(self.code(operation))
+        self.error.append(self.code(error) if error else -1)
+        self.start.append(start)
+        self.duration.append(duration)
+        self.retries.append(retries)
+        self.throttled.append(1 if throttled else 0)
+        self.bytes.append(size if size is not None else -1)
+        self.items.append(items if items is not None else -1)
+
+    def __len__(self):
+        return len(self.duration)
 
 # ------------------------------------------------------------------------------
 
-def analyze_log_file(log_file_path):
+def iter_lines(path):
+    """
+    Stream the lines of a file through a memory map.
+
+    Args:
+        path (str): The path of the file.
+
+    Yields:
+        bytes: Each line, without its line break.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for line in iter(data.readline, b''):
+                yield line.rstrip(b'\r\n')
+
+def load_call_records(path):
+    """
+    Load the call records of a run (calls_*.jsonl).
+
+    Args:
+        path (str): The path of the JSON lines file.
+
+    Returns:
+        CallColumns: The calls of the run.
+    """
+    columns = CallColumns(os.path.basename(path))
+    for line in iter_lines(path):
+        try:
+            record = json_loads(line)
+        except ValueError:
+            continue  # line cut by an interrupted run
+        columns.append(record.get('service') or '?', record.get('region') or 'global', record.get('operation') or '?',
+                       record.get('start') or 0.0, record.get('duration') or 0.0, record.get('retries') or 0,
+                       record.get('throttled'), record.get('bytes'), record.get('items'), record.get('error'))
+    return columns
+
+def load_text_log(path, errors=None):
+    """
+    Load the calls of a run from its text log (runs without call records). Only the durations are known.
+
+    Args:
+        path (str): The path of the log file.
+        errors (set): If given, the (resource, function, message) of the error lines are added to it.
+
+    Returns:
+        CallColumns: The calls of the run.
+    """
+    columns = CallColumns(os.path.basename(path))
+    for line in iter_lines(path):
+        if b' took ' in line:
+            match = API_CALL_LINE.match(line)
+            if match:
+                end_time = datetime.strptime(match.group(1).decode(), '%Y-%m-%d %H:%M:%S').timestamp()
+                duration = float(match.group(5))
+                columns.append(match.group(2).decode(), match.group(3).decode(), match.group(4).decode(), end_time - duration, duration)
+        elif errors is not None and (b'Error' in line or b'Warning' in line):
+            match = ERROR_LINE.search(line)
+            if match:
+                errors.add((match.group(1).decode(), (match.group(2) or b'').decode(), match.group(3).decode().strip()))
+    return columns
+
+# ------------------------------------------------------------------------------
+
+def percentiles(values, quantiles):
+    """
+    Compute percentiles with linear interpolation (the NumPy default), with or without NumPy.
+
+    Args:
+        values (sequence): The values.
+        quantiles (tuple): The percentiles to compute (ex: (50, 95, 99)).
+
+    Returns:
+        list: One value per percentile.
+    """
+    if np is not None:
+        return [float(value) for value in np.percentile(np.asarray(values, dtype=float), quantiles)]
+    ordered = sorted(values)
+    result = []
+    for quantile in quantiles:
+        position = (len(ordered) - 1) * quantile / 100
+        lower = math.floor(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        result.append(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower))
+    return result
+
+def group_indices(keys):
+    """
+    Group the rows by key.
+
+    Args:
+        keys (list): The key of each row (tuples of codes).
+
+    Returns:
+        dict: The list of row indices of each key.
+    """
+    groups = {}
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+    return groups
+
+def latency_table(columns, key_columns, top):
     """
-    Analyze the log file to identify services that encountered errors.
+    Latency statistics of the calls grouped by some columns.
 
     Args:
-        log_file_path (str): The path to the log file.
+        columns (CallColumns): The calls.
+        key_columns (tuple): The names of the columns to group by (ex: ('service', 'region')).
+        top (int): The number of groups to keep, by descending p99.
 
     Returns:
-        set: A set of unique resources, services, and error messages that encountered errors.
+        list: (labels, count, p50, p95, p99, max, total) for each group.
     """
-    
-    error_services = set()  # Set to store unique error services
+    duration = columns.duration
+    keys = list(zip(*(getattr(columns, name) for name in key_columns)))
+    table = []
 
-    with open(log_file_path, 'r') as log_file:
-        for line in log_file:
-            # Check if the line contains an error or exception
-            if "Error" in line or "Warning" in line:
-                # Extract the resource name, service name, and error message from the error line
-                resource_name = ""
-                service_name = ""
-                error_message = ""
+    if np is not None and len(duration):
+        durations = np.frombuffer(duration, dtype=np.float64)
+        codes = np.stack([np.frombuffer(getattr(columns, name), dtype=np.int32) for name in key_columns], axis=1)
+        unique_keys, inverse = np.unique(codes, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind='stable')
+        boundaries = np.flatnonzero(np.diff(inverse[order])) + 1
+        for group_key, rows in zip(unique_keys, np.split(order, boundaries)):
+            values = durations[rows]
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            table.append((tuple(columns.label_list[code] for code in group_key), len(values), float(p50), float(p95), float(p99), float(values.max()), float(values.sum())))
+    else:
+        for group_key, rows in group_indices(keys).items():
+            values = [duration[row] for row in rows]
+            p50, p95, p99 = percentiles(values, (50, 95, 99))
+            table.append((tuple(columns.label_list[code] for code in group_key), len(values), p50, p95, p99, max(values), sum(values)))
 
-                if "querying" in line:
-                    resource_name = line.split("querying")[1].split()[0].strip()
-                if "using" in line:
-                    service_name = line.split("using")[1].split()[0].strip().rstrip(':')
-                if (f"{service_name}:" in line):
-                    error_message = line.split(f"{service_name}:")[1].strip()
-                    
-                    # Add the resource, service, and error message to the set
-                    error_services.add((resource_name, service_name, error_message))
+    table.sort(key=lambda row: (-row[4], row[0]))
+    return table[:top]
 
-    return error_services
+def throttle_hotspots(columns, top):
+    """
+    Services and regions with the most throttled calls.
+
+    Args:
+        columns (CallColumns): The calls.
+        top (int): The number of hotspots to keep.
+
+    Returns:
+        list: (service, region, throttled calls, calls, retries) for each hotspot.
+    """
+    counts = {}
+    for service, region, throttled, retries in zip(columns.service, columns.region, columns.throttled, columns.retries):
+        stats = counts.setdefault((service, region), [0, 0, 0])
+        stats[0] += throttled
+        stats[1] += 1
+        stats[2] += retries
+    hotspots = [(columns.label_list[service], columns.label_list[region], *stats) for (service, region), stats in counts.items() if stats[0]]
+    hotspots.sort(key=lambda row: (-row[2], row[0], row[1]))
+    return hotspots[:top]
+
+def critical_path(columns, top):
+    """
+    Critical path of a run: the chains of sequential calls (the pages of one operation in one region) which took
+    the longest, from their first call to the end of their last one. The run can't be shorter than its longest chain.
+
+    Args:
+        columns (CallColumns): The calls.
+        top (int): The number of chains to keep.
+
+    Returns:
+        tuple: The span of the run (seconds), the total time spent in calls, the peak number of calls in flight,
+               and (service, region, operation, start offset, span, calls) for the longest chains.
+    """
+    if not len(columns):
+        return 0.0, 0.0, 0, []
+
+    run_start = min(columns.start)
+    run_end = max(start + duration for start, duration in zip(columns.start, columns.duration))
+
+    chains = {}
+    for service, region, operation, start, duration in zip(columns.service, columns.region, columns.operation, columns.start, columns.duration):
+        chain = chains.get((service, region, operation))
+        if chain is None:
+            chains[(service, region, operation)] = [start, start + duration, 1]
+        else:
+            chain[0] = min(chain[0], start)
+            chain[1] = max(chain[1], start + duration)
+            chain[2] += 1
+
+    longest = sorted(((columns.label_list[service], columns.label_list[region], columns.label_list[operation], first - run_start, last - first, calls)
+                      for (service, region, operation), (first, last, calls) in chains.items()), key=lambda row: (-row[4], row[:3]))
+
+    # Peak number of calls in flight: sweep over the starts and ends of the calls (ends first at the same time)
+    if np is not None:
+        starts = np.frombuffer(columns.start, dtype=np.float64)
+        times = np.concatenate((starts, starts + np.frombuffer(columns.duration, dtype=np.float64)))
+        deltas = np.concatenate((np.ones(len(starts), dtype=np.int64), -np.ones(len(starts), dtype=np.int64)))
+        peak = int(np.cumsum(deltas[np.lexsort((deltas, times))]).max())
+    else:
+        events = sorted([(start, 1) for start in columns.start] + [(start + duration, -1) for start, duration in zip(columns.start, columns.duration)])
+        in_flight = peak = 0
+        for _, delta in events:
+            in_flight += delta
+            peak = max(peak, in_flight)
+
+    return run_end - run_start, sum(columns.duration), peak, longest[:top]
+
+def suggest_concurrency(work, span, longest_chain, throttled, calls):
+    """
+    Suggest a number of workers: enough to run all the calls within the longest chain (more would not shorten the run),
+    reduced when the run was throttled.
+
+    Args:
+        work (float): The total time spent in calls.
+        span (float): The span of the run.
+        longest_chain (float): The span of the longest chain of calls.
+        throttled (int): The number of throttled calls.
+        calls (int): The number of calls.
+
+    Returns:
+        tuple: The average concurrency of the run and the suggested concurrency.
+    """
+    average = work / span if span > 0 else 0.0
+    suggested = math.ceil(work / longest_chain) if longest_chain > 0 else max(1, math.ceil(average))
+    if calls and throttled / calls > 0.02:
+        suggested = max(1, math.floor(min(suggested, average) * 0.75))
+    return average, max(1, suggested)
 
 # ------------------------------------------------------------------------------
 
-# Analyze the log file
-error_services = sorted(analyze_log_file(log_file_path))
+def print_report(columns, top):
+    """
+    Print the report of a run.
+
+    Args:
+        columns (CallColumns): The calls of the run.
+        top (int): The number of rows of each table.
+    """
+    print(f"=== {columns.name}: {len(columns)} calls")
+    if not len(columns):
+        return
+
+    print(f"\n--- Latency per service and region (top {top} by p99, seconds)")
+    print(f"{'service':<24} {'region':<16} {'calls':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'total':>9}")
+    for (service, region), count, p50, p95, p99, maximum, total in latency_table(columns, ('service', 'region'), top):
+        print(f"{service:<24} {region:<16} {count:>7} {p50:>8.3f} {p95:>8.3f} {p99:>8.3f} {maximum:>8.3f} {total:>9.2f}")
+
+    print(f"\n--- Slowest operations (top {top} by p99, seconds)")
+    print(f"{'service':<24} {'operation':<40} {'calls':>7} {'p50':>8} {'p99':>8} {'max':>8}")
+    for (service, operation), count, p50, p95, p99, maximum, total in latency_table(columns, ('service', 'operation'), top):
+        print(f"{service:<24} {operation:<40} {count:>7} {p50:>8.3f} {p99:>8.3f} {maximum:>8.3f}")
+
+    hotspots = throttle_hotspots(columns, top)
+    throttled = sum(columns.throttled)
+    print(f"\n--- Throttle hotspots ({throttled} throttled calls, {sum(columns.retries)} retries)")
+    for service, region, throttles, calls, retries in hotspots:
+        print(f"{service:<24} {region:<16} {throttles:>6} throttled / {calls:<6} calls ({retries} retries)")
+
+    errors = {}
+    for service, operation, error in zip(columns.service, columns.operation, columns.error):
+        if error >= 0:
+            key = (columns.label_list[service], columns.label_list[operation], columns.label_list[error])
+            errors[key] = errors.get(key, 0) + 1
+    if errors:
+        print(f"\n--- Errors ({sum(errors.values())} calls)")
+        for (service, operation, error), count in sorted(errors.items(), key=lambda item: (-item[1], item[0]))[:top]:
+            print(f"{service:<24} {operation:<40} {error:<32} {count:>6}")
+
+    span, work, peak, longest = critical_path(columns, top)
+    print(f"\n--- Critical path (run span {span:.2f} s, {work:.2f} s spent in calls, peak {peak} calls in flight)")
+    print(f"{'service':<24} {'region':<16} {'operation':<40} {'start':>8} {'span':>8} {'calls':>6}")
+    for service, region, operation, start, chain_span, calls in longest:
+        print(f"{service:<24} {region:<16} {operation:<40} {start:>8.2f} {chain_span:>8.2f} {calls:>6}")
+
+    average, suggested = suggest_concurrency(work, span, longest[0][4] if longest else 0.0, throttled, len(columns))
+    print(f"\n--- Concurrency: {average:.1f} calls in flight on average, suggested --workers {suggested}")
+    print()
 
 # ------------------------------------------------------------------------------
 
-# Print the unique resources, services, and error messages that encountered errors
-if error_services:
-    print("Resources, services, and error messages that encountered errors:")
-    for resource, service, error_message in error_services:
-        print(f"{resource}:{service} - {error_message}")
-else:
-    print("No errors found in the log file.")
+def find_runs(log_dir, all_runs):
+    """
+    Find the files of the runs: the call records, or the text log of the runs without call records.
+
+    Args:
+        log_dir (str): The log directory.
+        all_runs (bool): All the runs, or only the newest one.
+
+    Returns:
+        list: The paths of the files, oldest first.
+    """
+    runs = {}
+    for path in glob.glob(os.path.join(log_dir, 'log_*.log')):
+        runs[os.path.basename(path)[4:-4]] = path
+    for path in glob.glob(os.path.join(log_dir, 'calls_*.jsonl')):
+        runs[os.path.basename(path)[6:-6]] = path
+    paths = [runs[run_id] for run_id in sorted(runs)]
+    return paths if all_runs else paths[-1:]
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Run report of the inventory')
+    parser.add_argument('files', nargs='*', help='Call records (calls_*.jsonl) or text logs (log_*.log). Defaults to the newest run')
+    parser.add_argument('--log-dir', type=str, default='log', help='The directory of the logs')
+    parser.add_argument('--all', action='store_true', help='Report every run of the log directory')
+    parser.add_argument('--top', type=int, default=10, help='The number of rows of each table')
+    args = parser.parse_args()
+
+    paths = args.files or find_runs(args.log_dir, args.all)
+    if not paths:
+        print(f"No call records or logs found in {args.log_dir}.")
+        sys.exit(1)
+
+    error_services = set()
+    for path in paths:
+        if path.endswith('.jsonl'):
+            print_report(load_call_records(path), args.top)
+        else:
+            print_report(load_text_log(path, error_services), args.top)
 
-# ------------------------------------------------------------------------------
\ No newline at end of file
+    if error_services:
+        print("Resources, services, and error messages that encountered errors:")
+        for resource, service, error_message in sorted(error_services):
+            print(f"{resource}:{service} - {error_message}")
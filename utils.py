@@ -2,20 +2,74 @@
 
 import re
 import os
+import sys
 import json
+import time
+import queue
+import atexit
+import threading
 import boto3
 from datetime import datetime
 
+# One background writer per log file, shared by all the threads
+_log_writers = {}
+_log_writers_lock = threading.Lock()
+
 def write_log(message, log_file_path):
     """
     Write a log message to the log file.
 
+    The message is only queued: a single writer thread per log file appends the messages in batches and flushes
+    them every half second, so the callers never wait for the disk and the lines never interleave. The pending
+    messages are flushed at exit (or with flush_logs).
+
     Args:
         message (str): The message to log.
         log_file_path (str): The path to the log file.
     """
-    with open(log_file_path, "a") as log_file:
-        log_file.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}\n")
+    line = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}"
+    log_writer = _log_writers.get(log_file_path) or _open_log_writer(log_file_path)
+    try:
+        log_writer.write(line)
+    except RuntimeError:
+        # The writer was closed meanwhile (ex: flush_logs): the message goes to a new one
+        _open_log_writer(log_file_path, log_writer).write(line)
+
+def _open_log_writer(log_file_path, closed_writer=None):
+    with _log_writers_lock:
+        log_writer = _log_writers.get(log_file_path)
+        if log_writer is None or log_writer is closed_writer:
+            log_writer = _log_writers[log_file_path] = AsyncLineWriter(log_file_path, encoder=str, flush_interval=0.5)
+        return log_writer
+
+def _close_log_writer(log_writer):
+    log_writer.close()
+    if log_writer.error:
+        print(f"Error writing the log {log_writer.path}: {log_writer.error} ({log_writer.records_skipped} messages not written)", file=sys.stderr)
+
+def close_log(log_file_path):
+    """
+    Write the pending log messages of a log file and close it (ex: the log of an account, once it is inventoried).
+    write_log can still be used afterwards: the file is opened again.
+
+    Args:
+        log_file_path (str): The path to the log file.
+    """
+    with _log_writers_lock:
+        log_writer = _log_writers.pop(log_file_path, None)
+    if log_writer is not None:
+        _close_log_writer(log_writer)
+
+@atexit.register
+def flush_logs():
+    """
+    Write all the pending log messages and close the log files. Called at exit; write_log can still be used afterwards.
+    """
+    with _log_writers_lock:
+        log_writers = list(_log_writers.values())
+        _log_writers.clear()
+    for log_writer in log_writers:
+        _close_log_writer(log_writer)
 
 def transform_function_name(func_name):
     """
@@ -51,6 +105,22 @@ def json_serial(obj):
         return obj.isoformat()
     raise TypeError("Type not serializable")
 
+def sort_results(results, depth=4):
+    """
+    Sort the keys of the first levels of the inventory results (category, resource, object type, region),
+    so the output does not depend on the order in which the tasks completed. The items are left untouched.
+
+    Args:
+        results (dict): The inventory results.
+        depth (int): The number of levels to sort.
+
+    Returns:
+        dict: The sorted results.
+    """
+    if depth == 0 or not isinstance(results, dict):
+        return results
+    return {key: sort_results(results[key], depth - 1) for key in sorted(results)}
+
 def is_empty(value):
     """
     Check if a value is empty. This includes None, empty strings, empty lists, and empty dictionaries.
@@ -92,14 +162,17 @@ def create_log_file(log_dir):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     return os.path.join(log_dir, f"log_{timestamp}.log")
 
-def get_all_regions():
+def get_all_regions(session=None):
     """
     Retrieve all AWS regions.
 
+    Args:
+        session (boto3.Session): The session of the account, None for the default session.
+
     Returns:
         list: A list of all AWS regions.
     """
-    ec2 = boto3.client('ec2')
+    ec2 = (session or boto3).client('ec2')
     response = ec2.describe_regions()
     return response['Regions']
 
@@ -120,4 +193,131 @@ def test_region_connectivity(region, log_file_path):
         return True
     except Exception as e:
         write_log(f"Could not connect to the endpoint URL for region {region}: {e}", log_file_path)
-        return False
\ No newline at end of file
+        return False
+
+class AsyncLineWriter:
+    """
+    Append-only writer of lines (JSON lines by default), running in a background thread.
+
+    The callers only put their objects in a queue: the serialization and the writes happen in the writer thread,
+    in batches (one write for all the lines waiting in the queue). The file is flushed after each batch, or at
+    most every 'flush_interval' seconds. Objects must not be modified once they are written.
+
+    An object that can't be encoded is skipped (the other ones are written). An error of the file stops the writes,
+    and the next objects are dropped. The first error is kept in 'error', and the objects not written are counted
+    in 'records_skipped', like the errors of the other output sinks.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path, default=json_serial, mode="a", encoder=None, flush_interval=0):
+        """
+        Open the file and start the writer thread.
+
+        Args:
+            path (str): The path of the file.
+            default (callable): The JSON serializer of the objects not serializable by default.
+            mode (str): The mode to open the file with: "a" to append, "w" to truncate it.
+            encoder (callable): The function converting an object to a line (without the newline). Defaults to JSON.
+            flush_interval (float): The maximum number of seconds between two flushes, or 0 to flush after each batch.
+        """
+        self.path = path
+        self.default = default
+        self.encoder = encoder or self._encode_json
+        self.flush_interval = flush_interval
+        self.lines_written = 0
+        self.batches_written = 0
+        self.records_skipped = 0
+        self.error = None
+        self._file_failed = False
+        self._closed = False
+        self._write_lock = threading.Lock() # no object is queued after the stop of the writer
+        self._queue = queue.Queue()
+        self._file = open(path, mode, encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name='line-writer', daemon=True)
+        self._thread.start()
+
+    def _encode_json(self, obj):
+        return json.dumps(obj, default=self.default)
+
+    def write(self, obj):
+        """
+        Queue an object, to be written as one line.
+
+        Args:
+            obj (any): The object to write.
+
+        Raises:
+            RuntimeError: If the writer is closed (or its thread stopped).
+        """
+        with self._write_lock:
+            if self._closed or not self._thread.is_alive():
+                raise RuntimeError(f"The writer of {self.path} is closed" + (f" ({self.error})" if self.error else ""))
+            self._queue.put(obj)
+
+    def _skip(self, error, count):
+        self.records_skipped += count
+        if self.error is None:
+            self.error = error
+
+    def _run(self):
+        stopped = False
+        unflushed = False
+        last_flush = time.monotonic()
+        while not stopped:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval or None)]
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for obj in batch:
+                if obj is self._STOP:
+                    stopped = True
+                    continue
+                try:
+                    lines.append(self.encoder(obj) + "\n")
+                except Exception as e:
+                    self._skip(e, 1)
+            if lines and self._file_failed:
+                self.records_skipped += len(lines)
+            elif lines:
+                try:
+                    self._file.write("".join(lines))
+                    self.lines_written += len(lines)
+                    self.batches_written += 1
+                    unflushed = True
+                except (OSError, ValueError) as e:
+                    self._file_failed = True
+                    self._skip(e, len(lines))
+            if unflushed and (stopped or not self.flush_interval or time.monotonic() - last_flush >= self.flush_interval):
+                try:
+                    self._file.flush()
+                except (OSError, ValueError) as e:
+                    self._file_failed = True
+                    self.error = self.error or e
+                unflushed = False
+                last_flush = time.monotonic()
+
+    @property
+    def records_written(self):
+        """int: The number of objects written (one per line), as for the other output sinks."""
+        return self.lines_written
+
+    def close(self):
+        """Write the queued objects, then close the file."""
+        with self._write_lock:
+            stopping = not self._closed and self._thread.is_alive()
+            self._closed = True
+            if stopping:
+                self._queue.put(self._STOP)
+        self._thread.join()
+        if not self._file.closed:
+            try:
+                self._file.close()
+            except OSError as e:
+                self.error = self.error or e